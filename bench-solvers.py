@@ -0,0 +1,123 @@
+"""
+Benchmark các bước dựng lời giải trên instance ngẫu nhiên (Euclid, float32).
+
+    python bench-solvers.py                 # 1k / 5k / 10k khách
+    python bench-solvers.py --sizes 500 2000 --capacity 50
+
+Mỗi benchmark so sánh bản cài đặt hiện tại với bản tham chiếu thuần Python
+và kiểm tra hai bên cho ra cùng lời giải. Bản tham chiếu chỉ chạy tới
+REFERENCE_MAX_SIZE khách (bỏ giới hạn bằng --full-reference).
+"""
+import argparse
+import time
+
+import numpy as np
+
+from vrp_viz.cheapest_insertion.cheapest_insertion import cheapest_insertion
+from vrp_viz.nearest_neighbor.nearnest_neighbor import nearest_neighbor
+from vrp_viz.nearest_neighbor.viz_nearnest_neighbor import nearest_neighbor_v2
+
+
+def make_instance(n_customers: int, seed: int = 0, max_demand: int = 5):
+    """(D, demands) với kho ở chỉ số 0, toạ độ ngẫu nhiên trong ô 100 x 100."""
+    rng = np.random.default_rng(seed)
+    xy = rng.random((n_customers + 1, 2)).astype(np.float32) * 100
+    D = np.empty((len(xy), len(xy)), dtype=np.float32)
+    for i in range(0, len(xy), 1024):
+        D[i : i + 1024] = np.hypot(*(xy[i : i + 1024, None, :] - xy[None, :, :]).transpose(2, 0, 1))
+    demands = rng.integers(1, max_demand + 1, len(xy)).tolist()
+    demands[0] = 0
+    return D, demands
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t0
+
+
+def cheapest_insertion_scan(dist_matrix, demands, capacity):
+    """Cheapest insertion quét lại mọi khách x mọi vị trí mỗi vòng (bản gốc, O(n^3))."""
+    num_customers = len(demands) - 1
+    unvisited = list(range(1, num_customers + 1))
+    routes = []
+    route_loads = []
+    while unvisited:
+        best_insertion = {"cost": float("inf")}
+        for u in unvisited:
+            for r_idx, route in enumerate(routes):
+                if route_loads[r_idx] + demands[u] > capacity:
+                    continue
+                for pos in range(len(route) + 1):
+                    i = 0 if pos == 0 else route[pos - 1]
+                    j = 0 if pos == len(route) else route[pos]
+                    cost = dist_matrix[i][u] + dist_matrix[u][j] - dist_matrix[i][j]
+                    if cost < best_insertion["cost"]:
+                        best_insertion = {"cost": cost, "customer": u, "route_idx": r_idx, "pos": pos}
+            cost_construct_route = dist_matrix[0][u] + dist_matrix[u][0]
+            if cost_construct_route < best_insertion["cost"]:
+                best_insertion = {"cost": cost_construct_route, "customer": u, "route_idx": None, "pos": 0}
+
+        u = best_insertion["customer"]
+        if best_insertion["route_idx"] is None:
+            routes.append([u])
+            route_loads.append(demands[u])
+        else:
+            routes[best_insertion["route_idx"]].insert(best_insertion["pos"], u)
+            route_loads[best_insertion["route_idx"]] += demands[u]
+        unvisited.remove(u)
+    return routes
+
+
+def bench_nearest_neighbor(D, demands, capacity, reference=True):
+    ref, t_ref = timed(nearest_neighbor, D, demands, capacity) if reference else (None, None)
+    res, t_new = timed(
+        nearest_neighbor_v2,
+        D,
+        demands=demands,
+        vehicle_capacity=capacity,
+        num_vehicles=len(demands),
+        stepwise=False,
+    )
+    routes = [r[1:-1] for r in res[-1].routes]
+    assert ref is None or routes == ref, "nearest_neighbor_v2 khác lời giải tham chiếu"
+    return t_ref, t_new
+
+
+def bench_cheapest_insertion(D, demands, capacity, reference=True):
+    ref, t_ref = timed(cheapest_insertion_scan, D, demands, capacity) if reference else (None, None)
+    res, t_new = timed(cheapest_insertion, D, demands, capacity)
+    assert ref is None or res == ref, "cheapest_insertion khác lời giải tham chiếu"
+    return t_ref, t_new
+
+
+BENCHMARKS = {
+    "nearest_neighbor": bench_nearest_neighbor,
+    "cheapest_insertion": bench_cheapest_insertion,
+}
+
+# bản tham chiếu O(n^3) quá chậm cho instance lớn
+REFERENCE_MAX_SIZE = {
+    "cheapest_insertion": 2000,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VRP construction benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--capacity", type=float, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", choices=sorted(BENCHMARKS), nargs="+")
+    parser.add_argument("--full-reference", action="store_true", help="chạy bản tham chiếu ở mọi kích thước")
+    args = parser.parse_args()
+
+    print(f"{'benchmark':<20} {'n':>6} {'reference (s)':>14} {'current (s)':>12} {'speedup':>8}")
+    for n in args.sizes:
+        D, demands = make_instance(n, seed=args.seed)
+        for name in args.only or BENCHMARKS:
+            reference = args.full_reference or n <= REFERENCE_MAX_SIZE.get(name, n)
+            t_ref, t_new = BENCHMARKS[name](D, demands, args.capacity, reference)
+            if t_ref is None:
+                print(f"{name:<20} {n:>6} {'-':>14} {t_new:>12.3f} {'-':>8}")
+            else:
+                print(f"{name:<20} {n:>6} {t_ref:>14.3f} {t_new:>12.3f} {t_ref / t_new:>7.1f}x")
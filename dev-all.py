@@ -14,6 +14,9 @@ import geopandas as gpd
 from shapely.geometry import box
 import pyproj
 
+from vrp_viz.map_viz.road_graph import CSRGraph, NodeSnapper, road_distance_matrix, reconstruct_path
+from vrp_viz.map_viz.contraction import ContractionHierarchy
+
 # -----------------------------
 # 1) TẢI GRAPH & CHUẨN BỊ DỮ LIỆU
 # -----------------------------
@@ -48,15 +51,58 @@ def build_road_graph(points_latlon, buffer_m=3000):
     # G = ox.add_edge_lengths(G)
     return G
 
+def load_or_build_csr_graph(
+    points_latlon: List[Tuple[float, float]],
+    cache_file: str = "maps/road_graph_drive.npz",
+    buffer_m: int = 3000,
+) -> CSRGraph:
+    """
+    Đọc road graph CSR đã lưu (.npz) nếu phủ được mọi điểm; ngược lại tải OSM
+    một lần, chuyển sang CSR và lưu lại để các lần chạy sau chạy offline.
+    """
+    if os.path.exists(cache_file):
+        G = CSRGraph.load(cache_file)
+        lats = [lat for lat, lon in points_latlon]
+        lons = [lon for lat, lon in points_latlon]
+        if (
+            G.lat.min() <= min(lats) and max(lats) <= G.lat.max()
+            and G.lng.min() <= min(lons) and max(lons) <= G.lng.max()
+        ):
+            return G
+    G = CSRGraph.from_networkx(build_road_graph(points_latlon, buffer_m=buffer_m))
+    G.save(cache_file)
+    return G
+
+def load_or_build_contraction_hierarchy(
+    G: CSRGraph, cache_file: str = "maps/road_graph_drive_ch.npz"
+) -> ContractionHierarchy:
+    """
+    Đọc Contraction Hierarchy đã tiền xử lý cho graph G; dựng lại nếu chưa có
+    hoặc file cũ được tạo từ graph khác.
+    """
+    if os.path.exists(cache_file):
+        ch = ContractionHierarchy.load(cache_file)
+        if np.array_equal(ch.graph.osm_ids, G.osm_ids) and np.array_equal(ch.graph.indices, G.indices):
+            return ch
+    ch = ContractionHierarchy.build(G, verbose=True)
+    ch.save(cache_file)
+    return ch
+
 def snap_points_to_graph(G: nx.MultiDiGraph, points_latlon: List[Tuple[float, float]]) -> List[int]:
     """
     Ánh xạ (lat, lon) sang id nút gần nhất trên graph.
+    Với CSRGraph trả về chỉ số nút nội bộ.
+    Dựng chỉ mục không gian (STRtree) một lần và snap cả lô trong một truy vấn.
     """
-    nodes = []
-    for lat, lon in points_latlon:
-        node = ox.nearest_nodes(G, X=lon, Y=lat)
-        nodes.append(node)
-    return nodes
+    if isinstance(G, CSRGraph):
+        node_idx, _ = G.snap(points_latlon)
+        return node_idx.tolist()
+    graph_nodes = list(G.nodes)
+    snapper = NodeSnapper(
+        [G.nodes[n]["y"] for n in graph_nodes], [G.nodes[n]["x"] for n in graph_nodes]
+    )
+    node_idx, _ = snapper.snap(points_latlon)
+    return [graph_nodes[i] for i in node_idx]
 
 def road_distance(G: nx.MultiDiGraph, u: int, v: int) -> float:
     """
@@ -68,19 +114,22 @@ def road_distance(G: nx.MultiDiGraph, u: int, v: int) -> float:
         dist = np.inf
     return dist
 
-def build_distance_matrix(G: nx.MultiDiGraph, node_ids: List[int]) -> np.ndarray:
+def build_distance_matrix(
+    G: nx.MultiDiGraph,
+    node_ids: List[int],
+    n_jobs: Optional[int] = None,
+    ch: Optional[ContractionHierarchy] = None,
+) -> Tuple[np.ndarray, Optional[List[Dict[int, int]]]]:
     """
     Tạo ma trận khoảng cách (m) giữa mọi cặp node theo đường đi thực tế.
+    Mỗi hàng là một lần Dijkstra một nguồn (song song theo process),
+    trả kèm cây predecessor để dựng hình học đường đi.
+    ch: Contraction Hierarchy đã tiền xử lý -> dùng truy vấn many-to-many
+    (không có predecessor, hình học sẽ lấy bằng A*).
     """
-    n = len(node_ids)
-    D = np.zeros((n, n), dtype=float)
-    for i in tqdm(range(n), desc="Distance matrix rows"):
-        for j in range(n):
-            if i == j:
-                D[i, j] = 0.0
-            else:
-                D[i, j] = road_distance(G, node_ids[i], node_ids[j])
-    return D
+    if ch is not None:
+        return ch.distance_matrix(node_ids), None
+    return road_distance_matrix(G, node_ids, weight="length", n_jobs=n_jobs, return_predecessors=True)
 
 # -----------------------------
 # 2) VRP NEAREST NEIGHBOR (ĐƠN GIẢN)
@@ -199,11 +248,18 @@ def nearest_neighbor_vrp(
 # 3) TRUY VẾT HÀNH TRÌNH (HÌNH DẠNG ĐƯỜNG) & VẼ MAP
 # -----------------------------
 
-def path_geometry(G: nx.MultiDiGraph, u: int, v: int) -> LineString:
+def path_geometry(G: nx.MultiDiGraph, u: int, v: int, pred: Optional[Dict[int, int]] = None) -> LineString:
     """
     Trả về hình học đường đi ngắn nhất giữa 2 node trên graph (LineString).
+    pred: cây predecessor của nguồn u (từ build_distance_matrix) -> không cần tìm lại đường.
     """
-    path = nx.shortest_path(G, u, v, weight="length")
+    path = reconstruct_path(pred, u, v) if pred is not None else []
+    if isinstance(G, CSRGraph):
+        if not path:
+            _, path = G.astar(u, v)
+        return LineString(G.path_coords(path))
+    if not path:
+        path = nx.shortest_path(G, u, v, weight="length")
     coords = [(G.nodes[n]["y"], G.nodes[n]["x"]) for n in path]  # (lat, lon)
     print(coords)
     return LineString(coords)
@@ -213,7 +269,8 @@ def make_stepwise_map(
     points_latlon: List[Tuple[float, float]],
     node_ids: List[int],
     vrp: VRPResult,
-    out_html: str = "vrp_stepwise_map.html"
+    out_html: str = "vrp_stepwise_map.html",
+    predecessors: Optional[List[Dict[int, int]]] = None,
 ) -> str:
     """
     Tạo bản đồ Folium với:
@@ -235,7 +292,7 @@ def make_stepwise_map(
         # vẽ từng edge trong route
         for a, b in zip(route[:-1], route[1:]):
             u, v = node_ids[a], node_ids[b]
-            geom = path_geometry(G, u, v)
+            geom = path_geometry(G, u, v, predecessors[a] if predecessors else None)
             folium.PolyLine(locations=[(lat, lon) for lat, lon in geom.coords], weight=5, opacity=0.7).add_to(fg)
         fg.add_to(m)
 
@@ -243,7 +300,7 @@ def make_stepwise_map(
     for s_id, s in enumerate(vrp.steps, start=1):
         fg = folium.FeatureGroup(name=f"Step {s_id}: v{ s['vehicle'] } {s['from']}→{s['to']}")
         u, v = node_ids[s["from"]], node_ids[s["to"]]
-        geom = path_geometry(G, u, v)
+        geom = path_geometry(G, u, v, predecessors[s["from"]] if predecessors else None)
         folium.PolyLine(locations=[(lat, lon) for lat, lon in geom.coords], weight=6, opacity=0.9).add_to(fg)
         # đánh dấu đầu/cuối
         folium.CircleMarker(points_latlon[s["from"]], radius=6, tooltip=f"from {s['from']}", color="red").add_to(fg)
@@ -274,13 +331,15 @@ if __name__ == "__main__":
     max_stops_per_route = None   # hoặc đặt số max khách/xe
     num_vehicles = 2
     depot_idx = 0
+    USE_CONTRACTION_HIERARCHY = False  # True khi truy vấn lặp lại nhiều lần trên cùng graph
 
-    print("Downloading road network from OSM...")
-    G = build_road_graph(points)
+    print("Loading road network (offline CSR cache, OSM download if missing)...")
+    G = load_or_build_csr_graph(points)
     node_ids = snap_points_to_graph(G, points)
 
     print("Building distance matrix (road distance, meters)...")
-    D = build_distance_matrix(G, node_ids)
+    ch = load_or_build_contraction_hierarchy(G) if USE_CONTRACTION_HIERARCHY else None
+    D, predecessors = build_distance_matrix(G, node_ids, ch=ch)
     print("Distance matrix (m):")
     np.set_printoptions(precision=1, suppress=True)
     print(D)
@@ -294,5 +353,5 @@ if __name__ == "__main__":
     for k, (route, dist_m) in enumerate(zip(vrp.routes, vrp.route_lengths)):
         print(f"Vehicle {k}: route {route}, length = {dist_m/1000:.2f} km")
 
-    out = make_stepwise_map(G, points, node_ids, vrp, out_html="vrp_stepwise_map.html")
+    out = make_stepwise_map(G, points, node_ids, vrp, out_html="vrp_stepwise_map.html", predecessors=predecessors)
     print(f"Map saved to: {out}  (mở file HTML này để xem từng bước)")
@@ -1,4 +1,3 @@
-import time
 from typing import List
 import json
 import tqdm
@@ -8,10 +7,10 @@ import numpy as np
 from vrp_viz.map_viz.gen_data import (
     generate_random_coordinates,
     generate_customer_with_real_address,
-    get_real_address_from_coordinates,
-    calculate_distance_km
+    calculate_distance_km,
+    ReverseGeocoder,
 )
-from vrp_viz.map_viz.api_osmr import get_matrix, parse_coordinates
+from vrp_viz.map_viz.providers import default_provider
 from vrp_viz.map_viz.stepwise_map import get_route_from_api
 
 if __name__ == "__main__":
@@ -30,7 +29,16 @@ if __name__ == "__main__":
     RADIUS_KM = 5       # bán kính tìm kiếm (km)
     MIN_PACKAGES = 1    # min gói/khách
     MAX_PACKAGES = 5    # max gói/khách
+    GEOCODE_OFFLINE = False   # True -> bỏ qua Nominatim, dùng địa chỉ giả lập
+    GEOCODE_RATE = 1.0        # request/giây tới Nominatim
+    GEOCODE_WORKERS = 4       # số request đồng thời
     folder_res = f"data{N_CUSTOMERS}"
+    geocoder = ReverseGeocoder(
+        cache_file="data/geocode-cache/nominatim.json",
+        rate_limit=GEOCODE_RATE,
+        max_workers=GEOCODE_WORKERS,
+        offline=GEOCODE_OFFLINE,
+    )
     
     
     print('Kho hàng:')
@@ -48,23 +56,28 @@ if __name__ == "__main__":
     warehouse_lng = warehouse_info['lng']
 
     print(f"Tạo {N_CUSTOMERS} khách trong bán kính {RADIUS_KM} km...")
-    for i in range(N_CUSTOMERS):
-        # Sinh toạ độ và thông tin khách
-        lat, lng = generate_random_coordinates(warehouse_lat, warehouse_lng, RADIUS_KM)
-        info = generate_customer_with_real_address(lat, lng, MIN_PACKAGES, MAX_PACKAGES)
+    coords = [
+        generate_random_coordinates(warehouse_lat, warehouse_lng, RADIUS_KM)
+        for _ in range(N_CUSTOMERS)
+    ]
+    # Reverse geocode cả lô (cache + giới hạn tốc độ thay cho sleep từng khách)
+    addresses = geocoder.reverse_many(coords)
+    for i, ((lat, lng), address_info) in enumerate(zip(coords, addresses)):
+        info = generate_customer_with_real_address(
+            lat, lng, MIN_PACKAGES, MAX_PACKAGES, address_info=address_info
+        )
         info['customer_id'] = f"KH_{i+1:03d}"
         # Khoảng cách Haversine tạm thời
         info['distance_from_warehouse_km'] = round(calculate_distance_km(warehouse_lat, warehouse_lng, lat, lng), 2)
         customers.append(info)
         print(f"{i+1:03d}/{N_CUSTOMERS}: {info['address'][:60]}")
-        time.sleep(0.5)  # tránh spam API
 
     customers_df = pd.DataFrame(customers)
     print(f"\n✓ Đã tạo {len(customers_df)} khách hàng.")
     customers_df[['customer_id','name','address','city','packages','distance_from_warehouse_km']].head(10)
 
     print("Lấy địa chỉ thực tế cho kho...")
-    warehouse_address_info = get_real_address_from_coordinates(warehouse_info['lat'], warehouse_info['lng'])
+    warehouse_address_info = geocoder.reverse(warehouse_info['lat'], warehouse_info['lng'])
 
     warehouse_df = pd.DataFrame({
         'customer_id': ['WAREHOUSE'],
@@ -96,40 +109,21 @@ if __name__ == "__main__":
     print("Xa nhất (km):", f"{max_distance:.2f}")
     print("TB khoảng cách (km):", f"{avg_distance:.2f}")
     
-    print("Gọi OSRM /table để lấy ma trận khoảng cách...")
-
-    try:
-        coordinates = parse_coordinates(all_locations_df)
-        response = get_matrix(coordinates)
-        if 'distances' in response:
-            distance_matrix = np.array(response['distances'])
-            distance_matrix_km = distance_matrix / 1000.0
-            distances_df = pd.DataFrame(
-                distance_matrix_km,
-                index=all_locations_df['customer_id'],
-                columns=all_locations_df['customer_id'],
-            )
-            print("✓ Đã nhận ma trận khoảng cách:", distance_matrix.shape)
-            print(distance_matrix_km[:5, :5].round(2))
-        else:
-            print("Phản hồi thiếu 'distances':", list(response.keys()))
-            raise RuntimeError("OSRM trả về dữ liệu không hợp lệ")
-    except Exception as e:
-        print("OSRM lỗi -> tạo ma trận Haversine giả lập.", e)
-        n = len(all_locations_df)
-        distance_matrix_km = np.zeros((n, n))
-        for i in range(n):
-            lat_i, lng_i = all_locations_df.iloc[i]['lat'], all_locations_df.iloc[i]['lng']
-            for j in range(i + 1, n):
-                lat_j, lng_j = all_locations_df.iloc[j]['lat'], all_locations_df.iloc[j]['lng']
-                d = calculate_distance_km(lat_i, lng_i, lat_j, lng_j)
-                distance_matrix_km[i, j] = distance_matrix_km[j, i] = d
-        distances_df = pd.DataFrame(
-            distance_matrix_km,
-            index=all_locations_df['customer_id'],
-            columns=all_locations_df['customer_id'],
-        )
-        print("✓ Đã tạo ma trận Haversine giả lập.")
+    print("Gọi routing provider (OSRM /table, lỗi -> Haversine, có cache) để lấy ma trận khoảng cách...")
+
+    routing = default_provider()
+    points = list(zip(all_locations_df['lat'].astype(float), all_locations_df['lng'].astype(float)))
+    distance_matrix = routing.table(points)["distance"]
+    if np.isnan(distance_matrix).any():
+        raise RuntimeError("Routing provider trả về cặp điểm không có đường đi")
+    distance_matrix_km = distance_matrix / 1000.0
+    distances_df = pd.DataFrame(
+        distance_matrix_km,
+        index=all_locations_df['customer_id'],
+        columns=all_locations_df['customer_id'],
+    )
+    print("✓ Đã nhận ma trận khoảng cách:", distance_matrix.shape)
+    print(distance_matrix_km[:5, :5].round(2))
     
     print("=== KẾT QUẢ TẠO DỮ LIỆU VRP ===")
     print("1) Kho hàng:")
@@ -196,9 +190,8 @@ if __name__ == "__main__":
                 key_name = f"{u}:{v}"
                 key_loc = f"{row['lng']},{row['lat']};{row2['lng']},{row2['lat']}"
                 print(f"Lấy route {u}->{v} | {key_loc}")
-                route_info, route_full = get_route_from_api(key_loc, "dev")
+                route_info, route_full = get_route_from_api(key_loc, "dev", provider=routing)
                 dict_loc_api[key_name] = [route_info, route_full]
-                time.sleep(0.15)  # tránh spam API
 
     # save dict_loc_api to a file
     route_file = f"data/{folder_res}/vrp_routes_dev.json"
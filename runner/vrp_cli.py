@@ -4,9 +4,10 @@ import vrplib
 
 from vrp_viz.utils import calculate_total_distance, visualize_routes
 from vrp_viz.nearest_neighbor.nearnest_neighbor import nearest_neighbor
-from vrp_viz.cheapest_insertion.cheapest_insertion import cheapest_insertion
+from vrp_viz.cheapest_insertion.cheapest_insertion import cheapest_insertion, regret_insertion
 from vrp_viz.clark_saving.clarke_saving import clarke_wright_smallest_saving_first
 from vrp_viz.clark_saving.clarke_saving import clarke_wright_savings_nlog
+from vrp_viz.clark_saving.clarke_saving import clarke_wright_savings_granular
 
 def run_on_instance(instance_name, visualize=False, stdout=True):
     """Hàm chính để chạy các thuật toán trên một bộ dữ liệu."""
@@ -28,8 +29,10 @@ def run_on_instance(instance_name, visualize=False, stdout=True):
     algorithms = {
         "Nearest Neighbor": nearest_neighbor,
         "Cheapest Insertion": cheapest_insertion,
-        # "Clarke-Wright Savings (n^3)": clarke_wright_smallest_saving_first,
+        "Regret-3 Insertion": regret_insertion,
+        "Clarke-Wright Savings (smallest first)": clarke_wright_smallest_saving_first,
         "Clarke-Wright Savings (nlogn)": clarke_wright_savings_nlog,
+        "Clarke-Wright Savings (granular k=20)": clarke_wright_savings_granular,
     }
 
     for name, func in algorithms.items():
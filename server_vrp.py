@@ -1,4 +1,5 @@
 import os
+from functools import partial
 from typing import List, Literal, Optional, Tuple
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field, field_validator
@@ -13,11 +14,18 @@ from vrp_viz.clark_saving.viz_clarke_saving import (
     clarke_wright_smallest_saving_first as clarke_wright_savings_vrp,
 )
 from vrp_viz.cheapest_insertion.viz_cheapest_insertion import (
-    cheapest_insertion
+    cheapest_insertion,
+    regret_insertion,
 )
+from vrp_viz.local_search.cross_exchange import cross_exchange_local_search
+from vrp_viz.local_search.exchange import exchange_local_search
+from vrp_viz.local_search.or_opt import or_opt_local_search
+from vrp_viz.local_search.relocate import relocate_local_search
 from vrp_viz.local_search.shift import shift_local_search
 from vrp_viz.local_search.swap import swap_local_search
+from vrp_viz.local_search.two_opt import two_opt_local_search
 from vrp_viz.local_search.two_opt_star import two_opt_star_local_search
+from vrp_viz.local_search.vnd import DEFAULT_VND_ORDER, vnd_local_search
 
 app = FastAPI(title="VRP API", version="1.0.0")
 
@@ -36,7 +44,7 @@ app.add_middleware(
 # Pydantic Schemas
 # =====================
 
-Algorithm = Literal["nn", "clarke", "cheapest"]
+Algorithm = Literal["nn", "clarke", "cheapest", "regret"]
 DatasetType = Literal["random", "explicit"]
 
 
@@ -76,7 +84,13 @@ class SolveResponse(BaseModel):
 
 class LocalSearchRequest(BaseModel):
     base_solution: SolveResponse
-    improvement_type: Literal["2-opt", "shift", "swap"]
+    improvement_type: Literal["2-opt", "2-opt-intra", "shift", "swap", "relocate", "exchange", "or-opt", "cross", "vnd"]
+    strategy: Literal["best", "first"] = Field(
+        "best", description="best-improvement hoặc first-improvement với don't-look bits"
+    )
+    vnd_order: List[Literal["2-opt", "2-opt-intra", "shift", "swap", "relocate", "exchange", "or-opt", "cross"]] = Field(
+        list(DEFAULT_VND_ORDER), min_length=1, description="Thứ tự các neighborhood khi improvement_type='vnd'"
+    )
 
 
 # =====================
@@ -110,9 +124,9 @@ def solve(req: SolveRequest):
     else:
         ds: ExplicitDataset = req.dataset
 
-    if req.algorithm not in ["nn", "clarke", "cheapest"]:
+    if req.algorithm not in ["nn", "clarke", "cheapest", "regret"]:
         raise HTTPException(
-            status_code=400, detail="Hiện chỉ hỗ trợ 'nn', 'clarke', 'savings'."
+            status_code=400, detail="Hiện chỉ hỗ trợ 'nn', 'clarke', 'cheapest', 'regret'."
         )
 
     prefix_path = os.path.join("data", f"{ds.name}")
@@ -125,6 +139,9 @@ def solve(req: SolveRequest):
     elif req.algorithm == "cheapest":
         solver_name = "cheapest_insertion"
         function_solver = cheapest_insertion
+    elif req.algorithm == "regret":
+        solver_name = "regret_insertion"
+        function_solver = regret_insertion
 
     dict_vrp, solution_name, demands = get_run_data_from_prefix_path(
         prefix_path, function_solver, solver_name, capacity=req.capacity
@@ -156,24 +173,44 @@ def local_search(req: LocalSearchRequest):
     elif base_req.received.dataset.type == "explicit":
         ds: ExplicitDataset = base_req.received.dataset
 
-    if req.improvement_type not in ["2-opt", "shift", "swap"]:
+    if req.improvement_type not in ["2-opt", "2-opt-intra", "shift", "swap", "relocate", "exchange", "or-opt", "cross", "vnd"]:
         raise HTTPException(
-            status_code=400, detail="Hiện chỉ hỗ trợ '2-opt', 'shift', 'swap'."
+            status_code=400,
+            detail="Hiện chỉ hỗ trợ '2-opt', '2-opt-intra', 'shift', 'swap', 'relocate', 'exchange', 'or-opt', 'cross', 'vnd'.",
         )
 
     prefix_path = os.path.join("data", f"{ds.name}")
     if req.improvement_type == "2-opt":
         solver_name = "2-opt"
         function_solver = two_opt_star_local_search
+    elif req.improvement_type == "2-opt-intra":
+        solver_name = "2-opt-intra"
+        function_solver = two_opt_local_search
     elif req.improvement_type == "shift":
         solver_name = "shift"
         function_solver = shift_local_search
     elif req.improvement_type == "swap":
         solver_name = "swap"
         function_solver = swap_local_search
+    elif req.improvement_type == "relocate":
+        solver_name = "relocate"
+        function_solver = relocate_local_search
+    elif req.improvement_type == "exchange":
+        solver_name = "exchange"
+        function_solver = exchange_local_search
+    elif req.improvement_type == "or-opt":
+        solver_name = "or-opt"
+        function_solver = or_opt_local_search
+    elif req.improvement_type == "cross":
+        solver_name = "cross"
+        function_solver = cross_exchange_local_search
+    elif req.improvement_type == "vnd":
+        solver_name = "vnd"
+        function_solver = partial(vnd_local_search, order=req.vnd_order)
 
     dict_vrp, solution_name, demands = get_run_data_from_local_search(
-        prefix_path, function_solver, solver_name, base_solution=base_req.solution, capacity=base_req.received.capacity
+        prefix_path, function_solver, solver_name, base_solution=base_req.solution, capacity=base_req.received.capacity,
+        strategy=req.strategy,
     )
 
     total_distance = np.round(np.sum(dict_vrp[-1]["route_lengths"]), 2)
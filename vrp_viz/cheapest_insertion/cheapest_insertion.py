@@ -1,55 +1,249 @@
+import numpy as np
+
+
+def insertion_costs(dist_matrix, prev, nxt, customers):
+    """
+    Chi phí chèn mọi khách vào mọi cạnh bằng một phép toán 2-D:
+    cost[a, k] = D[prev[k], u_a] + D[u_a, nxt[k]] - D[prev[k], nxt[k]] với u_a = customers[a].
+    NaN -> inf (không bao giờ được chọn).
+    """
+    D = np.asarray(dist_matrix)
+    with np.errstate(invalid="ignore"):
+        M = (D[prev][:, customers].T + D[:, nxt][customers]) - D[prev, nxt]
+    M[np.isnan(M)] = np.inf
+    return M
+
+
+def best_insertion(dist_matrix, routes, route_loads, unvisited, demands, capacity=None, depot=0, new_route=False):
+    """
+    Lần chèn rẻ nhất trên mọi (khách, tuyến, vị trí) bằng một argmin toàn cục: mọi cạnh của mọi
+    tuyến xếp thành cột, vượt tải -> inf. new_route=True thêm cột "mở tuyến mới" sau cùng.
+    Thứ tự hoà như vòng quét (khách -> tuyến -> vị trí, tuyến mới chỉ khi rẻ hơn hẳn).
+    Trả về (cost, u, route_idx hoặc None nếu mở tuyến mới, pos), hoặc None nếu không chèn được.
+    """
+    D = np.asarray(dist_matrix)
+    U = np.asarray(unvisited, dtype=np.int64)
+    prev, nxt, route_of, pos_of = [], [], [], []
+    for r_idx, route in enumerate(routes):
+        prev += [depot] + route
+        nxt += route + [depot]
+        route_of += [r_idx] * (len(route) + 1)
+        pos_of += range(len(route) + 1)
+
+    M = insertion_costs(D, prev, nxt, U) if prev else np.empty((len(U), 0))
+    if capacity is not None and prev:
+        loads = np.asarray(route_loads, dtype=float)[route_of]
+        demand = np.array([float(demands[u]) for u in unvisited])
+        M[loads[None, :] + demand[:, None] > capacity] = np.inf
+    if new_route:
+        with np.errstate(invalid="ignore"):
+            cost_new = D[depot, U] + D[U, depot]
+        cost_new[np.isnan(cost_new)] = np.inf
+        M = np.hstack([M, cost_new[:, None]])
+    if not M.size:
+        return None
+
+    a, k = divmod(int(M.argmin()), M.shape[1])
+    if not M[a, k] < np.inf:
+        return None
+    u = unvisited[a]
+    if k == len(prev):
+        return M[a, k], u, None, 0
+    return M[a, k], u, route_of[k], pos_of[k]
+
+
+class InsertionCache:
+    """
+    Chi phí chèn tốt nhất cho cheapest insertion, cập nhật tăng dần thay vì quét lại
+    mọi khách x mọi vị trí của mọi tuyến ở mỗi vòng (O(n^3) tổng).
+
+    Với mỗi khách chưa phục vụ u và mỗi tuyến r giữ (chi phí, vị trí) chèn rẻ nhất của u vào r,
+    cùng tuyến tốt nhất của u. Một lần chèn chỉ đổi một tuyến nên chỉ cột của tuyến đó được tính
+    lại (vector hoá trên mọi u, kèm kiểm tra tải / số điểm dừng), và chỉ các hàng có tuyến tốt nhất
+    là tuyến đó phải tìm lại min trên các tuyến.
+
+    Thứ tự chọn giống hệt vòng quét: hoà -> khách đứng trước, tuyến nhỏ hơn, vị trí nhỏ hơn;
+    mở tuyến mới chỉ khi rẻ hơn hẳn. Chi phí NaN / inf không bao giờ được chọn.
+    """
+
+    def __init__(self, dist_matrix, customers, demands, capacity=None, max_stops=None, depot=0):
+        D = np.asarray(dist_matrix)
+        self.D = D
+        self.depot = depot
+        self.capacity = capacity
+        self.max_stops = max_stops
+        self.customers = np.asarray(customers, dtype=np.int64)
+        self.row_of = {u: row for row, u in enumerate(self.customers.tolist())}
+        m = len(self.customers)
+
+        self.demand = np.array([float(demands[u]) for u in self.customers.tolist()])
+        self.unvisited = np.ones(m, dtype=bool)
+        with np.errstate(invalid="ignore"):
+            self.new_cost = D[depot, self.customers] + D[self.customers, depot]
+        self.new_cost[np.isnan(self.new_cost)] = np.inf
+
+        # cột r: chi phí / vị trí chèn rẻ nhất của từng khách vào tuyến r
+        self.n_routes = 0
+        self._cost = np.full((m, 8), np.inf)
+        self._pos = np.zeros((m, 8), dtype=np.int64)
+        self.best_cost = np.full(m, np.inf)
+        self.best_route = np.full(m, -1, dtype=np.int64)
+        self.best_pos = np.zeros(m, dtype=np.int64)
+
+    def best(self):
+        """Lần chèn rẻ nhất: (cost, u, route_idx hoặc None nếu mở tuyến mới, pos), hoặc None."""
+        rows = np.flatnonzero(self.unvisited)
+        if not len(rows):
+            return None
+        route_cost = self.best_cost[rows]
+        new_cost = self.new_cost[rows]
+        use_route = route_cost <= new_cost
+        value = np.where(use_route, route_cost, new_cost)
+        k = int(value.argmin())
+        if not value[k] < np.inf:
+            return None
+        row = rows[k]
+        u = int(self.customers[row])
+        if use_route[k]:
+            return route_cost[k], u, int(self.best_route[row]), int(self.best_pos[row])
+        return new_cost[k], u, None, 0
+
+    def regret(self, k=3):
+        """
+        Lựa chọn regret-k: khách có khoảng cách lớn nhất giữa phương án chèn rẻ nhất và rẻ thứ k
+        (các phương án là từng tuyến hiện có và mở tuyến mới). Chỉ có m < k phương án khả thi ->
+        dùng phương án thứ m (số tuyến tăng dần nên regret vô cùng sẽ làm mọi khách hoà nhau).
+        Hoà -> chi phí chèn nhỏ hơn, rồi khách đứng trước; k=1 trùng với best().
+        Điểm của mọi khách được tính cùng lúc trên ma trận chi phí đã cache.
+        Trả về (cost, u, route_idx hoặc None nếu mở tuyến mới, pos, regret), hoặc None.
+        """
+        rows = np.flatnonzero(self.unvisited)
+        if not len(rows):
+            return None
+        route_cost = self.best_cost[rows]
+        new_cost = self.new_cost[rows]
+        use_route = route_cost <= new_cost
+        value = np.where(use_route, route_cost, new_cost)
+
+        options = np.hstack([self._cost[rows, : self.n_routes], new_cost[:, None]])
+        worst = np.where(np.isfinite(options), options, -np.inf).max(axis=1)
+        if k <= 1:
+            kth = value
+        elif options.shape[1] >= k:
+            kth = np.partition(options, k - 1, axis=1)[:, k - 1]
+            kth = np.where(np.isfinite(kth), kth, worst)
+        else:
+            kth = worst
+        with np.errstate(invalid="ignore"):
+            regret = kth - value
+        regret[~(value < np.inf)] = -np.inf
+
+        # regret lớn nhất, rồi chi phí nhỏ nhất, rồi khách đứng trước
+        best = int(np.lexsort((np.arange(len(rows)), value, -regret))[0])
+        if not value[best] < np.inf:
+            return None
+        row = rows[best]
+        u = int(self.customers[row])
+        if use_route[best]:
+            return route_cost[best], u, int(self.best_route[row]), int(self.best_pos[row]), regret[best]
+        return new_cost[best], u, None, 0, regret[best]
+
+    def inserted(self, u, r_idx, route, load):
+        """Báo u đã được chèn vào tuyến r_idx (route, load là tuyến / tải sau khi chèn)."""
+        self.unvisited[self.row_of[u]] = False
+        if r_idx >= self._cost.shape[1]:
+            grow = self._cost.shape[1]
+            self._cost = np.hstack([self._cost, np.full((len(self.customers), grow), np.inf)])
+            self._pos = np.hstack([self._pos, np.zeros((len(self.customers), grow), dtype=np.int64)])
+        self.n_routes = max(self.n_routes, r_idx + 1)
+
+        rows = np.flatnonzero(self.unvisited)
+        if not len(rows):
+            return
+        cost = np.full(len(rows), np.inf)
+        pos = np.zeros(len(rows), dtype=np.int64)
+        feasible = np.ones(len(rows), dtype=bool)
+        if self.capacity is not None:
+            feasible &= ~(load + self.demand[rows] > self.capacity)
+        if self.max_stops is not None and len(route) + 1 > self.max_stops:
+            feasible[:] = False
+        if feasible.any():
+            U = self.customers[rows[feasible]]
+            # cạnh thứ pos của tuyến là (prev[pos], nxt[pos])
+            M = insertion_costs(self.D, [self.depot] + route, route + [self.depot], U)
+            p = M.argmin(axis=1)
+            cost[feasible] = M[np.arange(len(U)), p]
+            pos[feasible] = p
+        self._cost[rows, r_idx] = cost
+        self._pos[rows, r_idx] = pos
+
+        best_route = self.best_route[rows]
+        best_cost = self.best_cost[rows]
+        stale = best_route == r_idx
+        better = ~stale & ((cost < best_cost) | ((cost == best_cost) & (r_idx < best_route)))
+        self.best_cost[rows[better]] = cost[better]
+        self.best_route[rows[better]] = r_idx
+        self.best_pos[rows[better]] = pos[better]
+
+        stale_rows = rows[stale]
+        if len(stale_rows):
+            sub = self._cost[stale_rows, : self.n_routes]
+            r = sub.argmin(axis=1)
+            self.best_cost[stale_rows] = sub[np.arange(len(stale_rows)), r]
+            self.best_route[stale_rows] = r
+            self.best_pos[stale_rows] = self._pos[stale_rows, r]
+
+
 def cheapest_insertion(dist_matrix, demands, capacity):
     # Khởi tạo: Các tuyến đường ban đầu rỗng
     num_customers = len(demands) - 1
     unvisited = list(range(1, num_customers + 1))
     routes = []
     route_loads = []
+    # Chi phí chèn tốt nhất của từng khách, chỉ tính lại cho tuyến vừa thay đổi
+    cache = InsertionCache(dist_matrix, unvisited, demands, capacity)
 
     # Chừng nào còn khách hàng chưa được phục vụ
     while unvisited:
-        best_insertion = {"cost": float("inf")}
-        # Tại đây, ta chọn "khách hàng" nào vào "vị trí" nào đem lại chi phí thấp nhất
-        for u in unvisited:
-            for r_idx, route in enumerate(routes):
-                if route_loads[r_idx] + demands[u] > capacity:
-                    continue
-                # Chọn vị trí
-                for pos in range(len(route) + 1):
-                    if pos == 0:            # Chèn vào đầu
-                        i, j = 0, route[0]
-                    elif pos == len(route):  # Chèn vào cuối
-                        i, j = route[-1], 0
-                    else:                     # Chèn vào giữa
-                        i, j = route[pos - 1], route[pos]
-                    # Đây là chi phí thay cạnh (i, j) = (i, u) + (u, j)
-                    cost = dist_matrix[i][u] + dist_matrix[u][j] - dist_matrix[i][j]
-                    if cost < best_insertion["cost"]:
-                        best_insertion = {
-                            "cost": cost,
-                            "customer": u,
-                            "route_idx": r_idx,
-                            "pos": pos,
-                        }
-            # Ngoài ra cũng cân nhắc trường hợp lập thêm 1 tuyến đường mới
-            cost_construct_route = dist_matrix[0][u] + dist_matrix[u][0]
-            if cost_construct_route < best_insertion["cost"]:
-                best_insertion = {
-                    "cost": cost_construct_route,
-                    "customer": u,
-                    "route_idx": None,  # Đánh dấu là tạo tuyến mới
-                    "pos": 0
-                }
-
-        if best_insertion["route_idx"] is None:
-            routes.append([best_insertion["customer"]])
-            route_loads.append(demands[best_insertion["customer"]])
-            unvisited.remove(best_insertion["customer"])
+        # Chọn "khách hàng" nào vào "vị trí" nào (hoặc lập tuyến mới) đem lại chi phí thấp nhất
+        cost, u, r_idx, pos = cache.best()
+
+        if r_idx is None:
+            routes.append([u])
+            route_loads.append(demands[u])
+            unvisited.remove(u)
+            r_idx = len(routes) - 1
         else:
             # Thực hiện chèn
-            u = best_insertion["customer"]
-            r_idx = best_insertion["route_idx"]
-            pos = best_insertion["pos"]
             routes[r_idx].insert(pos, u)
             route_loads[r_idx] += demands[u]
             unvisited.remove(u)
+        cache.inserted(u, r_idx, routes[r_idx], route_loads[r_idx])
+    return routes
+
+
+def regret_insertion(dist_matrix, demands, capacity, k=3):
+    """
+    Regret-k insertion: mỗi vòng chèn khách "tiếc" nhất nếu để sau (chênh lệch giữa phương án
+    chèn rẻ nhất và rẻ thứ k), vào vị trí rẻ nhất của nó. Dùng chung InsertionCache với
+    cheapest_insertion nên mỗi vòng chỉ tính lại tuyến vừa thay đổi.
+    """
+    num_customers = len(demands) - 1
+    unvisited = list(range(1, num_customers + 1))
+    routes = []
+    route_loads = []
+    cache = InsertionCache(dist_matrix, unvisited, demands, capacity)
+
+    while unvisited:
+        cost, u, r_idx, pos, _ = cache.regret(k)
+
+        if r_idx is None:
+            routes.append([u])
+            route_loads.append(demands[u])
+            r_idx = len(routes) - 1
+        else:
+            routes[r_idx].insert(pos, u)
+            route_loads[r_idx] += demands[u]
+        unvisited.remove(u)
+        cache.inserted(u, r_idx, routes[r_idx], route_loads[r_idx])
     return routes
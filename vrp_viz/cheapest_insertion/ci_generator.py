@@ -1,4 +1,5 @@
 from ..utils import calculate_total_distance
+from .cheapest_insertion import best_insertion
 
 def cheapest_insertion_generator(dist_matrix, demands, capacity):
     num_customers = len(demands) - 1
@@ -7,56 +8,26 @@ def cheapest_insertion_generator(dist_matrix, demands, capacity):
     route_loads = []
 
     while unvisited:
-        best_insertion = {"cost": float("inf")}
-        # Duyệt tất cả khách hàng chưa phục vụ
-        for u in unvisited:
-            for r_idx, route in enumerate(routes):
-                if route_loads[r_idx] + demands[u] > capacity:
-                    continue
-                for pos in range(len(route) + 1):
-                    if pos == 0:
-                        i, j = 0, route[0]
-                    elif pos == len(route):
-                        i, j = route[-1], 0
-                    else:
-                        i, j = route[pos - 1], route[pos]
-                    cost = dist_matrix[i][u] + dist_matrix[u][j] - dist_matrix[i][j]
-                    if cost < best_insertion["cost"]:
-                        best_insertion = {
-                            "cost": cost,
-                            "customer": u,
-                            "route_idx": r_idx,
-                            "pos": pos,
-                            "edge": (i, j),
-                        }
-
-            # Kiểm tra nếu tạo tuyến mới là tốt nhất
-            cost_new_route = dist_matrix[0][u] + dist_matrix[u][0]
-            if cost_new_route < best_insertion["cost"]:
-                best_insertion = {
-                    "cost": cost_new_route,
-                    "customer": u,
-                    "route_idx": None,
-                    "pos": 0,
-                }
-
-        u = best_insertion["customer"]
+        # Chi phí chèn mọi khách vào mọi vị trí (và mở tuyến mới) tính một lần, lấy argmin toàn cục
+        cost, u, r_idx, pos = best_insertion(
+            dist_matrix, routes, route_loads, unvisited, demands, capacity, new_route=True
+        )
         special_colors = {u: "green"}
 
-        if best_insertion["route_idx"] is None:
+        if r_idx is None:
             # Tạo tuyến mới
             routes.append([u])
             route_loads.append(demands[u])
-            message = f"Tạo tuyến mới với khách hàng {u} (chi phí {best_insertion['cost']:.2f})."
+            message = f"Tạo tuyến mới với khách hàng {u} (chi phí {cost:.2f})."
             highlighted_edges = [(0, u), (u, 0)]
         else:
             # Chèn vào tuyến hiện có
-            r_idx = best_insertion["route_idx"]
-            pos = best_insertion["pos"]
-            routes[r_idx].insert(pos, u)
+            route = routes[r_idx]
+            i = 0 if pos == 0 else route[pos - 1]
+            j = 0 if pos == len(route) else route[pos]
+            route.insert(pos, u)
             route_loads[r_idx] += demands[u]
-            i, j = best_insertion["edge"]
-            message = f"Chèn khách hàng {u} vào giữa ({i}, {j}) (chi phí {best_insertion['cost']:.2f})."
+            message = f"Chèn khách hàng {u} vào giữa ({i}, {j}) (chi phí {cost:.2f})."
             highlighted_edges = [(i, u), (u, j)]
 
         unvisited.remove(u)
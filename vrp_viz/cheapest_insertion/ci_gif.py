@@ -1,5 +1,6 @@
 import os
 from ..gif_utils import save_gif_frame
+from .cheapest_insertion import best_insertion
 
 
 def cheapest_insertion(dist_matrix, demands, capacity, locations=None, frames_dir=None):
@@ -25,44 +26,28 @@ def cheapest_insertion(dist_matrix, demands, capacity, locations=None, frames_di
         frame_count += 1
 
     while unvisited:
-        best_insertion = {"cost": float("inf")}
-        for u in unvisited:
-            for r_idx, route in enumerate(routes):
-                if route_loads[r_idx] + demands[u] > capacity:
-                    continue
-                for pos in range(len(route) + 1):
-                    if pos == 0:
-                        i, j = 0, route[0]
-                    elif pos == len(route):
-                        i, j = route[-1], 0
-                    else:
-                        i, j = route[pos - 1], route[pos]
-                    cost = dist_matrix[i][u] + dist_matrix[u][j] - dist_matrix[i][j]
-                    if cost < best_insertion["cost"]:
-                        best_insertion = {
-                            "cost": cost,
-                            "customer": u,
-                            "route_idx": r_idx,
-                            "pos": pos,
-                            "route": route[:],
-                        }
+        # Chi phí chèn mọi khách vào mọi vị trí tính một lần, lấy argmin toàn cục
+        best = best_insertion(dist_matrix, routes, route_loads, unvisited, demands, capacity)
 
-        if best_insertion["cost"] != float("inf"):
-            u, r_idx, pos = (
-                best_insertion["customer"],
-                best_insertion["route_idx"],
-                best_insertion["pos"],
-            )
+        if best is not None:
+            cost, u, r_idx, pos = best
+            insertion = {
+                "cost": cost,
+                "customer": u,
+                "route_idx": r_idx,
+                "pos": pos,
+                "route": routes[r_idx][:],
+            }
 
             if frames_dir:
-                title = f"Xem xét chèn KH {u} (chi phí: {best_insertion['cost']:.2f})"
+                title = f"Xem xét chèn KH {u} (chi phí: {cost:.2f})"
                 save_gif_frame(
                     os.path.join(frames_dir, f"f_{frame_count:03d}.png"),
                     title,
                     locations,
                     routes,
                     unvisited,
-                    highlight_insertion=best_insertion,
+                    highlight_insertion=insertion,
                 )
                 frame_count += 1
 
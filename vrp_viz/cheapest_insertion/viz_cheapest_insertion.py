@@ -1,6 +1,8 @@
 import numpy as np
 from typing import List, Optional
-from ..map_viz.stepwise_map import VRPResult
+from ..history import SnapshotHistory
+from ..neighbors import NeighborIndex
+from .cheapest_insertion import InsertionCache
 
 def cheapest_insertion(
     D: np.ndarray,
@@ -9,12 +11,17 @@ def cheapest_insertion(
     max_stops_per_route: Optional[int] = None,  # giữ để đồng bộ signature
     num_vehicles: Optional[int] = None,         # giữ để đồng bộ signature
     depot_idx: int = 0,
-) -> List[VRPResult]:
+    neighbors: Optional[NeighborIndex] = None,
+) -> SnapshotHistory:
     """
     Cheapest Insertion heuristic for CVRP (stepwise).
-    Trả về List[VRPResult]:
+    Trả về SnapshotHistory (dùng như List[VRPResult]):
       - Step 0: rỗng (chưa có tuyến nào).
       - Sau đó, mỗi step ứng với việc chèn 1 khách hàng mới vào solution.
+    Không có neighbors: chi phí chèn tốt nhất được giữ trong InsertionCache và chỉ tính lại
+    cho tuyến vừa thay đổi (cùng kết quả với quét đầy đủ).
+    Có neighbors: chỉ thử chèn u cạnh các láng giềng của u đã nằm trên tuyến,
+    quét mọi vị trí khi không có vị trí láng giềng nào khả thi.
     """
     n = D.shape[0]
     if demands is None:
@@ -23,8 +30,14 @@ def cheapest_insertion(
     unvisited = [i for i in range(n) if i != depot_idx]
     routes: List[List[int]] = []
     route_loads: List[float] = []
-    steps: List[dict] = []
-    snapshots: List[VRPResult] = []
+    # lịch sử stepwise dạng delta, route id = chỉ số tuyến trong routes
+    history = SnapshotHistory()
+    steps: List[dict] = history.steps
+    # node -> (chỉ số tuyến, vị trí trong tuyến), chỉ dùng khi có neighbors
+    where = {}
+    cache = None
+    if neighbors is None:
+        cache = InsertionCache(D, unvisited, demands, vehicle_capacity, max_stops_per_route, depot_idx)
 
     # ========== Helpers ==========
     def closed_route_and_len(path: List[int]):
@@ -37,30 +50,53 @@ def cheapest_insertion(
         length += float(D[path[-1], depot_idx])
         return [depot_idx] + path + [depot_idx], length
 
-    def snapshot_all_routes():
-        rs, lens = [], []
-        for p in routes:
-            r, L = closed_route_and_len(p)
-            rs.append(r)
-            lens.append(L)
-        snapshots.append(VRPResult(routes=rs, route_lengths=lens, steps=list(steps)))
+    def route_feasible(r_idx: int, u: int) -> bool:
+        if vehicle_capacity is not None and route_loads[r_idx] + demands[u] > vehicle_capacity:
+            return False
+        if max_stops_per_route is not None and (len(routes[r_idx]) + 1) > max_stops_per_route:
+            return False
+        return True
+
+    def candidate_positions(u: int):
+        """Các (r_idx, pos) sẽ thử chèn u, theo thứ tự tuyến rồi vị trí."""
+        if neighbors is not None:
+            positions = set()
+            for v in neighbors[u]:
+                loc = where.get(v)
+                if loc is not None:
+                    # chèn ngay trước hoặc ngay sau láng giềng v
+                    positions.add(loc)
+                    positions.add((loc[0], loc[1] + 1))
+            positions = [rp for rp in sorted(positions) if route_feasible(rp[0], u)]
+            if positions:
+                return positions
+        return [
+            (r_idx, pos)
+            for r_idx, route in enumerate(routes)
+            if route_feasible(r_idx, u)
+            for pos in range(len(route) + 1)
+        ]
 
     # Step 0: rỗng
-    snapshots.append(VRPResult(routes=[], route_lengths=[], steps=list(steps)))
+    history.snapshot()
 
     # ========== Main Loop ==========
     while unvisited:
-        best_insertion = {"cost": float("inf")}
-        for u in unvisited:
-            # thử chèn vào các tuyến hiện tại
-            for r_idx, route in enumerate(routes):
-                # kiểm tra capacity
-                if vehicle_capacity is not None and route_loads[r_idx] + demands[u] > vehicle_capacity:
-                    continue
-                # kiểm tra max_stops
-                if max_stops_per_route is not None and (len(route) + 1) > max_stops_per_route:
-                    continue
-                for pos in range(len(route) + 1):
+        if cache is not None:
+            cost, u, r_idx, pos = cache.best()
+            if r_idx is None:
+                i, j = depot_idx, depot_idx
+            else:
+                route = routes[r_idx]
+                i = depot_idx if pos == 0 else route[pos - 1]
+                j = depot_idx if pos == len(route) else route[pos]
+            best_insertion = {"cost": cost, "customer": u, "route_idx": r_idx, "pos": pos, "i": i, "j": j}
+        else:
+            best_insertion = {"cost": float("inf")}
+            for u in unvisited:
+                # thử chèn vào các tuyến hiện tại (đã lọc capacity / max_stops)
+                for r_idx, pos in candidate_positions(u):
+                    route = routes[r_idx]
                     if pos == 0:
                         i, j = depot_idx, route[0]
                     elif pos == len(route):
@@ -77,17 +113,17 @@ def cheapest_insertion(
                             "i": i,
                             "j": j
                         }
-            # cân nhắc tạo tuyến mới
-            cost_new = D[depot_idx, u] + D[u, depot_idx]
-            if cost_new < best_insertion["cost"]:
-                best_insertion = {
-                    "cost": cost_new,
-                    "customer": u,
-                    "route_idx": None,
-                    "pos": 0,
-                    "i": depot_idx,
-                    "j": depot_idx
-                }
+                # cân nhắc tạo tuyến mới
+                cost_new = D[depot_idx, u] + D[u, depot_idx]
+                if cost_new < best_insertion["cost"]:
+                    best_insertion = {
+                        "cost": cost_new,
+                        "customer": u,
+                        "route_idx": None,
+                        "pos": 0,
+                        "i": depot_idx,
+                        "j": depot_idx
+                    }
 
         # thực hiện chèn
         u = best_insertion["customer"]
@@ -113,7 +149,81 @@ def cheapest_insertion(
             })
 
         unvisited.remove(u)
-        # snapshot sau mỗi chèn
-        snapshot_all_routes()
+        r_idx = len(routes) - 1 if best_insertion["route_idx"] is None else best_insertion["route_idx"]
+        if neighbors is not None:
+            for pos, v in enumerate(routes[r_idx]):
+                where[v] = (r_idx, pos)
+        else:
+            cache.inserted(u, r_idx, routes[r_idx], route_loads[r_idx])
+        # snapshot sau mỗi chèn: chỉ tuyến vừa đổi được ghi lại
+        closed, length = closed_route_and_len(routes[r_idx])
+        if best_insertion["route_idx"] is None:
+            history.set_route(r_idx, closed, length)
+        else:
+            history.insert_node(r_idx, best_insertion["pos"] + 1, u, length)
+        history.snapshot()
+
+    return history
+
+
+def regret_insertion(
+    D: np.ndarray,
+    demands: Optional[List[float]] = None,
+    vehicle_capacity: Optional[float] = None,
+    max_stops_per_route: Optional[int] = None,
+    num_vehicles: Optional[int] = None,         # giữ để đồng bộ signature
+    depot_idx: int = 0,
+    k: int = 3,
+) -> SnapshotHistory:
+    """
+    Regret-k Insertion heuristic for CVRP (stepwise), cùng interface với cheapest_insertion.
+    Mỗi step chèn khách có regret lớn nhất (chênh lệch giữa phương án chèn rẻ nhất và rẻ thứ k,
+    gồm cả mở tuyến mới) vào vị trí rẻ nhất của nó; chi phí theo tuyến lấy từ InsertionCache.
+    """
+    n = D.shape[0]
+    if demands is None:
+        demands = [0.0] * n
+
+    unvisited = [i for i in range(n) if i != depot_idx]
+    routes: List[List[int]] = []
+    route_loads: List[float] = []
+    history = SnapshotHistory()
+    cache = InsertionCache(D, unvisited, demands, vehicle_capacity, max_stops_per_route, depot_idx)
+
+    def route_length(path: List[int]) -> float:
+        nodes = [depot_idx] + path + [depot_idx]
+        return float(sum(D[a, b] for a, b in zip(nodes[:-1], nodes[1:])))
+
+    # Step 0: rỗng
+    history.snapshot()
+
+    while unvisited:
+        cost, u, r_idx, pos, regret = cache.regret(k)
+        if r_idx is None:
+            routes.append([u])
+            route_loads.append(demands[u])
+            r_idx = len(routes) - 1
+            history.add_step({
+                "vehicle": r_idx,
+                "from": depot_idx,
+                "to": u,
+                "detail": f"Start new route with {u}, cost={cost:.3f}, regret={regret:.3f}"
+            })
+            history.set_route(r_idx, [depot_idx, u, depot_idx], route_length(routes[r_idx]))
+        else:
+            route = routes[r_idx]
+            i = depot_idx if pos == 0 else route[pos - 1]
+            route.insert(pos, u)
+            route_loads[r_idx] += demands[u]
+            history.add_step({
+                "vehicle": r_idx,
+                "from": i,
+                "to": u,
+                "detail": f"Insert {u} into route {r_idx} at pos {pos}, cost={cost:.3f}, regret={regret:.3f}"
+            })
+            history.insert_node(r_idx, pos + 1, u, route_length(route))
+        unvisited.remove(u)
+        cache.inserted(u, r_idx, routes[r_idx], route_loads[r_idx])
+        history.snapshot()
 
-    return snapshots
+    return history
@@ -1,6 +1,151 @@
+import heapq
+
+import numpy as np
+
+from ..neighbors import NeighborIndex
+
+
+def sorted_savings(dist_matrix, customers, depot=0):
+    """
+    Savings S(i, j) = D[depot, i] + D[depot, j] - D[i, j] cho mọi cặp i < j (theo thứ tự customers),
+    tính trên tam giác trên bằng NumPy, bỏ cặp không hữu hạn và sắp giảm dần
+    (hoà -> giữ thứ tự (i, j) như vòng lặp lồng nhau).
+    Trả về 3 mảng (savings, i, j) cùng độ dài.
+    """
+    D = np.asarray(dist_matrix)
+    customers = np.asarray(customers, dtype=np.int64)
+    a, b = np.triu_indices(len(customers), 1)
+    i, j = customers[a], customers[b]
+    del a, b
+    d0 = D[depot]
+    with np.errstate(invalid="ignore"):  # inf - inf
+        savings = d0[i] + d0[j] - D[i, j]
+    keep = np.isfinite(savings)
+    savings, i, j = savings[keep], i[keep], j[keep]
+    order = np.argsort(-savings, kind="stable")
+    return savings[order], i[order], j[order]
+
+
+class SmallestSavingQueue:
+    """
+    Hàng đợi ưu tiên cho Clarke-Wright smallest-saving-first, thay cho việc quét lại
+    mọi cặp tuyến x 4 cặp điểm cuối sau mỗi lần gộp (O(n^2) mỗi lần, O(n^3) tổng).
+
+    Route id là id khách ban đầu (tuyến giữ id nhỏ hơn khi gộp, nên thứ tự id trùng thứ tự
+    dict của bản quét). Khoá của một cặp là (saving, a, b, code) với a < b, code = 2 * ui + vi
+    chỉ điểm cuối (0 = đầu, 1 = cuối) của a và b, nên thứ tự hoà giống hệt bản quét; mỗi cặp
+    tuyến chỉ giữ tổ hợp điểm cuối tốt nhất, cặp vượt tải không được thêm (tải chỉ tăng).
+
+    Các cặp được lưu thành "run" (mảng NumPy đã sắp theo khoá): một run cho các cặp singleton
+    ban đầu và một run cho tuyến mới sau mỗi lần gộp. Heap chỉ chứa phần tử đầu của mỗi run.
+    Bỏ lười: cặp có tuyến đã bị gộp/thay đổi sau thời điểm tạo run bị bỏ qua theo khối,
+    run của tuyến đã thay đổi bị bỏ cả.
+    """
+
+    def __init__(self, dist_matrix, customers, demands, capacity=None, depot=0):
+        D = np.asarray(dist_matrix)
+        self.D = D
+        self.d0 = D[depot]
+        self.capacity = capacity
+        n = D.shape[0]
+        customers = np.asarray(customers, dtype=np.int64)
+
+        self.head = np.arange(n)
+        self.tail = np.arange(n)
+        self.demand = np.zeros(n)
+        self.demand[customers] = [float(demands[c]) for c in customers.tolist()]
+        self.alive = np.zeros(n, dtype=bool)
+        self.alive[customers] = True
+        # lần gộp gần nhất làm thay đổi tuyến (0 = chưa đổi)
+        self.touched = np.zeros(n, dtype=np.int64)
+        self.n_merges = 0
+        self._heap = []
+        # run: [savings, a, b, code, owner (-1 = singleton ban đầu), t, pos]
+        self._runs = []
+
+        a, b = np.triu_indices(len(customers), 1)
+        i, j = customers[a], customers[b]
+        del a, b
+        with np.errstate(invalid="ignore"):
+            savings = self.d0[i] + self.d0[j] - D[i, j]
+        self._add_run(savings, i, j, np.zeros(len(i), dtype=np.int64), -1)
+
+    def _add_run(self, savings, a, b, code, owner) -> None:
+        keep = savings < np.inf  # NaN / +inf không bao giờ được chọn
+        if self.capacity is not None:
+            keep &= self.demand[a] + self.demand[b] <= self.capacity
+        savings, a, b, code = savings[keep], a[keep], b[keep], code[keep]
+        if not len(savings):
+            return
+        order = np.lexsort((code, b, a, savings))
+        self._runs.append([savings[order], a[order], b[order], code[order], owner, self.n_merges, 0])
+        self._push_head(len(self._runs) - 1)
+
+    def _push_head(self, rid: int, block: int = 4096) -> None:
+        """Bỏ các cặp đã cũ ở đầu run rid (theo khối) rồi đẩy cặp đầu còn hợp lệ vào heap."""
+        savings, a, b, code, owner, t, pos = self._runs[rid]
+        if owner >= 0 and self.touched[owner] > t:
+            self._runs[rid] = None
+            return
+        while pos < len(savings):
+            ra, rb = a[pos : pos + block], b[pos : pos + block]
+            ok = self.alive[ra] & self.alive[rb] & (self.touched[ra] <= t) & (self.touched[rb] <= t)
+            if ok.any():
+                pos += int(ok.argmax())
+                self._runs[rid][6] = pos
+                heapq.heappush(
+                    self._heap, (float(savings[pos]), int(a[pos]), int(b[pos]), int(code[pos]), rid)
+                )
+                return
+            pos += len(ra)
+        self._runs[rid] = None
+
+    def pop(self):
+        """Cặp gộp hợp lệ có saving nhỏ nhất: (saving, route1_id, route2_id, u, v) hoặc None."""
+        while self._heap:
+            saving, a, b, code, rid = heapq.heappop(self._heap)
+            t = self._runs[rid][5]
+            valid = self.alive[a] and self.alive[b] and self.touched[a] <= t and self.touched[b] <= t
+            self._runs[rid][6] += int(valid)
+            self._push_head(rid)
+            if valid:
+                u = self.head[a] if code < 2 else self.tail[a]
+                v = self.head[b] if code % 2 == 0 else self.tail[b]
+                return saving, a, b, int(u), int(v)
+        return None
+
+    def merged(self, r1_id, r2_id, head, tail):
+        """Báo tuyến r2_id đã gộp vào r1_id (điểm đầu/cuối mới), thêm run các cặp mới của r1_id."""
+        self.alive[r2_id] = False
+        self.demand[r1_id] += self.demand[r2_id]
+        self.head[r1_id], self.tail[r1_id] = head, tail
+        self.n_merges += 1
+        self.touched[r1_id] = self.n_merges
+
+        others = np.flatnonzero(self.alive)
+        others = others[others != r1_id]
+        ends_r = np.array([head, tail])
+        ends_o = np.stack([self.head[others], self.tail[others]], axis=1)
+        lower = (others < r1_id)[:, None]
+        first = np.where(lower, ends_o, ends_r)
+        second = np.where(lower, ends_r, ends_o)
+        with np.errstate(invalid="ignore"):
+            savings = (
+                self.d0[first][:, :, None]
+                + self.d0[second][:, None, :]
+                - self.D[first[:, :, None], second[:, None, :]]
+            ).reshape(len(others), 4)
+        savings[np.isnan(savings)] = np.inf
+        # singleton: tổ hợp với điểm cuối 1 trùng điểm đầu 0 -> argmin chọn code nhỏ hơn như bản quét
+        codes = savings.argmin(axis=1)
+        best = savings[np.arange(len(others)), codes]
+        self._add_run(best, np.minimum(others, r1_id), np.maximum(others, r1_id), codes, r1_id)
+
+
 def clarke_wright_smallest_saving_first(dist_matrix, demands, capacity):
     """
     Biến thể của Clarke-Wright: ở mỗi bước, hợp nhất cặp có saving NHỎ NHẤT.
+    Cặp được lấy từ SmallestSavingQueue (O(n^2 log n)), cùng thứ tự gộp như quét toàn bộ.
     """
     num_customers = len(demands) - 1
     depot = 0
@@ -8,64 +153,18 @@ def clarke_wright_smallest_saving_first(dist_matrix, demands, capacity):
     routes = {
         i: {"path": [i], "demand": demands[i]} for i in range(1, num_customers + 1)
     }
+    queue = SmallestSavingQueue(
+        dist_matrix, range(1, num_customers + 1), demands, capacity, depot
+    )
 
     while True:
-        best_merge = {"saving": float("inf")}
-        current_route_ids = list(routes.keys())
-
-        # Bước 2a: Duyệt qua tất cả các cặp tuyến đường hiện có
-        for i in range(len(current_route_ids)):
-            for j in range(i + 1, len(current_route_ids)):
-                route_id_1 = current_route_ids[i]
-                route_id_2 = current_route_ids[j]
-
-                route1 = routes[route_id_1]
-                route2 = routes[route_id_2]
-
-                # Kiểm tra điều kiện tải trọng trước tiên
-                if route1["demand"] + route2["demand"] > capacity:
-                    continue
-
-                # Lấy ra các điểm cuối của 2 tuyến
-                endpoints1 = (
-                    [route1["path"][0], route1["path"][-1]]
-                    if len(route1["path"]) > 1
-                    else [route1["path"][0], route1["path"][0]]
-                )
-                endpoints2 = (
-                    [route2["path"][0], route2["path"][-1]]
-                    if len(route2["path"]) > 1
-                    else [route2["path"][0], route2["path"][0]]
-                )
-
-                # Xem xét 4 khả năng nối
-                for u in endpoints1:
-                    for v in endpoints2:
-                        saving = (
-                            dist_matrix[depot][u]
-                            + dist_matrix[depot][v]
-                            - dist_matrix[u][v]
-                        )
-
-                        # Bước 2b: Nếu saving này nhỏ hơn saving nhỏ nhất đã tìm thấy
-                        if saving < best_merge["saving"]:
-                            best_merge = {
-                                "saving": saving,
-                                "route1_id": route_id_1,
-                                "route2_id": route_id_2,
-                                "endpoint1": u,
-                                "endpoint2": v,
-                            }
-
-        # Bước 3: Nếu không tìm thấy cặp nào để hợp nhất trong vòng lặp, hãy dừng lại
-        if best_merge["saving"] == float("inf"):
+        # Bước 2: lấy cặp tuyến hợp lệ có saving nhỏ nhất; hết cặp thì dừng
+        best_merge = queue.pop()
+        if best_merge is None:
             break
 
         # Bước 2c: Thực hiện hợp nhất tốt nhất (tức là tệ nhất) đã tìm thấy
-        r1_id = best_merge["route1_id"]
-        r2_id = best_merge["route2_id"]
-        u = best_merge["endpoint1"]
-        v = best_merge["endpoint2"]
+        _, r1_id, r2_id, u, v = best_merge
 
         path1 = routes[r1_id]["path"]
         path2 = routes[r2_id]["path"]
@@ -86,31 +185,15 @@ def clarke_wright_smallest_saving_first(dist_matrix, demands, capacity):
         # Cập nhật demand và xóa tuyến đã được gộp
         routes[r1_id]["demand"] += routes[r2_id]["demand"]
         del routes[r2_id]
+        merged_path = routes[r1_id]["path"]
+        queue.merged(r1_id, r2_id, merged_path[0], merged_path[-1])
 
     return [r["path"] for r in routes.values()]
 
 
-def clarke_wright_savings_nlog(dist_matrix, demands, capacity):
-    num_customers = len(demands) - 1
-    depot = 0
-
-    savings = []
-    for i in range(1, num_customers + 1):
-        for j in range(i + 1, num_customers + 1):
-            s_ij = dist_matrix[depot][i] + dist_matrix[depot][j] - dist_matrix[i][j]
-            savings.append({"i": i, "j": j, "saving": s_ij})
-    savings.sort(key=lambda x: x["saving"], reverse=True)
-
-    routes_dict = {
-        i: {"path": [i], "demand": demands[i]} for i in range(1, num_customers + 1)
-    }
-
-    endpoint_status = [None] * (num_customers + 1)
-    for i in range(1, num_customers + 1):
-        endpoint_status[i] = i
-
-    for s in savings:
-        i, j = s["i"], s["j"]
+def _merge_by_savings(savings_i, savings_j, routes_dict, endpoint_status, capacity):
+    """Gộp tuyến lần lượt theo các cặp (i, j) đã sắp; cập nhật routes_dict / endpoint_status tại chỗ."""
+    for i, j in zip(savings_i.tolist(), savings_j.tolist()):
         route_id_i = endpoint_status[i]
         route_id_j = endpoint_status[j]
 
@@ -135,7 +218,6 @@ def clarke_wright_savings_nlog(dist_matrix, demands, capacity):
             # Case 2: ... -> j  +  i -> ...
             elif path_j[-1] == j and path_i[0] == i:
                 route_j["path"].extend(path_i)
-                routes_dict[route_id_i] = routes_dict[route_id_j]
                 absorbing_route_id = route_id_i
 
             # Case 3: ... -> i  +  ... -> j
@@ -164,4 +246,107 @@ def clarke_wright_savings_nlog(dist_matrix, demands, capacity):
             endpoint_status[new_start] = merged_route_id
             endpoint_status[new_end] = merged_route_id
             del routes_dict[absorbing_route_id]
+
+
+def _singleton_routes(demands, num_customers):
+    routes_dict = {
+        i: {"path": [i], "demand": demands[i]} for i in range(1, num_customers + 1)
+    }
+
+    endpoint_status = [None] * (num_customers + 1)
+    for i in range(1, num_customers + 1):
+        endpoint_status[i] = i
+    return routes_dict, endpoint_status
+
+
+def clarke_wright_savings_nlog(dist_matrix, demands, capacity):
+    num_customers = len(demands) - 1
+    depot = 0
+
+    _, savings_i, savings_j = sorted_savings(dist_matrix, range(1, num_customers + 1), depot)
+
+    routes_dict, endpoint_status = _singleton_routes(demands, num_customers)
+    _merge_by_savings(savings_i, savings_j, routes_dict, endpoint_status, capacity)
+    return [r["path"] for r in routes_dict.values()]
+
+
+def clarke_wright_savings_granular(
+    dist_matrix,
+    demands,
+    capacity,
+    k=20,
+    coords=None,
+    method="haversine",
+    second_pass=True,
+    neighbors=None,
+    block_size=256,
+):
+    """
+    Clarke-Wright chỉ trên savings của k láng giềng gần nhất mỗi khách: O(n k) cặp thay vì
+    O(n^2), không cần giữ ma trận savings (hay cả ma trận khoảng cách) trong bộ nhớ.
+
+    - dist_matrix: ma trận khoảng cách (có thể là np.memmap, chỉ đọc theo khối hàng),
+      hoặc None nếu dùng coords.
+    - coords: mảng (n, 2) toạ độ (lat, lng), kho ở chỉ số 0; khoảng cách tính theo
+      method như coordinate_distance_matrix ("haversine", "equirectangular", "euclidean").
+    - neighbors: NeighborIndex dựng sẵn trên các node 0..n-1 (mặc định dựng theo khối hàng).
+    - second_pass: sau lượt đầu, lấy k láng giềng giữa các điểm đầu/cuối của các tuyến
+      còn lại và chạy thêm một lượt gộp để nối các tuyến chưa gộp được.
+    """
+    num_customers = len(demands) - 1
+    depot = 0
+    n = num_customers + 1
+
+    if dist_matrix is not None:
+        D = np.asarray(dist_matrix)
+        d0 = np.asarray(D[depot])
+
+        def pair_distance(i, j):
+            return D[i, j]
+
+        def knn(nodes):
+            return NeighborIndex.from_rows(
+                lambda start, stop: D[nodes[start:stop]][:, nodes], len(nodes), k, block_size
+            )
+
+    elif coords is not None:
+        from ..map_viz.gen_data import _distance
+
+        lats, lngs = np.asarray(coords, dtype=float)[:n].T
+        d0 = _distance(lats[depot], lngs[depot], lats, lngs, method)
+
+        def pair_distance(i, j):
+            return _distance(lats[i], lngs[i], lats[j], lngs[j], method)
+
+        def knn(nodes):
+            return NeighborIndex.from_coordinates(lats[nodes], lngs[nodes], k, method, block_size)
+
+    else:
+        raise ValueError("clarke_wright_savings_granular needs dist_matrix or coords")
+
+    def candidate_savings(nodes, lists):
+        """Các cặp khách (i < j) với j trong danh sách láng giềng của i hoặc ngược lại, sắp như sorted_savings."""
+        i = np.repeat(nodes, lists.shape[1])
+        j = nodes[lists.ravel()]
+        keep = (i != depot) & (j != depot)
+        pairs = np.unique(np.minimum(i, j)[keep] * n + np.maximum(i, j)[keep])
+        lo, hi = pairs // n, pairs % n
+        with np.errstate(invalid="ignore"):
+            savings = d0[lo] + d0[hi] - pair_distance(lo, hi)
+        keep = np.isfinite(savings)
+        savings, lo, hi = savings[keep], lo[keep], hi[keep]
+        order = np.argsort(-savings, kind="stable")
+        return lo[order], hi[order]
+
+    nodes = np.arange(n)
+    if neighbors is None:
+        neighbors = knn(nodes)
+
+    routes_dict, endpoint_status = _singleton_routes(demands, num_customers)
+    _merge_by_savings(*candidate_savings(nodes, neighbors.lists[:n]), routes_dict, endpoint_status, capacity)
+
+    if second_pass and len(routes_dict) > 1:
+        ends = np.unique([end for r in routes_dict.values() for end in (r["path"][0], r["path"][-1])])
+        _merge_by_savings(*candidate_savings(ends, knn(ends).lists), routes_dict, endpoint_status, capacity)
+
     return [r["path"] for r in routes_dict.values()]
@@ -1,7 +1,8 @@
 import numpy as np
 from typing import List, Optional, Dict, Tuple
 
-from ..map_viz.stepwise_map import VRPResult
+from ..history import SnapshotHistory
+from .clarke_saving import SmallestSavingQueue, sorted_savings
 # Giả sử bạn đã có dataclass VRPResult
 # from dataclasses import dataclass
 # @dataclass
@@ -17,9 +18,9 @@ def clarke_wright_savings_vrp(
     max_stops_per_route: Optional[int] = None,  # tuỳ chọn
     num_vehicles: Optional[int] = None,         # nếu None: không ép số xe
     depot_idx: int = 0,
-) -> List[VRPResult]:
+) -> SnapshotHistory:
     """
-    Clarke–Wright Savings (cơ bản) — trả về danh sách VRPResult dạng stepwise.
+    Clarke–Wright Savings (cơ bản) — trả về SnapshotHistory (dùng như List[VRPResult]) dạng stepwise.
     - Snapshot #0: mỗi tuyến tương ứng 1 customer (đều đóng depot).
     - Mỗi lần merge:
         * Snapshot A (pre-merge): chỉ 2 tuyến sẽ gộp (đều đóng depot).
@@ -40,8 +41,9 @@ def clarke_wright_savings_vrp(
     endpoint_owner: Dict[int, int] = {}
     next_route_id = 1
 
-    # Các bước diễn giải (cộng dồn)
-    steps: List[dict] = []
+    # Lịch sử stepwise dạng delta (route id giống routes_dict); các bước diễn giải cộng dồn
+    history = SnapshotHistory()
+    steps: List[dict] = history.steps
 
     # ========== Helpers ==========
     def closed_route_and_len(path: List[int]) -> Tuple[List[int], float]:
@@ -59,17 +61,10 @@ def clarke_wright_savings_vrp(
         length += float(D[path[-1], depot_idx])
         return [depot_idx] + path + [depot_idx], length
 
-    def snapshot_from_paths(paths: List[List[int]]) -> VRPResult:
-        """Tạo VRPResult từ danh sách path (chưa đóng). Route sẽ đóng depot và tính length."""
-        routes: List[List[int]] = []
-        lens: List[float] = []
-        for p in paths:
-            r, L = closed_route_and_len(p)
-            if r is None:  # nếu có cạnh vô hạn -> bỏ qua snapshot cho tuyến đó
-                continue
-            routes.append(r)
-            lens.append(L)
-        return VRPResult(routes=routes, route_lengths=lens, steps=list(steps))
+    def record_route(rid: int, path: List[int]) -> None:
+        """Ghi tuyến rid vào history; nếu có cạnh vô hạn -> giữ nhưng không hiển thị trong snapshot."""
+        r, L = closed_route_and_len(path)
+        history.set_route(rid, [depot_idx] + path + [depot_idx] if r is None else r, L, visible=r is not None)
 
     def stops_ok_after_merge(path_a: List[int], path_b: List[int]) -> bool:
         if max_stops_per_route is None:
@@ -82,6 +77,7 @@ def clarke_wright_savings_vrp(
         next_route_id += 1
         routes_dict[rid] = {"path": [i], "demand": float(demands[i])}
         endpoint_owner[i] = rid
+        record_route(rid, [i])
 
         # Ghi step init
         steps.append({
@@ -92,34 +88,22 @@ def clarke_wright_savings_vrp(
         })
 
     # Snapshot #0: mỗi tuyến là một customer (đều đóng depot)
-    snapshots: List[VRPResult] = []
-    snapshots.append(snapshot_from_paths([r["path"] for r in routes_dict.values()]))
-
-    # ========== Tính & sắp xếp Savings ==========
-    savings: List[Tuple[float, int, int]] = []
-    for idx_i, i in enumerate(customers):
-        di = D[depot_idx, i]
-        if not np.isfinite(di):
-            continue
-        for j in customers[idx_i + 1:]:
-            dj = D[depot_idx, j]
-            dij = D[i, j]
-            if np.isfinite(dj) and np.isfinite(dij):
-                s_ij = float(di + dj - dij)
-                savings.append((s_ij, i, j))
-                steps.append({
-                    "vehicle": -1,
-                    "from": i,
-                    "to": j,
-                    "detail": f"Compute saving S({i},{j}) = D({depot_idx},{i}) + D({depot_idx},{j}) - D({i},{j}) = {s_ij:.3f}"
-                })
-
-    savings.sort(key=lambda t: t[0], reverse=True)
+    history.snapshot()
+
+    # ========== Tính & sắp xếp Savings (vector hoá) ==========
+    savings_s, savings_i, savings_j = sorted_savings(D, customers, depot_idx)
+    savings = zip(savings_s.tolist(), savings_i.tolist(), savings_j.tolist())
     steps.append({
         "vehicle": -1,
         "from": depot_idx,
         "to": depot_idx,
-        "detail": f"Sort savings descending; total pairs={len(savings)}"
+        "detail": f"Compute savings S(i,j) = D({depot_idx},i) + D({depot_idx},j) - D(i,j) for {len(savings_s)} finite pairs"
+    })
+    steps.append({
+        "vehicle": -1,
+        "from": depot_idx,
+        "to": depot_idx,
+        "detail": f"Sort savings descending; total pairs={len(savings_s)}"
     })
 
     # ========== Hợp nhất theo Savings ==========
@@ -151,15 +135,21 @@ def clarke_wright_savings_vrp(
 
         merged_path = None
         case = None
+        # (route id, đảo chiều?) của hai đoạn ghép, theo thứ tự — để ghi merge vào history
+        segments = None
 
         if (path_i and path_j) and (path_i[-1] == i and path_j[0] == j):
             merged_path, case = (path_i + path_j), "case1_tail(i)+head(j)"
+            segments = ((rid_i, False), (rid_j, False))
         elif (path_i and path_j) and (path_j[-1] == j and path_i[0] == i):
             merged_path, case = (path_j + path_i), "case2_tail(j)+head(i)"
+            segments = ((rid_j, False), (rid_i, False))
         elif (path_i and path_j) and (path_i[-1] == i and path_j[-1] == j):
             merged_path, case = (path_i + list(reversed(path_j))), "case3_tail(i)+tail(j)_rev(j)"
+            segments = ((rid_i, False), (rid_j, True))
         elif (path_i and path_j) and (path_i[0] == i and path_j[0] == j):
             merged_path, case = (list(reversed(path_i)) + path_j), "case4_head(i)_rev(i)+head(j)"
+            segments = ((rid_i, True), (rid_j, False))
         else:
             steps.append({
                 "vehicle": -1, "from": i, "to": j,
@@ -172,7 +162,7 @@ def clarke_wright_savings_vrp(
             "vehicle": -1, "from": i, "to": j,
             "detail": f"Preview merge ({i},{j}) via {case}: show 2 routes before merge"
         })
-        snapshots.append(snapshot_from_paths([path_i, path_j]))
+        history.snapshot([rid_i, rid_j])
 
         # Ghi step “thử merge”
         steps.append({
@@ -193,13 +183,15 @@ def clarke_wright_savings_vrp(
         endpoint_owner[new_tail] = rid_i
 
         routes_dict.pop(rid_j, None)
+        merged_route, merged_len = closed_route_and_len(merged_path)
+        history.merge_routes(rid_i, *segments, merged_len, visible=merged_route is not None)
 
         # --- Snapshot B: chỉ tuyến mới sau khi gộp (đã đóng depot) ---
         steps.append({
             "vehicle": -1, "from": new_head, "to": new_tail,
             "detail": f"Show merged route (rid={rid_i}) after merge"
         })
-        snapshots.append(snapshot_from_paths([merged_path]))
+        history.snapshot([rid_i])
 
         if (num_vehicles is not None) and (len(routes_dict) <= num_vehicles):
             steps.append({
@@ -210,24 +202,19 @@ def clarke_wright_savings_vrp(
 
     # ========== (Tuỳ chọn) Đóng tuyến thật sự & bước di chuyển ==========
     # Nếu bạn muốn thêm một snapshot cuối hiển thị toàn bộ tuyến sau khi dừng merge:
-    snapshots.append(snapshot_from_paths([r["path"] for r in routes_dict.values()]))
+    history.snapshot()
 
     # (Giữ nguyên phần "đi tuyến" nếu bạn cần steps di chuyển chi tiết, có thể bật sau.)
-    final_routes: List[List[int]] = []
-    route_lengths: List[float] = []
     for k, (rid, r) in enumerate(routes_dict.items()):
-        path = r["path"]
-        full, L = closed_route_and_len(path)
+        full, L = closed_route_and_len(r["path"])
         if full is None or not np.isfinite(L):
             steps.append({"vehicle": k, "from": depot_idx, "to": depot_idx,
                           "detail": f"Drop route #{rid} due to non-finite edge(s)"})
-            continue
-        final_routes.append(full)
-        route_lengths.append(L)
+            history.drop_route(rid)
     # # Có thể thêm 1 snapshot tổng kết cuối:
-    snapshots.append(VRPResult(routes=final_routes, route_lengths=route_lengths, steps=list(steps)))
+    history.snapshot()
 
-    return snapshots
+    return history
 
 def clarke_wright_smallest_saving_first(
     D: np.ndarray,
@@ -236,10 +223,10 @@ def clarke_wright_smallest_saving_first(
     max_stops_per_route: Optional[int] = None,  # để tương thích với signature
     num_vehicles: Optional[int] = None,         # để tương thích với signature
     depot_idx: int = 0,
-) -> List[VRPResult]:
+) -> SnapshotHistory:
     """
     Clarke–Wright Savings (smallest saving first).
-    Trả về danh sách VRPResult stepwise:
+    Trả về SnapshotHistory (dùng như List[VRPResult]) stepwise:
       - Bước 0: mỗi customer là một tuyến riêng [depot, i, depot].
       - Mỗi merge:
           * Snapshot A: chỉ 2 tuyến chuẩn bị gộp
@@ -261,73 +248,44 @@ def clarke_wright_smallest_saving_first(
         length += float(D[path[-1], depot_idx])
         return [depot_idx] + path + [depot_idx], length
 
-    def snapshot_from_paths(paths: List[List[int]], steps: List[dict]) -> VRPResult:
-        routes, lens = [], []
-        for p in paths:
-            r, L = closed_route_and_len(p)
-            routes.append(r)
-            lens.append(L)
-        return VRPResult(routes=routes, route_lengths=lens, steps=list(steps))
-
     # ========== Init singletons ==========
     routes: Dict[int, Dict] = {
         i: {"path": [i], "demand": float(demands[i])} for i in range(n) if i != depot_idx
     }
-    steps: List[dict] = []
+    history = SnapshotHistory()
+    steps: List[dict] = history.steps
+    for rid, r in routes.items():
+        history.set_route(rid, *closed_route_and_len(r["path"]))
 
     # Snapshot #0: mỗi khách là một tuyến riêng
-    snapshots: List[VRPResult] = []
     steps.append({"vehicle": -1, "from": depot_idx, "to": depot_idx,
                   "detail": f"Init {len(routes)} singleton routes"})
-    snapshots.append(snapshot_from_paths([r["path"] for r in routes.values()], steps))
+    history.snapshot()
 
     # ========== Merge loop ==========
+    queue = SmallestSavingQueue(D, list(routes), demands, vehicle_capacity, depot_idx)
     while True:
-        best_merge = {"saving": float("inf")}
-        current_route_ids = list(routes.keys())
-
-        # tìm cặp có saving nhỏ nhất
-        for i in range(len(current_route_ids)):
-            for j in range(i + 1, len(current_route_ids)):
-                r1_id = current_route_ids[i]
-                r2_id = current_route_ids[j]
-                r1 = routes[r1_id]
-                r2 = routes[r2_id]
-
-                if vehicle_capacity is not None and (r1["demand"] + r2["demand"] > vehicle_capacity):
-                    continue
-
-                endpoints1 = [r1["path"][0], r1["path"][-1]]
-                endpoints2 = [r2["path"][0], r2["path"][-1]]
-
-                for u in endpoints1:
-                    for v in endpoints2:
-                        saving = D[depot_idx, u] + D[depot_idx, v] - D[u, v]
-                        if saving < best_merge["saving"]:
-                            best_merge = {
-                                "saving": saving,
-                                "route1_id": r1_id,
-                                "route2_id": r2_id,
-                                "endpoint1": u,
-                                "endpoint2": v,
-                            }
-
-        if best_merge["saving"] == float("inf"):
+        # cặp tuyến hợp lệ có saving nhỏ nhất (hàng đợi ưu tiên, bỏ lười cặp đã cũ)
+        best_merge = queue.pop()
+        if best_merge is None:
             break
 
-        r1_id, r2_id = best_merge["route1_id"], best_merge["route2_id"]
-        u, v = best_merge["endpoint1"], best_merge["endpoint2"]
+        saving, r1_id, r2_id, u, v = best_merge
         path1, path2 = routes[r1_id]["path"], routes[r2_id]["path"]
 
         # --- Merge logic ---
         if path1[-1] == u and path2[0] == v:
             merged_path = path1 + path2
+            segments = ((r1_id, False), (r2_id, False))
         elif path1[0] == u and path2[-1] == v:
             merged_path = path2 + path1
+            segments = ((r2_id, False), (r1_id, False))
         elif path1[-1] == u and path2[-1] == v:
             merged_path = path1 + list(reversed(path2))
+            segments = ((r1_id, False), (r2_id, True))
         elif path1[0] == u and path2[0] == v:
             merged_path = list(reversed(path1)) + path2
+            segments = ((r1_id, True), (r2_id, False))
         else:
             # không merge được -> bỏ
             continue
@@ -335,13 +293,15 @@ def clarke_wright_smallest_saving_first(
         # --- Snapshot A: hai tuyến chuẩn bị gộp ---
         steps.append({
             "vehicle": -1, "from": u, "to": v,
-            "detail": f"Prepare merge: route {r1_id} and {r2_id}, saving={best_merge['saving']:.3f}"
+            "detail": f"Prepare merge: route {r1_id} and {r2_id}, saving={saving:.3f}"
         })
-        snapshots.append(snapshot_from_paths([path1, path2], steps))
+        history.snapshot([r1_id, r2_id])
 
         routes[r1_id]["path"] = merged_path
         routes[r1_id]["demand"] += routes[r2_id]["demand"]
         del routes[r2_id]
+        history.merge_routes(r1_id, *segments, closed_route_and_len(merged_path)[1])
+        queue.merged(r1_id, r2_id, merged_path[0], merged_path[-1])
 
         steps.append({
             "vehicle": -1, "from": u, "to": v,
@@ -349,8 +309,8 @@ def clarke_wright_smallest_saving_first(
         })
 
         # --- Snapshot B: tuyến mới sau khi gộp ---
-        snapshots.append(snapshot_from_paths([merged_path], steps))
-        
-        snapshots.append(snapshot_from_paths([r["path"] for r in routes.values()], steps))
+        history.snapshot([r1_id])
+
+        history.snapshot()
 
-    return snapshots
+    return history
@@ -3,11 +3,13 @@ import json
 import time
 import pandas as pd
 import numpy as np
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
+from .map_viz.providers import CachedProvider, default_provider
 from .map_viz.stepwise_map import VRPResult
 from .map_viz.stepwise_mapv2 import make_stepwise_map as make_stepwise_map_v3
 from .map_viz.stepwise_mapv2 import make_stepwise_map_vrps
+from .neighbors import load_or_build_neighbor_index
 
 list_warehouses_infos = [
     {
@@ -57,6 +59,43 @@ list_warehouses_infos = [
     },
 ]
 
+
+
+def load_distance_matrix(
+    prefix_path: str, customers_df: pd.DataFrame, warehouse_info: dict
+) -> Tuple[np.ndarray, List[str]]:
+    """
+    Trả về (D, list_customer) của dataset, D theo thứ tự [kho, *list_customer].
+    Nếu có vrp_distances_dev.csv thì đọc và nạp vào cache của routing provider,
+    ngược lại lấy từ provider (cache theo toạ độ, chỉ hỏi backend các điểm chưa có).
+    """
+    distance_file = os.path.join(prefix_path, "vrp_distances_dev.csv")
+    distance_matrix_df = None
+    if os.path.exists(distance_file):
+        distance_matrix_df = pd.read_csv(distance_file)
+        list_customer = distance_matrix_df.columns.tolist()[2:]
+    else:
+        list_customer = customers_df["customer_id"].tolist()
+
+    coords = customers_df.set_index("customer_id")
+    points = [
+        (float(warehouse_info["lat"]), float(warehouse_info["lng"])),
+        *[
+            (float(coords.at[cid, "lat"]), float(coords.at[cid, "lng"]))
+            for cid in list_customer
+        ],
+    ]
+
+    if distance_matrix_df is not None:
+        D = np.array(distance_matrix_df.to_numpy()[:, 1:], dtype=float)
+        provider = default_provider()
+        if isinstance(provider, CachedProvider):
+            provider.add_table(points, {"distance": D * 1000})
+    else:
+        D = default_provider().table(points)["distance"] / 1000
+    return D, list_customer
+
+
 def calculate_route_length(route: List[int], distance_matrix: np.ndarray) -> float:
         if len(route) <= 1:
             return 0.0
@@ -75,12 +114,27 @@ def have_run_check_solution(prefix_path: str, solver_name: str) -> bool:
     return True
 
 
+def load_neighbor_kwargs(prefix_path: str, D: np.ndarray, neighbor_k: Optional[int]) -> dict:
+    """
+    {"neighbors": NeighborIndex} cho solver khi neighbor_k được đặt, cache cạnh ma trận
+    (vrp_neighbors_k{k}.npz trong thư mục dataset); ngược lại {} (quét toàn bộ như cũ).
+    """
+    if not neighbor_k:
+        return {}
+    cache_file = os.path.join(prefix_path, f"vrp_neighbors_k{neighbor_k}.npz")
+    return {"neighbors": load_or_build_neighbor_index(D, neighbor_k, cache_file)}
+
+
 def get_run_data_from_prefix_path(
-    prefix_path: str, function_solver, solver_name: str, capacity: Optional[int] = None
+    prefix_path: str,
+    function_solver,
+    solver_name: str,
+    capacity: Optional[int] = None,
+    neighbor_k: Optional[int] = None,
 ):
     customers_df = pd.read_csv(os.path.join(prefix_path, "vrp_customers_dev.csv"))
-    distance_matrix_df = pd.read_csv(os.path.join(prefix_path, "vrp_distances_dev.csv"))
     cache_location_file = os.path.join(prefix_path, "vrp_routes_dev.json")
+    cache_location = {}  # thiếu cặp nào thì stepwise_mapv2 hỏi routing provider
     if os.path.exists(cache_location_file):
         with open(cache_location_file, "r", encoding="utf-8") as f:
             cache_location = json.load(f)
@@ -88,9 +142,7 @@ def get_run_data_from_prefix_path(
 
     warehouse_info = list_warehouses_infos[0]  # chọn kho mặc định
     N_VEHICLES = 9999
-    D = distance_matrix_df.to_numpy()[:, 1:]
-    D = np.array(D, dtype=float)
-    list_customer = distance_matrix_df.columns.tolist()[2:]
+    D, list_customer = load_distance_matrix(prefix_path, customers_df, warehouse_info)
     demands = [
         0,
         *[
@@ -133,6 +185,7 @@ def get_run_data_from_prefix_path(
     max_stops_per_route = None
     depot_idx = 0  # kho là node 0
 
+    solver_kwargs = load_neighbor_kwargs(prefix_path, D, neighbor_k)
     start_time = time.time()
     vrps: List[VRPResult] = function_solver(
         D=D,
@@ -141,6 +194,7 @@ def get_run_data_from_prefix_path(
         num_vehicles=N_VEHICLES,
         depot_idx=depot_idx,
         max_stops_per_route=max_stops_per_route,
+        **solver_kwargs,
     )
     end_time = time.time()
 
@@ -171,20 +225,24 @@ def get_run_data_from_prefix_path(
 
 
 def get_run_data_from_local_search(
-    prefix_path: str, function_solver, solver_name: str, base_solution: List[List[int]], capacity: Optional[int] = None
+    prefix_path: str,
+    function_solver,
+    solver_name: str,
+    base_solution: List[List[int]],
+    capacity: Optional[int] = None,
+    neighbor_k: Optional[int] = None,
+    strategy: Optional[str] = None,
 ):
     customers_df = pd.read_csv(os.path.join(prefix_path, "vrp_customers_dev.csv"))
-    distance_matrix_df = pd.read_csv(os.path.join(prefix_path, "vrp_distances_dev.csv"))
     cache_location_file = os.path.join(prefix_path, "vrp_routes_dev.json")
+    cache_location = {}  # thiếu cặp nào thì stepwise_mapv2 hỏi routing provider
     if os.path.exists(cache_location_file):
         with open(cache_location_file, "r", encoding="utf-8") as f:
             cache_location = json.load(f)
 
     warehouse_info = list_warehouses_infos[0]  # chọn kho mặc định
     N_VEHICLES = 9999
-    D = distance_matrix_df.to_numpy()[:, 1:]
-    D = np.array(D, dtype=float)
-    list_customer = distance_matrix_df.columns.tolist()[2:]
+    D, list_customer = load_distance_matrix(prefix_path, customers_df, warehouse_info)
     demands = [
         0,
         *[
@@ -230,6 +288,9 @@ def get_run_data_from_local_search(
     # recalculate route lengths for the base solution
     base_solution_route_lengths = [calculate_route_length(route, D) for route in base_solution]
 
+    solver_kwargs = load_neighbor_kwargs(prefix_path, D, neighbor_k)
+    if strategy is not None:
+        solver_kwargs["strategy"] = strategy  # "best" / "first" improvement
     start_time = time.time()
     vrps: VRPResult = function_solver(
         D=D,
@@ -242,7 +303,8 @@ def get_run_data_from_local_search(
             routes=base_solution,
             route_lengths=base_solution_route_lengths,
             steps=[]          # not used in local search
-        )
+        ),
+        **solver_kwargs,
     )
     end_time = time.time()
 
@@ -0,0 +1,157 @@
+from bisect import bisect_right
+from collections.abc import Sequence
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .map_viz.stepwise_map import VRPResult
+
+# route id -> [route (list node), độ dài, có hiển thị trong snapshot không]
+_State = Dict[int, list]
+
+
+def _segment(state: _State, rid: int, reverse: bool) -> List[int]:
+    inner = state[rid][0][1:-1]
+    if reverse:
+        inner.reverse()
+    return inner
+
+
+def _apply(state: _State, event: tuple) -> None:
+    kind, rid = event[0], event[1]
+    if kind == "append":
+        entry = state[rid]
+        entry[0].append(event[2])
+        entry[1] = event[3]
+    elif kind == "insert":
+        entry = state[rid]
+        entry[0].insert(event[2], event[3])
+        entry[1] = event[4]
+    elif kind == "set":
+        # mở tuyến mới hoặc thay cả tuyến, giữ vị trí cũ nếu đã có
+        state[rid] = [list(event[2]), event[3], event[4]]
+    elif kind == "merge":
+        _, rid, first, first_rev, second, second_rev, length, visible = event
+        route = state[rid][0]
+        merged = [route[0], *_segment(state, first, first_rev), *_segment(state, second, second_rev), route[-1]]
+        for other in (first, second):
+            if other != rid:
+                state.pop(other)
+        state[rid] = [merged, length, visible]
+    elif kind == "drop":
+        state.pop(rid, None)
+    else:
+        raise ValueError(f"Unknown history event {kind!r}")
+
+
+class SnapshotHistory(Sequence):
+    """
+    Lịch sử stepwise của solver dưới dạng delta, thay cho list VRPResult deep-copy mỗi bước.
+
+    Solver ghi các thay đổi nhỏ (mở/thay/gộp/bỏ tuyến, thêm/chèn node, thêm step) rồi gọi
+    snapshot(); mỗi snapshot chỉ lưu vị trí trong log, số step và (tuỳ chọn) tập tuyến hiển thị.
+    history[k] dựng VRPResult khi truy cập bằng cách phát lại log từ checkpoint gần nhất
+    (mỗi checkpoint_every snapshot); duyệt tuần tự chỉ phát lại log một lần.
+
+    Dùng như List[VRPResult]: len(), history[-1], for vrp in history, ...
+    """
+
+    def __init__(self, checkpoint_every: int = 64):
+        self.checkpoint_every = max(1, int(checkpoint_every))
+        self.steps: List[dict] = []
+        self._events: List[tuple] = []
+        # mỗi snapshot: (số event, số step, route ids hiển thị hoặc None = tất cả)
+        self._snapshots: List[Tuple[int, int, Optional[Tuple[int, ...]]]] = []
+        self._checkpoint_ends: List[int] = [0]
+        self._checkpoints: List[_State] = [{}]
+        self._state: _State = {}
+
+    # ===== ghi =====
+    def _record(self, event: tuple) -> None:
+        self._events.append(event)
+        _apply(self._state, event)
+
+    def set_route(self, rid: int, route: List[int], length: float = 0.0, visible: bool = True) -> None:
+        """Mở tuyến rid hoặc thay toàn bộ tuyến. visible=False -> giữ trong trạng thái nhưng không vẽ."""
+        self._record(("set", rid, tuple(route), float(length), visible))
+
+    def merge_routes(
+        self,
+        rid: int,
+        first: Tuple[int, bool],
+        second: Tuple[int, bool],
+        length: float,
+        visible: bool = True,
+    ) -> None:
+        """
+        Gộp hai tuyến (đều dạng [depot, ..., depot]) thành tuyến rid:
+        đoạn khách của first rồi của second, mỗi đoạn là (route id, có đảo chiều không).
+        Tuyến còn lại (khác rid) bị bỏ.
+        """
+        self._record(("merge", rid, first[0], first[1], second[0], second[1], float(length), visible))
+
+    def append_node(self, rid: int, node: int, length: float) -> None:
+        """Thêm node vào cuối tuyến rid (một cạnh mới), length là độ dài mới của tuyến."""
+        self._record(("append", rid, node, float(length)))
+
+    def insert_node(self, rid: int, pos: int, node: int, length: float) -> None:
+        self._record(("insert", rid, pos, node, float(length)))
+
+    def drop_route(self, rid: int) -> None:
+        self._record(("drop", rid))
+
+    def add_step(self, step: dict) -> None:
+        self.steps.append(step)
+
+    def route(self, rid: int) -> List[int]:
+        """Tuyến rid ở trạng thái hiện tại (chỉ đọc)."""
+        return self._state[rid][0]
+
+    def snapshot(self, rids: Optional[List[int]] = None) -> None:
+        """Chụp trạng thái hiện tại: mọi tuyến theo thứ tự mở, hoặc chỉ các tuyến rids."""
+        self._snapshots.append(
+            (len(self._events), len(self.steps), None if rids is None else tuple(rids))
+        )
+        if len(self._snapshots) % self.checkpoint_every == 0:
+            self._checkpoint_ends.append(len(self._events))
+            self._checkpoints.append(self._copy_state(self._state))
+
+    # ===== đọc =====
+    @staticmethod
+    def _copy_state(state: _State) -> _State:
+        return {rid: [list(r), L, visible] for rid, (r, L, visible) in state.items()}
+
+    def _result(self, state: _State, n_steps: int, rids) -> VRPResult:
+        routes: List[List[int]] = []
+        lengths: List[float] = []
+        for rid in state if rids is None else rids:
+            route, length, visible = state[rid]
+            if not visible:
+                continue
+            routes.append(list(route))
+            lengths.append(length)
+        return VRPResult(routes=routes, route_lengths=lengths, steps=self.steps[:n_steps])
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self[i] for i in range(*k.indices(len(self)))]
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError("snapshot index out of range")
+        event_end, n_steps, rids = self._snapshots[k]
+        c = bisect_right(self._checkpoint_ends, event_end) - 1
+        state = self._copy_state(self._checkpoints[c])
+        for event in self._events[self._checkpoint_ends[c] : event_end]:
+            _apply(state, event)
+        return self._result(state, n_steps, rids)
+
+    def __iter__(self) -> Iterator[VRPResult]:
+        state: _State = {}
+        done = 0
+        for event_end, n_steps, rids in self._snapshots:
+            for event in self._events[done:event_end]:
+                _apply(state, event)
+            done = event_end
+            yield self._result(state, n_steps, rids)
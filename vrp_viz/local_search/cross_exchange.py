@@ -0,0 +1,233 @@
+import copy
+from collections import defaultdict
+from itertools import product
+from typing import Optional
+from vrp_viz.local_search.util import *
+from vrp_viz.map_viz.stepwise_map import VRPResult
+from vrp_viz.neighbors import NeighborIndex
+from vrp_viz.local_search.or_opt import _segments
+
+
+def _pair_cross_exchanges(routes: List[List[int]], route_i: int, route_j: int, max_length: int):
+    """Yield every (route_i, start_i, end_i, route_j, start_j, end_j) exchange between two routes."""
+    for (start_i, end_i), (start_j, end_j) in product(_segments(routes[route_i], max_length),
+                                                      _segments(routes[route_j], max_length)):
+        yield route_i, start_i, end_i, route_j, start_j, end_j
+
+
+def _customer_cross_exchanges(routes: List[List[int]], route_a: int, pos: int, max_length: int,
+                              neighbors: Optional[NeighborIndex] = None, where=None):
+    """
+    CROSS-exchanges of the segments that start or end at the customer at routes[route_a][pos],
+    as (route_i, start_i, end_i, route_j, start_j, end_j) with route_i < route_j.
+    With neighbors, only exchanges that link this customer to one of its neighbors
+    (where: customer_positions).
+    """
+    route = routes[route_a]
+    starting = [(pos, end) for end in range(pos, min(pos + max_length, len(route) - 1))]
+    ending = [(start, pos) for start in range(max(1, pos - max_length + 1), pos + 1)]
+
+    pairs = []
+    if neighbors is None:
+        for route_b in range(len(routes)):
+            if route_b != route_a:
+                for segment_a, segment_b in product(starting + ending, _segments(routes[route_b], max_length)):
+                    pairs.append((route_b, segment_a, segment_b))
+    else:
+        for v in neighbors[route[pos]]:
+            loc = where.get(v)
+            if loc is None or loc[0] == route_a:
+                continue
+            route_b, q = loc
+            last_b = len(routes[route_b]) - 2
+            for length in range(1, max_length + 1):
+                # v -> customer: the segment of route_b right after v moves to route_a
+                if q + length <= last_b:
+                    pairs += [(route_b, segment_a, (q + 1, q + length)) for segment_a in starting]
+                # customer -> v: the segment of route_b right before v moves to route_a
+                if q - length >= 1:
+                    pairs += [(route_b, segment_a, (q - length, q - 1)) for segment_a in ending]
+
+    moves = []
+    for route_b, (start_a, end_a), (start_b, end_b) in pairs:
+        if route_a < route_b:
+            moves.append((route_a, start_a, end_a, route_b, start_b, end_b))
+        else:
+            moves.append((route_b, start_b, end_b, route_a, start_a, end_a))
+    return list(dict.fromkeys(moves))
+
+
+def _cross_exchange_moves(routes: List[List[int]], max_length: int, neighbors: Optional[NeighborIndex] = None):
+    """
+    CROSS-exchange candidates grouped by route pair {(route_i, route_j): moves} with route_i < route_j,
+    pairs and moves in scan order. The full neighborhood is generated lazily.
+    """
+    if neighbors is None:
+        return {
+            (route_i, route_j): _pair_cross_exchanges(routes, route_i, route_j, max_length)
+            for route_i in range(len(routes))
+            for route_j in range(route_i + 1, len(routes))
+        }
+
+    where = customer_positions(routes)
+    moves = set()
+    for route_a, route in enumerate(routes):
+        for pos in range(1, len(route) - 1):
+            moves.update(_customer_cross_exchanges(routes, route_a, pos, max_length, neighbors, where))
+    grouped = defaultdict(list)
+    for move in sorted(moves):
+        grouped[move[0], move[3]].append(move)
+    return grouped
+
+
+def cross_exchange_local_search(
+        D: np.ndarray,
+        demands: List[float],
+        vehicle_capacity: float,
+        max_stops_per_route,  # Ignored
+        num_vehicles,  # Ignored
+        depot_idx,  # Ignored
+        current_solution: VRPResult,
+        neighbors: Optional[NeighborIndex] = None,
+        strategy: str = "best",
+        max_segment_length: int = 3,
+) -> List[VRPResult]:
+    """
+    CROSS-exchange move: Inter-route move that swaps two segments of 1..max_segment_length
+    consecutive customers between two routes (each keeps its direction).
+    Segment loads (RouteLoads) make the capacity check O(1) and the delta only touches the
+    four boundary edges.
+
+    With neighbors, each iteration first scans only the granular moves and falls back
+    to the full neighborhood when none of them improves.
+
+    strategy="best": apply the best move of the whole neighborhood each iteration. The best
+    move of each route pair is cached (one MoveCache per candidate set); a move only rewrites
+    two routes, so only the pairs involving them are evaluated again.
+    strategy="first": apply the first improving move of each customer (segments starting or
+    ending at it), scanning customers with don't-look bits.
+    """
+    if strategy not in ("best", "first"):
+        raise ValueError(f"Unknown local search strategy {strategy!r}")
+    solutions = [current_solution]
+    current = copy.deepcopy(current_solution)
+    loads = RouteLoads(current.routes, demands)
+    candidate_sets = (neighbors, None) if neighbors is not None else (None,)
+    caches = [MoveCache() for _ in candidate_sets]
+
+    def move_delta(route_i, start_i, end_i, route_j, start_j, end_j):
+        """Delta of the move, or None if it violates capacity."""
+        # Check capacity constraints (O(1) from the segment loads)
+        load_i = loads.segment(route_i, start_i, end_i)
+        load_j = loads.segment(route_j, start_j, end_j)
+        if loads.load(route_i) - load_i + load_j > vehicle_capacity or \
+                loads.load(route_j) - load_j + load_i > vehicle_capacity:
+            return None
+
+        # Calculate delta
+        delta = calculate_cross_exchange_delta(D, current.routes, route_i, start_i, end_i, route_j, start_j, end_j)
+
+        # Verify correctness. Comment this out when done testing for a BOOM speed up.
+        # if not check_cross_exchange_delta_correctness(D, current, route_i, start_i, end_i, route_j, start_j, end_j, delta):
+        #     raise ValueError("CROSS-exchange delta calculation error")
+        return delta
+
+    def apply_move(route_i, start_i, end_i, route_j, start_j, end_j):
+        # Snapshot before move
+        solutions.append(VRPResult(routes=[copy.deepcopy(current.routes[route_i]), copy.deepcopy(current.routes[route_j])],
+                                   route_lengths=[current.route_lengths[route_i], current.route_lengths[route_j]],
+                                   steps=[]))
+
+        # Exchange segments
+        apply_cross_exchange(current.routes, route_i, start_i, end_i, route_j, start_j, end_j)
+        for r in (route_i, route_j):
+            loads.update(r, current.routes[r])
+            current.route_lengths[r] = calculate_route_length(D, current.routes[r])
+        for cache in caches:
+            cache.invalidate(route_i, route_j)
+
+        # Snapshot after move
+        solutions.append(
+            VRPResult(routes=[copy.deepcopy(current.routes[route_i]), copy.deepcopy(current.routes[route_j])],
+                      route_lengths=[current.route_lengths[route_i], current.route_lengths[route_j]],
+                      steps=[]))
+
+        # Add to solutions list
+        solutions.append(copy.deepcopy(current))
+
+    if strategy == "first":
+        where = customer_positions(current.routes)
+        bits = DontLookBits(where)
+        for customer in bits:
+            route_a, pos = where[customer]
+            move = None
+            for candidate_set in candidate_sets:
+                for candidate in _customer_cross_exchanges(current.routes, route_a, pos, max_segment_length,
+                                                           candidate_set, where):
+                    delta = move_delta(*candidate)
+                    if delta is not None and delta < -IMPROVEMENT_EPS:
+                        move = candidate
+                        break
+                if move is not None:
+                    break
+            if move is None:
+                continue
+
+            # Customers at both ends of the four removed edges are scanned again
+            route_i, start_i, end_i, route_j, start_j, end_j = move
+            a, b = current.routes[route_i], current.routes[route_j]
+            bits.reset((a[start_i - 1], a[start_i], a[end_i], a[end_i + 1],
+                        b[start_j - 1], b[start_j], b[end_j], b[end_j + 1]))
+            apply_move(*move)
+            for r in (route_i, route_j):
+                for p, v in enumerate(current.routes[r][1:-1], start=1):
+                    where[v] = (r, p)
+        return solutions
+
+    def best_pair_move(moves):
+        best = (float('inf'), None)
+        for move in moves:
+            delta = move_delta(*move)
+            if delta is not None and delta < best[0]:
+                best = (delta, move)
+        return best
+
+    while True:
+        best_delta = float('inf')
+        best_move = None
+
+        for candidate_set, cache in zip(candidate_sets, caches):
+            # Segment exchanges between different routes, evaluated only for pairs not in the cache
+            pair_moves = _cross_exchange_moves(current.routes, max_segment_length, candidate_set)
+            best_delta, best_move = cache.best(pair_moves, lambda pair: best_pair_move(pair_moves[pair]))
+
+            if best_delta < -IMPROVEMENT_EPS:
+                break
+
+        # If no improving move found, stop
+        if best_delta >= -IMPROVEMENT_EPS:
+            break
+
+        # Apply the best move
+        apply_move(*best_move)
+
+    return solutions
+
+
+def apply_cross_exchange(routes: List[List[int]], route_i: int, start_i: int, end_i: int,
+                         route_j: int, start_j: int, end_j: int) -> None:
+    """Swap routes[route_i][start_i..end_i] and routes[route_j][start_j..end_j], in place."""
+    segment_i = routes[route_i][start_i:end_i + 1]
+    segment_j = routes[route_j][start_j:end_j + 1]
+    routes[route_i][start_i:end_i + 1] = segment_j
+    routes[route_j][start_j:end_j + 1] = segment_i
+
+
+def check_cross_exchange_delta_correctness(D: np.ndarray, current: VRPResult, route_i: int, start_i: int, end_i: int,
+                                           route_j: int, start_j: int, end_j: int, delta: float) -> bool:
+    """Verify the correctness of the CROSS-exchange delta calculation by reconstructing both routes"""
+    routes = [route[:] for route in current.routes]
+    apply_cross_exchange(routes, route_i, start_i, end_i, route_j, start_j, end_j)
+    old_length = current.route_lengths[route_i] + current.route_lengths[route_j]
+    new_length = calculate_route_length(D, routes[route_i]) + calculate_route_length(D, routes[route_j])
+    return abs(new_length - old_length - delta) < 1e-6
@@ -0,0 +1,196 @@
+import copy
+from collections import defaultdict
+from itertools import product
+from typing import Optional
+from vrp_viz.local_search.util import *
+from vrp_viz.map_viz.stepwise_map import VRPResult
+from vrp_viz.neighbors import NeighborIndex
+
+
+def _exchange_moves(routes: List[List[int]], neighbors: Optional[NeighborIndex] = None):
+    """
+    Exchange candidates grouped by route pair: {(route_i, route_j): (pos_i, pos_j) pairs} with
+    route_i < route_j, pairs and positions in scan order. The full neighborhood is generated lazily.
+    With neighbors, a customer is only exchanged with one of its neighbors.
+    """
+    if neighbors is None:
+        return {
+            (route_i, route_j): product(range(1, len(routes[route_i]) - 1), range(1, len(routes[route_j]) - 1))
+            for route_i in range(len(routes))
+            for route_j in range(route_i + 1, len(routes))
+        }
+
+    where = customer_positions(routes)
+    moves = set()
+    for route_a, route in enumerate(routes):
+        for pos_a in range(1, len(route) - 1):
+            for route_b, pos_b in _exchange_partners(routes, route_a, pos_a, neighbors, where):
+                moves.add((route_a, pos_a, route_b, pos_b) if route_a < route_b else (route_b, pos_b, route_a, pos_a))
+    pair_moves = defaultdict(list)
+    for route_i, pos_i, route_j, pos_j in sorted(moves):
+        pair_moves[route_i, route_j].append((pos_i, pos_j))
+    return pair_moves
+
+
+def _exchange_partners(routes: List[List[int]], route_a: int, pos_a: int,
+                       neighbors: Optional[NeighborIndex] = None, where=None):
+    """
+    (route_b, pos_b) customers in other routes the customer at routes[route_a][pos_a] can be
+    exchanged with. With neighbors, only its neighbors (where: customer_positions).
+    """
+    if neighbors is None:
+        return [
+            (route_b, pos_b)
+            for route_b in range(len(routes)) if route_b != route_a
+            for pos_b in range(1, len(routes[route_b]) - 1)
+        ]
+    partners = []
+    for v in neighbors[routes[route_a][pos_a]]:
+        loc = where.get(v)
+        if loc is not None and loc[0] != route_a:
+            partners.append(loc)
+    return partners
+
+
+def exchange_local_search(
+        D: np.ndarray,
+        demands: List[float],
+        vehicle_capacity: float,
+        max_stops_per_route,  # Ignored
+        num_vehicles,  # Ignored
+        depot_idx,  # Ignored
+        current_solution: VRPResult,
+        neighbors: Optional[NeighborIndex] = None,
+        strategy: str = "best",
+) -> List[VRPResult]:
+    """
+    Exchange move: Inter-route move that swaps two customers of different routes
+
+    With neighbors, each iteration first scans only the granular moves and falls back
+    to the full neighborhood when none of them improves.
+
+    strategy="best": apply the best move of the whole neighborhood each iteration. The best
+    move of each route pair is cached (one MoveCache per candidate set); a move only rewrites
+    two routes, so only the pairs involving them are evaluated again.
+    strategy="first": apply the first improving move of each customer, scanning customers
+    with don't-look bits (reset for the customers around the modified edges).
+    """
+    if strategy not in ("best", "first"):
+        raise ValueError(f"Unknown local search strategy {strategy!r}")
+    solutions = [current_solution]
+    current = copy.deepcopy(current_solution)
+    loads = RouteLoads(current.routes, demands)
+    candidate_sets = (neighbors, None) if neighbors is not None else (None,)
+    caches = [MoveCache() for _ in candidate_sets]
+
+    def move_delta(route_i, pos_i, route_j, pos_j):
+        """Delta of the move, or None if it violates capacity."""
+        # Check capacity constraints (O(1) from the route loads)
+        demand_i = demands[current.routes[route_i][pos_i]]
+        demand_j = demands[current.routes[route_j][pos_j]]
+        if loads.load(route_i) - demand_i + demand_j > vehicle_capacity or \
+                loads.load(route_j) - demand_j + demand_i > vehicle_capacity:
+            return None
+
+        # Calculate delta
+        delta = calculate_exchange_delta(D, current.routes, route_i, pos_i, route_j, pos_j)
+
+        # Verify correctness. Comment this out when done testing for a BOOM speed up.
+        # if not check_exchange_delta_correctness(D, current, route_i, pos_i, route_j, pos_j, delta):
+        #     raise ValueError("Exchange delta calculation error")
+        return delta
+
+    def apply_move(route_i, pos_i, route_j, pos_j):
+        # Snapshot before move
+        solutions.append(VRPResult(routes=[copy.deepcopy(current.routes[route_i]), copy.deepcopy(current.routes[route_j])],
+                                   route_lengths=[current.route_lengths[route_i], current.route_lengths[route_j]],
+                                   steps=[]))
+
+        # Exchange customers
+        current.routes[route_i][pos_i], current.routes[route_j][pos_j] = \
+            current.routes[route_j][pos_j], current.routes[route_i][pos_i]
+        loads.update(route_i, current.routes[route_i])
+        loads.update(route_j, current.routes[route_j])
+        for cache in caches:
+            cache.invalidate(route_i, route_j)
+
+        # Update route lengths
+        current.route_lengths[route_i] = calculate_route_length(D, current.routes[route_i])
+        current.route_lengths[route_j] = calculate_route_length(D, current.routes[route_j])
+
+        # Snapshot after move
+        solutions.append(
+            VRPResult(routes=[copy.deepcopy(current.routes[route_i]), copy.deepcopy(current.routes[route_j])],
+                      route_lengths=[current.route_lengths[route_i], current.route_lengths[route_j]],
+                      steps=[]))
+
+        # Add to solutions list
+        solutions.append(copy.deepcopy(current))
+
+    if strategy == "first":
+        where = customer_positions(current.routes)
+        bits = DontLookBits(where)
+        for customer in bits:
+            route_a, pos_a = where[customer]
+            move = None
+            for candidate_set in candidate_sets:
+                for route_b, pos_b in _exchange_partners(current.routes, route_a, pos_a, candidate_set, where):
+                    delta = move_delta(route_a, pos_a, route_b, pos_b)
+                    if delta is not None and delta < -IMPROVEMENT_EPS:
+                        move = (route_a, pos_a, route_b, pos_b)
+                        break
+                if move is not None:
+                    break
+            if move is None:
+                continue
+
+            # Both customers and their neighbors on the routes are scanned again
+            route_i, pos_i, route_j, pos_j = move
+            bits.reset(current.routes[r][p + d] for r, p in ((route_i, pos_i), (route_j, pos_j)) for d in (-1, 0, 1))
+            apply_move(*move)
+            where[current.routes[route_i][pos_i]] = (route_i, pos_i)
+            where[current.routes[route_j][pos_j]] = (route_j, pos_j)
+        return solutions
+
+    def best_pair_move(route_i, route_j, positions):
+        best = (float('inf'), None)
+        for pos_i, pos_j in positions:
+            delta = move_delta(route_i, pos_i, route_j, pos_j)
+            if delta is not None and delta < best[0]:
+                best = (delta, (route_i, pos_i, route_j, pos_j))
+        return best
+
+    while True:
+        best_delta = float('inf')
+        best_move = None
+
+        for candidate_set, cache in zip(candidate_sets, caches):
+            # Exchanges between different routes, evaluated only for pairs not in the cache
+            pair_moves = _exchange_moves(current.routes, candidate_set)
+            best_delta, best_move = cache.best(
+                pair_moves, lambda pair: best_pair_move(pair[0], pair[1], pair_moves[pair])
+            )
+
+            if best_delta < -IMPROVEMENT_EPS:
+                break
+
+        # If no improving move found, stop
+        if best_delta >= -IMPROVEMENT_EPS:
+            break
+
+        # Apply the best move
+        apply_move(*best_move)
+
+    return solutions
+
+
+def check_exchange_delta_correctness(D: np.ndarray, current: VRPResult,
+                                     route_i: int, pos_i: int, route_j: int, pos_j: int, delta: float) -> bool:
+    """Verify the correctness of the exchange delta calculation by reconstructing both routes"""
+    new_route_i = current.routes[route_i][:]
+    new_route_j = current.routes[route_j][:]
+    new_route_i[pos_i], new_route_j[pos_j] = new_route_j[pos_j], new_route_i[pos_i]
+
+    old_length = current.route_lengths[route_i] + current.route_lengths[route_j]
+    new_length = calculate_route_length(D, new_route_i) + calculate_route_length(D, new_route_j)
+    return abs(new_length - old_length - delta) < 1e-6
@@ -0,0 +1,263 @@
+import copy
+from collections import defaultdict
+from typing import Optional
+from vrp_viz.local_search.util import *
+from vrp_viz.map_viz.stepwise_map import VRPResult
+from vrp_viz.neighbors import NeighborIndex
+
+
+def _segments(route: List[int], max_length: int):
+    """Yield every (start, end) segment of 1..max_length consecutive customers."""
+    for start in range(1, len(route) - 1):
+        for end in range(start, min(start + max_length, len(route) - 1)):
+            yield start, end
+
+
+def _valid_insertion(route_a: int, start: int, end: int, route_b: int, pos_b: int) -> bool:
+    # Within one route the insertion edge must not touch the segment
+    return route_a != route_b or pos_b <= start - 1 or pos_b >= end + 2
+
+
+def _orientations(start: int, end: int):
+    return (False, True) if end > start else (False,)
+
+
+def _route_or_opts(routes: List[List[int]], route_a: int, route_b: int, max_length: int):
+    """Yield every (route_a, start, end, route_b, pos_b, reverse) move of a segment of route_a into route_b."""
+    for start, end in _segments(routes[route_a], max_length):
+        for pos_b in range(1, len(routes[route_b])):
+            if _valid_insertion(route_a, start, end, route_b, pos_b):
+                for reverse in _orientations(start, end):
+                    yield route_a, start, end, route_b, pos_b, reverse
+
+
+def _pair_or_opts(routes: List[List[int]], key, max_length: int):
+    """Moves of one cache key: (route,) -> within the route, (route_i, route_j) -> both directions."""
+    if len(key) == 1:
+        yield from _route_or_opts(routes, key[0], key[0], max_length)
+    else:
+        yield from _route_or_opts(routes, key[0], key[1], max_length)
+        yield from _route_or_opts(routes, key[1], key[0], max_length)
+
+
+def _move_key(move):
+    route_a, route_b = move[0], move[3]
+    return (route_a,) if route_a == route_b else (min(route_a, route_b), max(route_a, route_b))
+
+
+def _customer_or_opts(routes: List[List[int]], route_a: int, pos: int, max_length: int,
+                      neighbors: Optional[NeighborIndex] = None, where=None):
+    """
+    Or-opt moves of the segments that start or end at the customer at routes[route_a][pos].
+    With neighbors, the segment is only inserted so that this customer becomes adjacent to
+    one of its neighbors (where: customer_positions).
+    """
+    route = routes[route_a]
+    segments = {(pos, end) for end in range(pos, min(pos + max_length, len(route) - 1))}
+    segments |= {(start, pos) for start in range(max(1, pos - max_length + 1), pos + 1)}
+
+    moves = []
+    for start, end in sorted(segments):
+        if neighbors is None:
+            for route_b in range(len(routes)):
+                for pos_b in range(1, len(routes[route_b])):
+                    if _valid_insertion(route_a, start, end, route_b, pos_b):
+                        for reverse in _orientations(start, end):
+                            moves.append((route_a, start, end, route_b, pos_b, reverse))
+            continue
+
+        for v in neighbors[route[pos]]:
+            loc = where.get(v)
+            if loc is None or (loc[0] == route_a and start <= loc[1] <= end):
+                continue
+            route_b, q = loc
+            # customer first in the segment: after v as is, or before v reversed (and vice versa for last)
+            candidates = []
+            if pos == start:
+                candidates += [(q + 1, False), (q, True)]
+            if pos == end:
+                candidates += [(q + 1, True), (q, False)]
+            for pos_b, reverse in candidates:
+                if start == end:
+                    reverse = False
+                if _valid_insertion(route_a, start, end, route_b, pos_b):
+                    moves.append((route_a, start, end, route_b, pos_b, reverse))
+    return list(dict.fromkeys(moves))
+
+
+def _or_opt_moves(routes: List[List[int]], max_length: int, neighbors: Optional[NeighborIndex] = None):
+    """
+    Or-opt candidates grouped by cache key ((route,) for moves within a route, (route_i, route_j)
+    for moves between two routes), keys and moves in scan order. The full neighborhood is
+    generated lazily.
+    """
+    if neighbors is None:
+        keys = [(r,) for r in range(len(routes))]
+        keys += [(route_i, route_j) for route_i in range(len(routes)) for route_j in range(route_i + 1, len(routes))]
+        return {key: _pair_or_opts(routes, key, max_length) for key in keys}
+
+    where = customer_positions(routes)
+    moves = set()
+    for route_a, route in enumerate(routes):
+        for pos in range(1, len(route) - 1):
+            moves.update(_customer_or_opts(routes, route_a, pos, max_length, neighbors, where))
+    grouped = defaultdict(list)
+    for move in sorted(moves, key=lambda m: (len(_move_key(m)), _move_key(m), m)):
+        grouped[_move_key(move)].append(move)
+    return grouped
+
+
+def or_opt_local_search(
+        D: np.ndarray,
+        demands: List[float],
+        vehicle_capacity: float,
+        max_stops_per_route,  # Ignored
+        num_vehicles,  # Ignored
+        depot_idx,  # Ignored
+        current_solution: VRPResult,
+        neighbors: Optional[NeighborIndex] = None,
+        strategy: str = "best",
+        max_segment_length: int = 3,
+) -> List[VRPResult]:
+    """
+    Or-opt move: Move a chain of 1..max_segment_length consecutive customers (optionally
+    reversed) to another position of the same route or into another route.
+    Segment loads (RouteLoads) and forward / backward segment costs (RouteCosts) make each
+    candidate O(1). A route emptied by a move stays as [depot, depot] but is left out of
+    the snapshots.
+
+    With neighbors, each iteration first scans only the granular moves and falls back
+    to the full neighborhood when none of them improves.
+
+    strategy="best": apply the best move of the whole neighborhood each iteration. The best
+    move of each route and route pair is cached (one MoveCache per candidate set); only the
+    keys involving the modified routes are evaluated again.
+    strategy="first": apply the first improving move of each customer (segments starting or
+    ending at it), scanning customers with don't-look bits.
+    """
+    if strategy not in ("best", "first"):
+        raise ValueError(f"Unknown local search strategy {strategy!r}")
+    solutions = [current_solution]
+    current = copy.deepcopy(current_solution)
+    loads = RouteLoads(current.routes, demands)
+    costs = RouteCosts(D, current.routes)
+    candidate_sets = (neighbors, None) if neighbors is not None else (None,)
+    caches = [MoveCache() for _ in candidate_sets]
+
+    def move_delta(route_a, start, end, route_b, pos_b, reverse):
+        """Delta of the move, or None if it violates capacity."""
+        # Check capacity constraint of the receiving route (O(1) from the route loads)
+        if route_a != route_b and loads.load(route_b) + loads.segment(route_a, start, end) > vehicle_capacity:
+            return None
+
+        # Calculate delta
+        delta = calculate_or_opt_delta(D, current.routes, costs, route_a, start, end, route_b, pos_b, reverse)
+
+        # Verify correctness. Comment this out when done testing for a BOOM speed up.
+        # if not check_or_opt_delta_correctness(D, current, route_a, start, end, route_b, pos_b, reverse, delta):
+        #     raise ValueError("Or-opt delta calculation error")
+        return delta
+
+    def snapshot(route_ids):
+        kept = [r for r in dict.fromkeys(route_ids) if len(current.routes[r]) > 2]
+        return VRPResult(routes=[current.routes[r][:] for r in kept],
+                         route_lengths=[current.route_lengths[r] for r in kept],
+                         steps=[])
+
+    def apply_move(route_a, start, end, route_b, pos_b, reverse):
+        # Snapshot before move
+        solutions.append(snapshot((route_a, route_b)))
+
+        # Move the segment
+        apply_or_opt(current.routes, route_a, start, end, route_b, pos_b, reverse)
+        for r in {route_a, route_b}:
+            loads.update(r, current.routes[r])
+            costs.update(r, current.routes[r])
+            current.route_lengths[r] = calculate_route_length(D, current.routes[r])
+        for cache in caches:
+            cache.invalidate(route_a, route_b)
+
+        # Snapshot after move
+        solutions.append(snapshot((route_a, route_b)))
+
+        # Add to solutions list
+        solutions.append(snapshot(range(len(current.routes))))
+
+    if strategy == "first":
+        where = customer_positions(current.routes)
+        bits = DontLookBits(where)
+        for customer in bits:
+            route_a, pos = where[customer]
+            move = None
+            for candidate_set in candidate_sets:
+                for candidate in _customer_or_opts(current.routes, route_a, pos, max_segment_length, candidate_set, where):
+                    delta = move_delta(*candidate)
+                    if delta is not None and delta < -IMPROVEMENT_EPS:
+                        move = candidate
+                        break
+                if move is not None:
+                    break
+            if move is None:
+                continue
+
+            # Customers around the removed and added edges are scanned again
+            route_a, start, end, route_b, pos_b, _ = move
+            route, target = current.routes[route_a], current.routes[route_b]
+            bits.reset((route[start - 1], route[start], route[end], route[end + 1], target[pos_b - 1], target[pos_b]))
+            apply_move(*move)
+            for r in {route_a, route_b}:
+                for p, v in enumerate(current.routes[r][1:-1], start=1):
+                    where[v] = (r, p)
+        return solutions
+
+    def best_key_move(moves):
+        best = (float('inf'), None)
+        for move in moves:
+            delta = move_delta(*move)
+            if delta is not None and delta < best[0]:
+                best = (delta, move)
+        return best
+
+    while True:
+        best_delta = float('inf')
+        best_move = None
+
+        for candidate_set, cache in zip(candidate_sets, caches):
+            # Or-opt moves, evaluated only for routes / route pairs not in the cache
+            key_moves = _or_opt_moves(current.routes, max_segment_length, candidate_set)
+            best_delta, best_move = cache.best(key_moves, lambda key: best_key_move(key_moves[key]))
+
+            if best_delta < -IMPROVEMENT_EPS:
+                break
+
+        # If no improving move found, stop
+        if best_delta >= -IMPROVEMENT_EPS:
+            break
+
+        # Apply the best move
+        apply_move(*best_move)
+
+    return solutions
+
+
+def apply_or_opt(routes: List[List[int]], route_a: int, start: int, end: int,
+                 route_b: int, pos_b: int, reverse: bool) -> None:
+    """Move routes[route_a][start..end] (reversed if asked) just before routes[route_b][pos_b], in place."""
+    segment = routes[route_a][start:end + 1]
+    if reverse:
+        segment.reverse()
+    del routes[route_a][start:end + 1]
+    if route_a == route_b and pos_b > end:
+        pos_b -= len(segment)
+    routes[route_b][pos_b:pos_b] = segment
+
+
+def check_or_opt_delta_correctness(D: np.ndarray, current: VRPResult, route_a: int, start: int, end: int,
+                                   route_b: int, pos_b: int, reverse: bool, delta: float) -> bool:
+    """Verify the correctness of the Or-opt delta calculation by reconstructing the routes"""
+    routes = [route[:] for route in current.routes]
+    apply_or_opt(routes, route_a, start, end, route_b, pos_b, reverse)
+    touched = {route_a, route_b}
+    old_length = sum(current.route_lengths[r] for r in touched)
+    new_length = sum(calculate_route_length(D, routes[r]) for r in touched)
+    return abs(new_length - old_length - delta) < 1e-6
@@ -0,0 +1,205 @@
+import copy
+from collections import defaultdict
+from typing import Optional
+from vrp_viz.local_search.util import *
+from vrp_viz.map_viz.stepwise_map import VRPResult
+from vrp_viz.neighbors import NeighborIndex
+
+
+def _pair_relocations(routes: List[List[int]], route_i: int, route_j: int):
+    """Yield every (route_a, pos_a, route_b, pos_b) relocation between two routes, both directions."""
+    for route_a, route_b in ((route_i, route_j), (route_j, route_i)):
+        for pos_a in range(1, len(routes[route_a]) - 1):
+            for pos_b in range(1, len(routes[route_b])):
+                yield route_a, pos_a, route_b, pos_b
+
+
+def _relocate_moves(routes: List[List[int]], neighbors: Optional[NeighborIndex] = None):
+    """
+    Relocate candidates grouped by route pair: {(route_i, route_j): (route_a, pos_a, route_b, pos_b)
+    moves} with route_i < route_j, the customer at routes[route_a][pos_a] being inserted just
+    before routes[route_b][pos_b]. The full neighborhood is generated lazily.
+    With neighbors, a customer is only inserted right before or after one of its neighbors.
+    """
+    if neighbors is None:
+        return {
+            (route_i, route_j): _pair_relocations(routes, route_i, route_j)
+            for route_i in range(len(routes))
+            for route_j in range(route_i + 1, len(routes))
+        }
+
+    where = customer_positions(routes)
+    moves = set()
+    for route_a, route in enumerate(routes):
+        for pos_a in range(1, len(route) - 1):
+            for route_b, pos_b in _relocate_targets(routes, route_a, pos_a, neighbors, where):
+                moves.add((route_a, pos_a, route_b, pos_b))
+    pair_moves = defaultdict(list)
+    for move in sorted(moves, key=lambda m: (min(m[0], m[2]), max(m[0], m[2]), m)):
+        pair_moves[min(move[0], move[2]), max(move[0], move[2])].append(move)
+    return pair_moves
+
+
+def _relocate_targets(routes: List[List[int]], route_a: int, pos_a: int,
+                      neighbors: Optional[NeighborIndex] = None, where=None):
+    """
+    (route_b, pos_b) insertion points in other routes for the customer at routes[route_a][pos_a].
+    With neighbors, only right before or after one of its neighbors (where: customer_positions).
+    """
+    if neighbors is None:
+        return [
+            (route_b, pos_b)
+            for route_b in range(len(routes)) if route_b != route_a
+            for pos_b in range(1, len(routes[route_b]))
+        ]
+    targets = []
+    for v in neighbors[routes[route_a][pos_a]]:
+        loc = where.get(v)
+        if loc is not None and loc[0] != route_a:
+            targets.append(loc)  # insert before v
+            targets.append((loc[0], loc[1] + 1))  # insert after v
+    return targets
+
+
+def relocate_local_search(
+        D: np.ndarray,
+        demands: List[float],
+        vehicle_capacity: float,
+        max_stops_per_route,  # Ignored
+        num_vehicles,  # Ignored
+        depot_idx,  # Ignored
+        current_solution: VRPResult,
+        neighbors: Optional[NeighborIndex] = None,
+        strategy: str = "best",
+) -> List[VRPResult]:
+    """
+    Relocate move: Inter-route move that removes a customer from its route and inserts it
+    into another route. A route emptied by a move stays as [depot, depot] (so it can take
+    customers back) but is left out of the snapshots.
+
+    With neighbors, each iteration first scans only the granular moves and falls back
+    to the full neighborhood when none of them improves.
+
+    strategy="best": apply the best move of the whole neighborhood each iteration. The best
+    move of each route pair is cached (one MoveCache per candidate set); a move only rewrites
+    two routes, so only the pairs involving them are evaluated again.
+    strategy="first": apply the first improving move of each customer, scanning customers
+    with don't-look bits (reset for the customers around the modified edges).
+    """
+    if strategy not in ("best", "first"):
+        raise ValueError(f"Unknown local search strategy {strategy!r}")
+    solutions = [current_solution]
+    current = copy.deepcopy(current_solution)
+    loads = RouteLoads(current.routes, demands)
+    candidate_sets = (neighbors, None) if neighbors is not None else (None,)
+    caches = [MoveCache() for _ in candidate_sets]
+
+    def move_delta(route_a, pos_a, route_b, pos_b):
+        """Delta of the move, or None if it violates capacity."""
+        # Check capacity constraint of the receiving route (O(1) from the route loads)
+        if loads.load(route_b) + demands[current.routes[route_a][pos_a]] > vehicle_capacity:
+            return None
+
+        # Calculate delta
+        delta = calculate_relocate_delta(D, current.routes, route_a, pos_a, route_b, pos_b)
+
+        # Verify correctness. Comment this out when done testing for a BOOM speed up.
+        # if not check_relocate_delta_correctness(D, current, route_a, pos_a, route_b, pos_b, delta):
+        #     raise ValueError("Relocate delta calculation error")
+        return delta
+
+    def snapshot(route_ids):
+        kept = [r for r in route_ids if len(current.routes[r]) > 2]
+        return VRPResult(routes=[current.routes[r][:] for r in kept],
+                         route_lengths=[current.route_lengths[r] for r in kept],
+                         steps=[])
+
+    def apply_move(route_a, pos_a, route_b, pos_b):
+        # Snapshot before move
+        solutions.append(snapshot((route_a, route_b)))
+
+        # Move the customer
+        customer = current.routes[route_a].pop(pos_a)
+        current.routes[route_b].insert(pos_b, customer)
+        loads.update(route_a, current.routes[route_a])
+        loads.update(route_b, current.routes[route_b])
+        for cache in caches:
+            cache.invalidate(route_a, route_b)
+
+        # Update route lengths
+        current.route_lengths[route_a] = calculate_route_length(D, current.routes[route_a])
+        current.route_lengths[route_b] = calculate_route_length(D, current.routes[route_b])
+
+        # Snapshot after move
+        solutions.append(snapshot((route_a, route_b)))
+
+        # Add to solutions list
+        solutions.append(snapshot(range(len(current.routes))))
+
+    if strategy == "first":
+        where = customer_positions(current.routes)
+        bits = DontLookBits(where)
+        for customer in bits:
+            route_a, pos_a = where[customer]
+            move = None
+            for candidate_set in candidate_sets:
+                for route_b, pos_b in _relocate_targets(current.routes, route_a, pos_a, candidate_set, where):
+                    delta = move_delta(route_a, pos_a, route_b, pos_b)
+                    if delta is not None and delta < -IMPROVEMENT_EPS:
+                        move = (route_a, pos_a, route_b, pos_b)
+                        break
+                if move is not None:
+                    break
+            if move is None:
+                continue
+
+            # Customers around the removed and added edges are scanned again
+            route_a, pos_a, route_b, pos_b = move
+            route, target = current.routes[route_a], current.routes[route_b]
+            bits.reset((route[pos_a - 1], customer, route[pos_a + 1], target[pos_b - 1], target[pos_b]))
+            apply_move(*move)
+            for r in (route_a, route_b):
+                for p, v in enumerate(current.routes[r][1:-1], start=1):
+                    where[v] = (r, p)
+        return solutions
+
+    def best_pair_move(moves):
+        best = (float('inf'), None)
+        for move in moves:
+            delta = move_delta(*move)
+            if delta is not None and delta < best[0]:
+                best = (delta, move)
+        return best
+
+    while True:
+        best_delta = float('inf')
+        best_move = None
+
+        for candidate_set, cache in zip(candidate_sets, caches):
+            # Relocations between different routes, evaluated only for pairs not in the cache
+            pair_moves = _relocate_moves(current.routes, candidate_set)
+            best_delta, best_move = cache.best(pair_moves, lambda pair: best_pair_move(pair_moves[pair]))
+
+            if best_delta < -IMPROVEMENT_EPS:
+                break
+
+        # If no improving move found, stop
+        if best_delta >= -IMPROVEMENT_EPS:
+            break
+
+        # Apply the best move
+        apply_move(*best_move)
+
+    return solutions
+
+
+def check_relocate_delta_correctness(D: np.ndarray, current: VRPResult,
+                                     route_a: int, pos_a: int, route_b: int, pos_b: int, delta: float) -> bool:
+    """Verify the correctness of the relocate delta calculation by reconstructing both routes"""
+    new_route_a = current.routes[route_a][:]
+    new_route_b = current.routes[route_b][:]
+    new_route_b.insert(pos_b, new_route_a.pop(pos_a))
+
+    old_length = current.route_lengths[route_a] + current.route_lengths[route_b]
+    new_length = calculate_route_length(D, new_route_a) + calculate_route_length(D, new_route_b)
+    return abs(new_length - old_length - delta) < 1e-6
@@ -1,6 +1,37 @@
 import copy
+from typing import Optional
 from vrp_viz.local_search.util import *
 from vrp_viz.map_viz.stepwise_map import VRPResult
+from vrp_viz.neighbors import NeighborIndex
+
+
+def _shift_targets(route: List[int], pos_i: int, neighbors: Optional[NeighborIndex] = None, pos_of=None):
+    """
+    Positions pos_j the customer at pos_i can be shifted to (in increasing order).
+    With neighbors, only next to one of its neighbors (pos_of: customer -> position in route).
+    """
+    if neighbors is None:
+        # Skip the same position and adjacent positions
+        return [pos_j for pos_j in range(1, len(route)) if abs(pos_i - pos_j) > 1]
+
+    targets = set()
+    for v in neighbors[route[pos_i]]:
+        p = pos_of.get(v)
+        if p is not None:
+            targets.add(p)  # insert before v
+            targets.add(p + 1)  # insert after v
+    return [pos_j for pos_j in sorted(targets) if abs(pos_i - pos_j) > 1]
+
+
+def _shift_positions(route: List[int], neighbors: Optional[NeighborIndex] = None):
+    """
+    Yield (pos_i, pos_j) shift candidates for one route.
+    With neighbors, the customer at pos_i is only moved next to one of its neighbors.
+    """
+    pos_of = {v: p for p, v in enumerate(route[1:-1], start=1)} if neighbors is not None else None
+    for pos_i in range(1, len(route) - 1):
+        for pos_j in _shift_targets(route, pos_i, neighbors, pos_of):
+            yield pos_i, pos_j
 
 
 def shift_local_search(
@@ -10,52 +41,31 @@ def shift_local_search(
         max_stops_per_route,  # Ignored
         num_vehicles,  # Ignored
         depot_idx,  # Ignored
-        current_solution: VRPResult
+        current_solution: VRPResult,
+        neighbors: Optional[NeighborIndex] = None,
+        strategy: str = "best",
 ) -> List[VRPResult]:
     """
     Shift move: Remove a customer from one position and insert it at another position
     (intra-route only - same route)
+
+    With neighbors, each iteration first scans only the granular moves and falls back
+    to the full neighborhood when none of them improves.
+
+    strategy="best": apply the best move of the whole neighborhood each iteration. The best
+    move of each route is cached (one MoveCache per candidate set); a move only changes one
+    route, so only that route is evaluated again.
+    strategy="first": apply the first improving move of each customer, scanning customers
+    with don't-look bits (reset for the customers around the modified edges).
     """
+    if strategy not in ("best", "first"):
+        raise ValueError(f"Unknown local search strategy {strategy!r}")
     solutions = [current_solution]
     current = copy.deepcopy(current_solution)
+    candidate_sets = (neighbors, None) if neighbors is not None else (None,)
+    caches = [MoveCache() for _ in candidate_sets]
 
-    while True:
-        best_delta = float('inf')
-        best_move = None
-
-        # Try all possible shift moves within each route
-        for route_idx in range(len(current.routes)):
-            route = current.routes[route_idx]
-            # Skip routes with less than 4 nodes (depot-customer1-customer2-depot minimum)
-            if len(route) < 4:
-                continue
-
-            # Skip depot nodes (first and last are always depot)
-            for pos_i in range(1, len(route) - 1):
-
-                # Try inserting to all other positions in the same route
-                for pos_j in range(1, len(route)):
-                    # Skip the same position and adjacent positions
-                    if abs(pos_i - pos_j) <= 1:
-                        continue
-
-                    # Calculate delta
-                    delta = calculate_shift_delta_intra(D, route, pos_i, pos_j)
-
-                    # Verify correctness. Comment this out when done testing for a BOOM speed up.
-                    # if not check_shift_delta_correctness(D, current, route_idx, pos_i, pos_j, delta):
-                    #     raise ValueError("Shift delta calculation error")
-
-                    if delta < best_delta:
-                        best_delta = delta
-                        best_move = (route_idx, pos_i, pos_j)
-
-        # If no improving move found, stop
-        if best_delta >= 0:
-            break
-
-        # Apply the best move
-        route_idx, pos_i, pos_j = best_move
+    def apply_move(route_idx, pos_i, pos_j):
         customer = current.routes[route_idx][pos_i]
 
         # Snapshot before move
@@ -76,6 +86,8 @@ def shift_local_search(
         # Update route length
         current.route_lengths[route_idx] = calculate_route_length(D, current.routes[route_idx])
         # current.route_lengths[route_idx] += best_delta
+        for cache in caches:
+            cache.invalidate(route_idx)
 
         # Snapshot after move
         solutions.append(VRPResult(routes=[copy.deepcopy(current.routes[route_idx])],
@@ -85,6 +97,74 @@ def shift_local_search(
         # Add to solutions list
         solutions.append(copy.deepcopy(current))
 
+    if strategy == "first":
+        where = customer_positions(current.routes)
+        bits = DontLookBits(where)
+        for customer in bits:
+            route_idx, pos_i = where[customer]
+            route = current.routes[route_idx]
+            if len(route) < 4:
+                continue
+            pos_of = {v: p for p, v in enumerate(route[1:-1], start=1)}
+            move = None
+            for candidate_set in candidate_sets:
+                for pos_j in _shift_targets(route, pos_i, candidate_set, pos_of):
+                    if calculate_shift_delta_intra(D, route, pos_i, pos_j) < -IMPROVEMENT_EPS:
+                        move = pos_j
+                        break
+                if move is not None:
+                    break
+            if move is None:
+                continue
+
+            # Customers around the removed and added edges are scanned again
+            bits.reset((route[pos_i - 1], customer, route[pos_i + 1], route[move - 1], route[move]))
+            apply_move(route_idx, pos_i, move)
+            for p, v in enumerate(current.routes[route_idx][1:-1], start=1):
+                where[v] = (route_idx, p)
+        return solutions
+
+    def best_route_move(route_idx, candidate_set):
+        best = (float('inf'), None)
+        route = current.routes[route_idx]
+        # Skip routes with less than 4 nodes (depot-customer1-customer2-depot minimum)
+        if len(route) < 4:
+            return best
+
+        # Skip depot nodes (first and last are always depot)
+        for pos_i, pos_j in _shift_positions(route, candidate_set):
+            # Calculate delta
+            delta = calculate_shift_delta_intra(D, route, pos_i, pos_j)
+
+            # Verify correctness. Comment this out when done testing for a BOOM speed up.
+            # if not check_shift_delta_correctness(D, current, route_idx, pos_i, pos_j, delta):
+            #     raise ValueError("Shift delta calculation error")
+
+            if delta < best[0]:
+                best = (delta, (route_idx, pos_i, pos_j))
+        return best
+
+    while True:
+        best_delta = float('inf')
+        best_move = None
+
+        for candidate_set, cache in zip(candidate_sets, caches):
+            # Try all possible shift moves within each route (cached per route)
+            best_delta, best_move = cache.best(
+                ((route_idx,) for route_idx in range(len(current.routes))),
+                lambda key: best_route_move(key[0], candidate_set),
+            )
+
+            if best_delta < -IMPROVEMENT_EPS:
+                break
+
+        # If no improving move found, stop
+        if best_delta >= -IMPROVEMENT_EPS:
+            break
+
+        # Apply the best move
+        apply_move(*best_move)
+
     return solutions
 
 
@@ -1,6 +1,41 @@
 import copy
+from typing import Optional
 from vrp_viz.local_search.util import *
 from vrp_viz.map_viz.stepwise_map import VRPResult
+from vrp_viz.neighbors import NeighborIndex
+
+
+def _swap_positions(route: List[int], neighbors: Optional[NeighborIndex] = None):
+    """
+    Yield (pos_i, pos_j) swap candidates (pos_i < pos_j) for one route.
+    With neighbors, only customers that are neighbors of each other are swapped.
+    """
+    if neighbors is None:
+        for pos_i in range(1, len(route) - 1):
+            for pos_j in range(pos_i + 1, len(route) - 1):
+                yield pos_i, pos_j
+        return
+
+    pos_of = {v: p for p, v in enumerate(route[1:-1], start=1)}
+    pairs = set()
+    for pos_i in range(1, len(route) - 1):
+        for v in neighbors[route[pos_i]]:
+            p = pos_of.get(v)
+            if p is not None and p != pos_i:
+                pairs.add((min(pos_i, p), max(pos_i, p)))
+    yield from sorted(pairs)
+
+
+def _swap_partners(route: List[int], pos_i: int, neighbors: Optional[NeighborIndex] = None, pos_of=None):
+    """
+    Positions pos_j != pos_i the customer at pos_i can be swapped with (in increasing order).
+    With neighbors, only its neighbors on the route (pos_of: customer -> position in route).
+    """
+    if neighbors is None:
+        return [pos_j for pos_j in range(1, len(route) - 1) if pos_j != pos_i]
+    partners = {pos_of[v] for v in neighbors[route[pos_i]] if v in pos_of}
+    partners.discard(pos_i)
+    return sorted(partners)
 
 
 def swap_local_search(
@@ -10,48 +45,31 @@ def swap_local_search(
         max_stops_per_route,  # Ignored
         num_vehicles,  # Ignored
         depot_idx,  # Ignored
-        current_solution: VRPResult
+        current_solution: VRPResult,
+        neighbors: Optional[NeighborIndex] = None,
+        strategy: str = "best",
 ) -> List[VRPResult]:
     """
     Swap move: Exchange positions of two customers
     (intra-route only - same route)
+
+    With neighbors, each iteration first scans only the granular moves and falls back
+    to the full neighborhood when none of them improves.
+
+    strategy="best": apply the best move of the whole neighborhood each iteration. The best
+    move of each route is cached (one MoveCache per candidate set); a move only changes one
+    route, so only that route is evaluated again.
+    strategy="first": apply the first improving move of each customer, scanning customers
+    with don't-look bits (reset for the customers around the modified edges).
     """
+    if strategy not in ("best", "first"):
+        raise ValueError(f"Unknown local search strategy {strategy!r}")
     solutions = [current_solution]
     current = copy.deepcopy(current_solution)
+    candidate_sets = (neighbors, None) if neighbors is not None else (None,)
+    caches = [MoveCache() for _ in candidate_sets]
 
-    while True:
-        best_delta = float('inf')
-        best_move = None
-
-        # Try all possible swap moves within each route
-        for route_idx in range(len(current.routes)):
-            route = current.routes[route_idx]
-            # Skip routes with less than 4 nodes (depot-customer1-customer2-depot minimum)
-            if len(route) < 4:
-                continue
-
-            # Skip depot nodes
-            for pos_i in range(1, len(route) - 1):
-                for pos_j in range(pos_i + 1, len(route) - 1):
-
-                    # Calculate delta
-                    delta = calculate_swap_delta_intra(D, route, pos_i, pos_j)
-
-                    # Verify correctness. Comment this out when done testing for a BOOM speed up.
-                    # if not check_swap_delta_correctness(D, current, route_idx, pos_i, pos_j, delta):
-                    #     raise ValueError("Swap delta calculation error")
-
-                    if delta < best_delta:
-                        best_delta = delta
-                        best_move = (route_idx, pos_i, pos_j)
-
-        # If no improving move found, stop
-        if best_delta >= 0:
-            break
-
-        # Apply the best move
-        route_idx, pos_i, pos_j = best_move
-
+    def apply_move(route_idx, pos_i, pos_j, delta):
         # Snapshot before move
         solutions.append(VRPResult(routes=[copy.deepcopy(current.routes[route_idx])],
                                    route_lengths=[current.route_lengths[route_idx]],
@@ -62,7 +80,9 @@ def swap_local_search(
             current.routes[route_idx][pos_j], current.routes[route_idx][pos_i]
 
         # Update route length
-        current.route_lengths[route_idx] += best_delta
+        current.route_lengths[route_idx] += delta
+        for cache in caches:
+            cache.invalidate(route_idx)
 
         # Snapshot after move
         solutions.append(VRPResult(routes=[copy.deepcopy(current.routes[route_idx])],
@@ -72,6 +92,77 @@ def swap_local_search(
         # Add to solutions list
         solutions.append(copy.deepcopy(current))
 
+    if strategy == "first":
+        where = customer_positions(current.routes)
+        bits = DontLookBits(where)
+        for customer in bits:
+            route_idx, pos_i = where[customer]
+            route = current.routes[route_idx]
+            if len(route) < 4:
+                continue
+            pos_of = {v: p for p, v in enumerate(route[1:-1], start=1)}
+            move = None
+            for candidate_set in candidate_sets:
+                for pos_j in _swap_partners(route, pos_i, candidate_set, pos_of):
+                    delta = calculate_swap_delta_intra(D, route, pos_i, pos_j)
+                    if delta < -IMPROVEMENT_EPS:
+                        move = (pos_j, delta)
+                        break
+                if move is not None:
+                    break
+            if move is None:
+                continue
+
+            # Both customers and their neighbors on the route are scanned again
+            pos_j, delta = move
+            bits.reset(route[p + d] for p in (pos_i, pos_j) for d in (-1, 0, 1))
+            apply_move(route_idx, pos_i, pos_j, delta)
+            where[route[pos_i]] = (route_idx, pos_i)
+            where[route[pos_j]] = (route_idx, pos_j)
+        return solutions
+
+    def best_route_move(route_idx, candidate_set):
+        best = (float('inf'), None)
+        route = current.routes[route_idx]
+        # Skip routes with less than 4 nodes (depot-customer1-customer2-depot minimum)
+        if len(route) < 4:
+            return best
+
+        # Skip depot nodes
+        for pos_i, pos_j in _swap_positions(route, candidate_set):
+
+            # Calculate delta
+            delta = calculate_swap_delta_intra(D, route, pos_i, pos_j)
+
+            # Verify correctness. Comment this out when done testing for a BOOM speed up.
+            # if not check_swap_delta_correctness(D, current, route_idx, pos_i, pos_j, delta):
+            #     raise ValueError("Swap delta calculation error")
+
+            if delta < best[0]:
+                best = (delta, (route_idx, pos_i, pos_j))
+        return best
+
+    while True:
+        best_delta = float('inf')
+        best_move = None
+
+        for candidate_set, cache in zip(candidate_sets, caches):
+            # Try all possible swap moves within each route (cached per route)
+            best_delta, best_move = cache.best(
+                ((route_idx,) for route_idx in range(len(current.routes))),
+                lambda key: best_route_move(key[0], candidate_set),
+            )
+
+            if best_delta < -IMPROVEMENT_EPS:
+                break
+
+        # If no improving move found, stop
+        if best_delta >= -IMPROVEMENT_EPS:
+            break
+
+        # Apply the best move
+        apply_move(*best_move, best_delta)
+
     return solutions
 
 
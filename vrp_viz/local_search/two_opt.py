@@ -0,0 +1,180 @@
+import copy
+from typing import Optional
+from vrp_viz.local_search.util import *
+from vrp_viz.map_viz.stepwise_map import VRPResult
+from vrp_viz.neighbors import NeighborIndex
+
+
+def _two_opt_segments(route: List[int], pos: int, neighbors: Optional[NeighborIndex] = None, pos_of=None):
+    """
+    (pos_i, pos_j) segments to reverse that start or end at the customer at pos.
+    With neighbors, only reversals that link it to one of its neighbors
+    (pos_of: customer -> position in route).
+    """
+    if neighbors is None:
+        return [(pos_i, pos) for pos_i in range(1, pos)] + [(pos, pos_j) for pos_j in range(pos + 1, len(route) - 1)]
+
+    segments = set()
+    for v in neighbors[route[pos]]:
+        q = pos_of.get(v)
+        if q is None:
+            continue
+        if q > pos + 1:
+            segments.add((pos, q - 1))  # new edge route[pos] -> v
+        elif q < pos - 1:
+            segments.add((q + 1, pos))  # new edge v -> route[pos]
+    return sorted(segments)
+
+
+def _two_opt_positions(route: List[int], neighbors: Optional[NeighborIndex] = None):
+    """
+    Yield (pos_i, pos_j) segments (pos_i < pos_j) to reverse in one route.
+    With neighbors, only reversals that create an edge between two neighbors.
+    """
+    if neighbors is None:
+        for pos_i in range(1, len(route) - 1):
+            for pos_j in range(pos_i + 1, len(route) - 1):
+                yield pos_i, pos_j
+        return
+
+    pos_of = {v: p for p, v in enumerate(route[1:-1], start=1)}
+    segments = set()
+    for pos in range(1, len(route) - 1):
+        segments.update(_two_opt_segments(route, pos, neighbors, pos_of))
+    yield from sorted(segments)
+
+
+def two_opt_local_search(
+        D: np.ndarray,
+        demands: List[float],
+        vehicle_capacity: float,
+        max_stops_per_route,  # Ignored
+        num_vehicles,  # Ignored
+        depot_idx,  # Ignored
+        current_solution: VRPResult,
+        neighbors: Optional[NeighborIndex] = None,
+        strategy: str = "best",
+) -> List[VRPResult]:
+    """
+    2-opt move: Reverse a segment of a route
+    (intra-route only - same route)
+
+    Forward and reverse cumulative path costs per route (RouteCosts) make each delta O(1),
+    also for asymmetric matrices where the reversed segment costs differ.
+
+    With neighbors, each iteration first scans only the granular moves and falls back
+    to the full neighborhood when none of them improves.
+
+    strategy="best": apply the best move of the whole neighborhood each iteration. The best
+    move of each route is cached (one MoveCache per candidate set); a move only changes one
+    route, so only that route is evaluated again.
+    strategy="first": apply the first improving move of each customer, scanning customers
+    with don't-look bits (reset for the customers around the modified edges).
+    """
+    if strategy not in ("best", "first"):
+        raise ValueError(f"Unknown local search strategy {strategy!r}")
+    solutions = [current_solution]
+    current = copy.deepcopy(current_solution)
+    costs = RouteCosts(D, current.routes)
+    candidate_sets = (neighbors, None) if neighbors is not None else (None,)
+    caches = [MoveCache() for _ in candidate_sets]
+
+    def move_delta(route_idx, pos_i, pos_j):
+        # Calculate delta
+        delta = calculate_two_opt_delta(D, current.routes[route_idx], costs, route_idx, pos_i, pos_j)
+
+        # Verify correctness. Comment this out when done testing for a BOOM speed up.
+        # if not check_two_opt_delta_correctness(D, current, route_idx, pos_i, pos_j, delta):
+        #     raise ValueError("2-opt delta calculation error")
+        return delta
+
+    def apply_move(route_idx, pos_i, pos_j):
+        # Snapshot before move
+        solutions.append(VRPResult(routes=[copy.deepcopy(current.routes[route_idx])],
+                                   route_lengths=[current.route_lengths[route_idx]],
+                                   steps=[]))
+
+        # Reverse the segment
+        route = current.routes[route_idx]
+        route[pos_i:pos_j + 1] = route[pos_i:pos_j + 1][::-1]
+        costs.update(route_idx, route)
+        for cache in caches:
+            cache.invalidate(route_idx)
+
+        # Update route length
+        current.route_lengths[route_idx] = calculate_route_length(D, route)
+
+        # Snapshot after move
+        solutions.append(VRPResult(routes=[copy.deepcopy(current.routes[route_idx])],
+                                   route_lengths=[current.route_lengths[route_idx]],
+                                   steps=[]))
+
+        # Add to solutions list
+        solutions.append(copy.deepcopy(current))
+
+    if strategy == "first":
+        where = customer_positions(current.routes)
+        bits = DontLookBits(where)
+        for customer in bits:
+            route_idx, pos = where[customer]
+            route = current.routes[route_idx]
+            pos_of = {v: p for p, v in enumerate(route[1:-1], start=1)}
+            move = None
+            for candidate_set in candidate_sets:
+                for pos_i, pos_j in _two_opt_segments(route, pos, candidate_set, pos_of):
+                    if move_delta(route_idx, pos_i, pos_j) < -IMPROVEMENT_EPS:
+                        move = (pos_i, pos_j)
+                        break
+                if move is not None:
+                    break
+            if move is None:
+                continue
+
+            # Customers at both ends of the two removed edges are scanned again
+            pos_i, pos_j = move
+            bits.reset((route[pos_i - 1], route[pos_i], route[pos_j], route[pos_j + 1]))
+            apply_move(route_idx, pos_i, pos_j)
+            for p in range(pos_i, pos_j + 1):
+                where[route[p]] = (route_idx, p)
+        return solutions
+
+    def best_route_move(route_idx, candidate_set):
+        best = (float('inf'), None)
+        route = current.routes[route_idx]
+        for pos_i, pos_j in _two_opt_positions(route, candidate_set):
+            delta = move_delta(route_idx, pos_i, pos_j)
+            if delta < best[0]:
+                best = (delta, (route_idx, pos_i, pos_j))
+        return best
+
+    while True:
+        best_delta = float('inf')
+        best_move = None
+
+        for candidate_set, cache in zip(candidate_sets, caches):
+            # Try all possible segment reversals within each route (cached per route)
+            best_delta, best_move = cache.best(
+                ((route_idx,) for route_idx in range(len(current.routes))),
+                lambda key: best_route_move(key[0], candidate_set),
+            )
+
+            if best_delta < -IMPROVEMENT_EPS:
+                break
+
+        # If no improving move found, stop
+        if best_delta >= -IMPROVEMENT_EPS:
+            break
+
+        # Apply the best move
+        apply_move(*best_move)
+
+    return solutions
+
+
+def check_two_opt_delta_correctness(D: np.ndarray, current: VRPResult,
+                                    route_idx: int, pos_i: int, pos_j: int, delta: float) -> bool:
+    """Verify the correctness of the 2-opt delta calculation by reconstructing the route"""
+    route = current.routes[route_idx][:]
+    route[pos_i:pos_j + 1] = route[pos_i:pos_j + 1][::-1]
+    new_length = calculate_route_length(D, route)
+    return abs(new_length - current.route_lengths[route_idx] - delta) < 1e-6
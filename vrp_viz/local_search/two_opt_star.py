@@ -1,6 +1,61 @@
 import copy
+from collections import defaultdict
+from itertools import product
+from typing import Optional
 from vrp_viz.local_search.util import *
 from vrp_viz.map_viz.stepwise_map import VRPResult
+from vrp_viz.neighbors import NeighborIndex
+
+
+def _two_opt_star_cuts(routes: List[List[int]], neighbors: Optional[NeighborIndex] = None):
+    """
+    2-opt* candidates grouped by route pair: {(route_i, route_j): (cut_i, cut_j) pairs} with
+    route_i < route_j, pairs and cuts in scan order. The full neighborhood is generated lazily.
+    With neighbors, only cuts where one new edge links a customer to one of its neighbors.
+    """
+    if neighbors is None:
+        return {
+            (route_i, route_j): product(range(1, len(routes[route_i]) - 1), range(1, len(routes[route_j]) - 1))
+            for route_i in range(len(routes))
+            for route_j in range(route_i + 1, len(routes))
+        }
+
+    where = customer_positions(routes)
+    moves = set()
+    for route_a, route in enumerate(routes):
+        for cut_a in range(1, len(route) - 1):
+            # new edge route[cut_a] -> v: v becomes the first node of the tail taken from route_b
+            for v in neighbors[route[cut_a]]:
+                loc = where.get(v)
+                if loc is None or loc[0] == route_a or loc[1] < 2:
+                    continue
+                route_b, cut_b = loc[0], loc[1] - 1
+                moves.add((route_a, cut_a, route_b, cut_b) if route_a < route_b else (route_b, cut_b, route_a, cut_a))
+    pair_cuts = defaultdict(list)
+    for route_i, cut_i, route_j, cut_j in sorted(moves):
+        pair_cuts[route_i, route_j].append((cut_i, cut_j))
+    return pair_cuts
+
+
+def _two_opt_star_partner_cuts(routes: List[List[int]], route_a: int, cut_a: int,
+                               neighbors: Optional[NeighborIndex] = None, where=None):
+    """
+    (route_b, cut_b) tails that can be exchanged with the tail after routes[route_a][cut_a].
+    With neighbors, only tails starting at a neighbor of that customer (where: customer_positions).
+    """
+    if neighbors is None:
+        return [
+            (route_b, cut_b)
+            for route_b in range(len(routes)) if route_b != route_a
+            for cut_b in range(1, len(routes[route_b]) - 1)
+        ]
+    partners = []
+    for v in neighbors[routes[route_a][cut_a]]:
+        loc = where.get(v)
+        if loc is not None and loc[0] != route_a and loc[1] >= 2:
+            partners.append((loc[0], loc[1] - 1))
+    return partners
+
 
 def two_opt_star_local_search(
         D: np.ndarray,
@@ -9,58 +64,51 @@ def two_opt_star_local_search(
         max_stops_per_route,  # Ignored
         num_vehicles,  # Ignored
         depot_idx,  # Ignored
-        current_solution: VRPResult
+        current_solution: VRPResult,
+        neighbors: Optional[NeighborIndex] = None,
+        strategy: str = "best",
 ) -> List[VRPResult]:
     """
     2-opt* move: Inter-route move that exchanges tails of two routes
+
+    With neighbors, each iteration first scans only the granular moves and falls back
+    to the full neighborhood when none of them improves.
+
+    strategy="best": apply the best move of the whole neighborhood each iteration. The best
+    move of each route pair is cached (one MoveCache per candidate set); a move only rewrites
+    two routes, so only the pairs involving them are evaluated again.
+    strategy="first": apply the first improving move of each customer (cutting right after
+    it), scanning customers with don't-look bits (reset for the ends of the modified edges).
     """
+    if strategy not in ("best", "first"):
+        raise ValueError(f"Unknown local search strategy {strategy!r}")
     solutions = [current_solution]
     current = copy.deepcopy(current_solution)
+    loads = RouteLoads(current.routes, demands)
+    candidate_sets = (neighbors, None) if neighbors is not None else (None,)
+    caches = [MoveCache() for _ in candidate_sets]
 
-    while True:
-        best_delta = float('inf')
-        best_move = None
-
-        # Try all possible 2-opt* moves between different routes
-        for route_i in range(len(current.routes)):
-            route1 = current.routes[route_i]
-            for route_j in range(route_i + 1, len(current.routes)):
-                route2 = current.routes[route_j]
+    def move_delta(route_i, cut_i, route_j, cut_j):
+        """Delta of the move, or None if it violates capacity."""
+        # Check capacity constraints (O(1) from the cumulative loads)
+        # New route1: route1[:cut_i+1] + route2[cut_j+1:-1] + [0]
+        # New route2: route2[:cut_j+1] + route1[cut_i+1:-1] + [0]
 
-                # Try all cut points
-                for cut_i in range(1, len(route1) - 1):
-                    for cut_j in range(1, len(route2) - 1):
+        new_demand1 = loads.head(route_i, cut_i) + loads.tail(route_j, cut_j)
+        new_demand2 = loads.head(route_j, cut_j) + loads.tail(route_i, cut_i)
 
-                        # Check capacity constraints
-                        # New route1: route1[:cut_i+1] + route2[cut_j+1:-1] + [0]
-                        # New route2: route2[:cut_j+1] + route1[cut_i+1:-1] + [0]
+        if new_demand1 > vehicle_capacity or new_demand2 > vehicle_capacity:
+            return None
 
-                        new_demand1 = sum(demands[c] for c in route1[1:cut_i + 1]) + \
-                                      sum(demands[c] for c in route2[cut_j + 1:-1])
-                        new_demand2 = sum(demands[c] for c in route2[1:cut_j + 1]) + \
-                                      sum(demands[c] for c in route1[cut_i + 1:-1])
+        # Calculate delta
+        delta = calculate_two_opt_star_delta(D, current.routes, route_i, cut_i, route_j, cut_j)
 
-                        if new_demand1 > vehicle_capacity or new_demand2 > vehicle_capacity:
-                            continue
-
-                        # Calculate delta
-                        delta = calculate_two_opt_star_delta(D, current.routes, route_i, cut_i, route_j, cut_j)
-
-                        # Verify correctness. Comment this out when done testing for a BOOM speed up.
-                        # if not check_two_opt_star_delta_correctness(D, current, route_i, cut_i, route_j, cut_j, delta):
-                        #     raise ValueError("2-opt* delta calculation error")
-
-                        if delta < best_delta:
-                            best_delta = delta
-                            best_move = (route_i, cut_i, route_j, cut_j)
-
-        # If no improving move found, stop
-        if best_delta >= 0:
-            break
-
-        # Apply the best move
-        route_i, cut_i, route_j, cut_j = best_move
+        # Verify correctness. Comment this out when done testing for a BOOM speed up.
+        # if not check_two_opt_star_delta_correctness(D, current, route_i, cut_i, route_j, cut_j, delta):
+        #     raise ValueError("2-opt* delta calculation error")
+        return delta
 
+    def apply_move(route_i, cut_i, route_j, cut_j):
         # Store original routes
         route1 = current.routes[route_i][:]
         route2 = current.routes[route_j][:]
@@ -73,6 +121,10 @@ def two_opt_star_local_search(
         # Create new routes by exchanging tails
         current.routes[route_i] = route1[:cut_i + 1] + route2[cut_j + 1:]
         current.routes[route_j] = route2[:cut_j + 1] + route1[cut_i + 1:]
+        loads.update(route_i, current.routes[route_i])
+        loads.update(route_j, current.routes[route_j])
+        for cache in caches:
+            cache.invalidate(route_i, route_j)
 
         # Update route lengths
         current.route_lengths[route_i] = calculate_route_length(D, current.routes[route_i])
@@ -87,6 +139,62 @@ def two_opt_star_local_search(
         # Add to solutions list
         solutions.append(copy.deepcopy(current))
 
+    if strategy == "first":
+        where = customer_positions(current.routes)
+        bits = DontLookBits(where)
+        for customer in bits:
+            route_a, cut_a = where[customer]
+            move = None
+            for candidate_set in candidate_sets:
+                for route_b, cut_b in _two_opt_star_partner_cuts(current.routes, route_a, cut_a, candidate_set, where):
+                    candidate = (route_a, cut_a, route_b, cut_b) if route_a < route_b else (route_b, cut_b, route_a, cut_a)
+                    delta = move_delta(*candidate)
+                    if delta is not None and delta < -IMPROVEMENT_EPS:
+                        move = candidate
+                        break
+                if move is not None:
+                    break
+            if move is None:
+                continue
+
+            # Customers at both ends of the two removed edges are scanned again
+            route_i, cut_i, route_j, cut_j = move
+            bits.reset(current.routes[r][c + d] for r, c in ((route_i, cut_i), (route_j, cut_j)) for d in (0, 1))
+            apply_move(*move)
+            for r in (route_i, route_j):
+                for p, v in enumerate(current.routes[r][1:-1], start=1):
+                    where[v] = (r, p)
+        return solutions
+
+    def best_pair_move(route_i, route_j, cuts):
+        best = (float('inf'), None)
+        for cut_i, cut_j in cuts:
+            delta = move_delta(route_i, cut_i, route_j, cut_j)
+            if delta is not None and delta < best[0]:
+                best = (delta, (route_i, cut_i, route_j, cut_j))
+        return best
+
+    while True:
+        best_delta = float('inf')
+        best_move = None
+
+        for candidate_set, cache in zip(candidate_sets, caches):
+            # 2-opt* moves between different routes, evaluated only for pairs not in the cache
+            pair_cuts = _two_opt_star_cuts(current.routes, candidate_set)
+            best_delta, best_move = cache.best(
+                pair_cuts, lambda pair: best_pair_move(pair[0], pair[1], pair_cuts[pair])
+            )
+
+            if best_delta < -IMPROVEMENT_EPS:
+                break
+
+        # If no improving move found, stop
+        if best_delta >= -IMPROVEMENT_EPS:
+            break
+
+        # Apply the best move
+        apply_move(*best_move)
+
     return solutions
 
 
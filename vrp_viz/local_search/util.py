@@ -1,7 +1,13 @@
 # Helper functions for delta calculations
-from typing import List
+from collections import deque
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
 import numpy as np
 
+# A move is applied only if it shortens the solution by more than this. Rounding-noise deltas
+# (e.g. reversing a whole route on a symmetric matrix gives -1e-14) would otherwise be applied
+# back and forth forever.
+IMPROVEMENT_EPS = 1e-9
+
 
 def calculate_shift_delta_intra(D: np.ndarray, route: List[int], pos_i: int, pos_j: int) -> float:
     """Calculate delta for intra-route shift move"""
@@ -68,6 +74,21 @@ def calculate_swap_delta_intra(D: np.ndarray, route: List[int], pos_i: int, pos_
     return delta
 
 
+def calculate_two_opt_delta(D: np.ndarray, route: List[int], costs: "RouteCosts",
+                             route_idx: int, pos_i: int, pos_j: int) -> float:
+    """Delta for reversing route[pos_i..pos_j] (intra-route 2-opt), O(1) with the cumulative costs"""
+    prev_i = route[pos_i - 1]
+    next_j = route[pos_j + 1]
+
+    # Replace the two boundary edges
+    delta = D[prev_i, route[pos_j]] + D[route[pos_i], next_j] - D[prev_i, route[pos_i]] - D[route[pos_j], next_j]
+
+    # The segment itself is now travelled backwards (differs from forward when D is asymmetric)
+    delta += costs.segment_reversed(route_idx, pos_i, pos_j) - costs.segment(route_idx, pos_i, pos_j)
+
+    return delta
+
+
 def calculate_two_opt_star_delta(D: np.ndarray, routes: List[List[int]],
                                  route_i: int, cut_i: int, route_j: int, cut_j: int) -> float:
     """Calculate delta for 2-opt* move without reconstructing the entire solution"""
@@ -89,6 +110,214 @@ def calculate_two_opt_star_delta(D: np.ndarray, routes: List[List[int]],
     return delta
 
 
+class RouteLoads:
+    """
+    Cumulative demand of each route, indexed like the route itself (depot at both ends):
+    prefix[r][p] = demand of routes[r][1:p + 1], so prefix[r][0] == 0 and prefix[r][-1] is the load.
+    Any head / tail / segment load is then O(1); call update() for every route a move rewrites.
+    """
+
+    def __init__(self, routes: List[List[int]], demands: List[float]):
+        self.demands = demands
+        self.prefix = [self._cumulative(route) for route in routes]
+
+    def _cumulative(self, route: List[int]) -> List[float]:
+        prefix = [0]
+        for c in route[1:-1]:
+            prefix.append(prefix[-1] + self.demands[c])
+        prefix.append(prefix[-1])
+        return prefix
+
+    def update(self, r: int, route: List[int]) -> None:
+        self.prefix[r] = self._cumulative(route)
+
+    def load(self, r: int) -> float:
+        return self.prefix[r][-1]
+
+    def head(self, r: int, cut: int) -> float:
+        """Demand of the customers up to and including position cut."""
+        return self.prefix[r][cut]
+
+    def tail(self, r: int, cut: int) -> float:
+        """Demand of the customers after position cut."""
+        return self.prefix[r][-1] - self.prefix[r][cut]
+
+    def segment(self, r: int, start: int, end: int) -> float:
+        """Demand of the customers at positions start..end (inclusive)."""
+        return self.prefix[r][end] - self.prefix[r][start - 1]
+
+
+class RouteCosts:
+    """
+    Forward and reverse cumulative path costs of each route, indexed like the route:
+    forward[r][p] = cost of routes[r][0] -> ... -> routes[r][p],
+    reverse[r][p] = cost of the same edges travelled backwards (routes[r][p] -> ... -> routes[r][0]).
+    The cost of any segment in either direction is then O(1), also for asymmetric D.
+    Call update() for every route a move rewrites.
+    """
+
+    def __init__(self, D: np.ndarray, routes: List[List[int]]):
+        self.D = D
+        self.forward: List[List[float]] = []
+        self.reverse: List[List[float]] = []
+        for route in routes:
+            forward, reverse = self._cumulative(route)
+            self.forward.append(forward)
+            self.reverse.append(reverse)
+
+    def _cumulative(self, route: List[int]) -> Tuple[List[float], List[float]]:
+        forward, reverse = [0.0], [0.0]
+        for a, b in zip(route[:-1], route[1:]):
+            forward.append(forward[-1] + self.D[a, b])
+            reverse.append(reverse[-1] + self.D[b, a])
+        return forward, reverse
+
+    def update(self, r: int, route: List[int]) -> None:
+        self.forward[r], self.reverse[r] = self._cumulative(route)
+
+    def segment(self, r: int, start: int, end: int) -> float:
+        """Cost of routes[r][start] -> ... -> routes[r][end]."""
+        return self.forward[r][end] - self.forward[r][start]
+
+    def segment_reversed(self, r: int, start: int, end: int) -> float:
+        """Cost of routes[r][end] -> ... -> routes[r][start]."""
+        return self.reverse[r][end] - self.reverse[r][start]
+
+
+class MoveCache:
+    """
+    Best move per key, kept across iterations of a best-improvement search.
+    A key is a tuple of route indices: (route,) for intra-route operators, (route_i, route_j)
+    for inter-route ones. After a move only the keys involving a modified route are
+    re-evaluated, the others reuse their cached (delta, move).
+    """
+
+    def __init__(self):
+        self._best: Dict[Tuple[int, ...], Tuple[float, Optional[Hashable]]] = {}
+
+    def best(self, keys: Iterable[Tuple[int, ...]], evaluate: Callable) -> Tuple[float, Optional[Hashable]]:
+        """
+        Smallest (delta, move) over keys; evaluate(key) -> (delta, move) fills missing entries.
+        Ties keep the first key, as a full scan in key order would.
+        """
+        best_delta, best_move = float('inf'), None
+        for key in keys:
+            entry = self._best.get(key)
+            if entry is None:
+                entry = self._best[key] = evaluate(key)
+            if entry[0] < best_delta:
+                best_delta, best_move = entry
+        return best_delta, best_move
+
+    def invalidate(self, *routes: int) -> None:
+        """Drop every key that involves one of the modified routes."""
+        touched = set(routes)
+        self._best = {key: entry for key, entry in self._best.items() if touched.isdisjoint(key)}
+
+
+class DontLookBits:
+    """
+    Don't-look bits for first-improvement search. Customers are scanned in queue order; once
+    none of a customer's moves improves, its bit stays on (it is skipped) until reset() is
+    called for it, i.e. until an applied move modifies one of its edges.
+    """
+
+    def __init__(self, customers: Iterable[int]):
+        self._queue = deque(customers)
+        self._customers = set(self._queue)
+        self._queued = set(self._queue)
+
+    def __iter__(self):
+        while self._queue:
+            customer = self._queue.popleft()
+            self._queued.discard(customer)
+            yield customer
+
+    def reset(self, nodes: Iterable[int]) -> None:
+        """Switch the bits of nodes off again (the depot and unknown nodes are ignored)."""
+        for v in nodes:
+            if v in self._customers and v not in self._queued:
+                self._queued.add(v)
+                self._queue.append(v)
+
+
+def customer_positions(routes: List[List[int]]) -> Dict[int, Tuple[int, int]]:
+    """customer -> (route index, position in the route)"""
+    return {v: (r, p) for r, route in enumerate(routes) for p, v in enumerate(route[1:-1], start=1)}
+
+
+def calculate_relocate_delta(D: np.ndarray, routes: List[List[int]],
+                             route_a: int, pos_a: int, route_b: int, pos_b: int) -> float:
+    """Delta for moving routes[route_a][pos_a] into another route, just before routes[route_b][pos_b]"""
+    customer = routes[route_a][pos_a]
+    prev_a, next_a = routes[route_a][pos_a - 1], routes[route_a][pos_a + 1]
+    prev_b, next_b = routes[route_b][pos_b - 1], routes[route_b][pos_b]
+
+    # Remove customer from route a
+    delta = D[prev_a, next_a] - D[prev_a, customer] - D[customer, next_a]
+
+    # Insert customer between prev_b and next_b
+    delta += D[prev_b, customer] + D[customer, next_b] - D[prev_b, next_b]
+
+    return delta
+
+
+def calculate_exchange_delta(D: np.ndarray, routes: List[List[int]],
+                             route_a: int, pos_a: int, route_b: int, pos_b: int) -> float:
+    """Delta for swapping routes[route_a][pos_a] and routes[route_b][pos_b] (different routes)"""
+    customer_a = routes[route_a][pos_a]
+    customer_b = routes[route_b][pos_b]
+    prev_a, next_a = routes[route_a][pos_a - 1], routes[route_a][pos_a + 1]
+    prev_b, next_b = routes[route_b][pos_b - 1], routes[route_b][pos_b + 1]
+
+    # customer_b takes the place of customer_a and vice versa
+    delta = D[prev_a, customer_b] + D[customer_b, next_a] - D[prev_a, customer_a] - D[customer_a, next_a]
+    delta += D[prev_b, customer_a] + D[customer_a, next_b] - D[prev_b, customer_b] - D[customer_b, next_b]
+
+    return delta
+
+
+def calculate_or_opt_delta(D: np.ndarray, routes: List[List[int]], costs: "RouteCosts",
+                           route_a: int, start: int, end: int, route_b: int, pos_b: int, reverse: bool) -> float:
+    """
+    Delta for moving the segment routes[route_a][start..end] just before routes[route_b][pos_b]
+    (optionally reversed). Also valid within one route when pos_b <= start - 1 or pos_b >= end + 2.
+    """
+    route = routes[route_a]
+    first, last = route[start], route[end]
+    prev, nxt = route[start - 1], route[end + 1]
+    prev_b, next_b = routes[route_b][pos_b - 1], routes[route_b][pos_b]
+    head, tail = (last, first) if reverse else (first, last)
+
+    # Remove the segment from route a
+    delta = D[prev, nxt] - D[prev, first] - D[last, nxt]
+
+    # Insert it between prev_b and next_b
+    delta += D[prev_b, head] + D[tail, next_b] - D[prev_b, next_b]
+
+    # A reversed segment is travelled backwards (differs from forward when D is asymmetric)
+    if reverse:
+        delta += costs.segment_reversed(route_a, start, end) - costs.segment(route_a, start, end)
+
+    return delta
+
+
+def calculate_cross_exchange_delta(D: np.ndarray, routes: List[List[int]], route_a: int, start_a: int, end_a: int,
+                                   route_b: int, start_b: int, end_b: int) -> float:
+    """Delta for swapping segments routes[route_a][start_a..end_a] and routes[route_b][start_b..end_b]"""
+    a, b = routes[route_a], routes[route_b]
+
+    # Remove the four boundary edges
+    delta = -D[a[start_a - 1], a[start_a]] - D[a[end_a], a[end_a + 1]]
+    delta -= D[b[start_b - 1], b[start_b]] + D[b[end_b], b[end_b + 1]]
+
+    # Each segment is reconnected (same direction) in the other route
+    delta += D[a[start_a - 1], b[start_b]] + D[b[end_b], a[end_a + 1]]
+    delta += D[b[start_b - 1], a[start_a]] + D[a[end_a], b[end_b + 1]]
+
+    return delta
+
+
 def calculate_route_length(D: np.ndarray, route: List[int]) -> float:
     """Calculate the total length of a route"""
     if len(route) < 2:
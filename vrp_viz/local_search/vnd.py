@@ -0,0 +1,497 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, Optional, Sequence
+from vrp_viz.local_search.util import *
+from vrp_viz.map_viz.stepwise_map import VRPResult
+from vrp_viz.neighbors import NeighborIndex
+from vrp_viz.local_search.cross_exchange import (
+    _cross_exchange_moves, _customer_cross_exchanges, apply_cross_exchange,
+)
+from vrp_viz.local_search.exchange import _exchange_moves, _exchange_partners
+from vrp_viz.local_search.or_opt import _customer_or_opts, _or_opt_moves, apply_or_opt
+from vrp_viz.local_search.relocate import _relocate_moves, _relocate_targets
+from vrp_viz.local_search.shift import _shift_positions, _shift_targets
+from vrp_viz.local_search.swap import _swap_partners, _swap_positions
+from vrp_viz.local_search.two_opt import _two_opt_positions, _two_opt_segments
+from vrp_viz.local_search.two_opt_star import _two_opt_star_cuts, _two_opt_star_partner_cuts
+
+
+class SolutionState:
+    """
+    Mutable solution shared by all neighborhoods of a VND run: the routes (edited in place),
+    customer positions, cumulative loads (RouteLoads) and forward / reverse path costs
+    (RouteCosts, whose last entry is the route length).
+
+    The best-move caches of every neighborhood live here too. commit() refreshes the
+    derived data of the rewritten routes and invalidates them in every cache, so when the
+    descent comes back to a neighborhood only the routes changed in between are scanned again.
+    """
+
+    def __init__(self, D: np.ndarray, demands: List[float], vehicle_capacity: float,
+                 routes: List[List[int]], neighbors: Optional[NeighborIndex] = None):
+        self.D = D
+        self.demands = demands
+        self.vehicle_capacity = vehicle_capacity
+        self.neighbors = neighbors
+        self.routes = [route[:] for route in routes]
+        self.where = customer_positions(self.routes)
+        self.loads = RouteLoads(self.routes, demands)
+        self.costs = RouteCosts(D, self.routes)
+        self._caches: Dict[Tuple[str, int], MoveCache] = {}
+
+    @property
+    def candidate_sets(self):
+        """Granular candidates first, the full neighborhood as fallback."""
+        return (self.neighbors, None) if self.neighbors is not None else (None,)
+
+    def route_length(self, r: int) -> float:
+        return self.costs.forward[r][-1]
+
+    def total_length(self) -> float:
+        return sum(self.route_length(r) for r in range(len(self.routes)))
+
+    def cache(self, name: str, candidate_set: int) -> MoveCache:
+        """Best-move cache of one neighborhood and candidate set (created on first use)."""
+        key = (name, candidate_set)
+        if key not in self._caches:
+            self._caches[key] = MoveCache()
+        return self._caches[key]
+
+    def commit(self, *routes: int) -> None:
+        """Refresh the data of the routes a move rewrote and drop them from every cache."""
+        for r in set(routes):
+            self.loads.update(r, self.routes[r])
+            self.costs.update(r, self.routes[r])
+            for p, v in enumerate(self.routes[r][1:-1], start=1):
+                self.where[v] = (r, p)
+        for cache in self._caches.values():
+            cache.invalidate(*routes)
+
+    def edges(self, routes: Iterable[int]) -> set:
+        return {(a, b) for r in set(routes) for a, b in zip(self.routes[r][:-1], self.routes[r][1:])}
+
+    def snapshot(self, route_ids: Iterable[int]) -> VRPResult:
+        """VRPResult of the given routes (emptied routes left out)."""
+        kept = [r for r in dict.fromkeys(route_ids) if len(self.routes[r]) > 2]
+        return VRPResult(routes=[self.routes[r][:] for r in kept],
+                         route_lengths=[self.route_length(r) for r in kept],
+                         steps=[])
+
+
+class Neighborhood(ABC):
+    """
+    One operator of the VND, stateless: moves are tuples read from and applied to a SolutionState.
+    Subclasses give the candidates (grouped by cache key for best improvement, per customer
+    for first improvement), the delta of a move (None if infeasible) and how to apply it.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def candidates(self, state: SolutionState, candidate_set: Optional[NeighborIndex]):
+        """{key: moves} with key (route,) or (route_i, route_j), as in MoveCache."""
+
+    @abstractmethod
+    def customer_moves(self, state: SolutionState, customer: int, candidate_set: Optional[NeighborIndex]):
+        """Moves involving the customer, in scan order."""
+
+    @abstractmethod
+    def delta(self, state: SolutionState, move) -> Optional[float]:
+        """Length change of the move, None if it violates capacity."""
+
+    @abstractmethod
+    def routes(self, move) -> Tuple[int, ...]:
+        """Routes the move rewrites."""
+
+    @abstractmethod
+    def apply(self, state: SolutionState, move) -> None:
+        """Rewrite state.routes in place (SolutionState.commit() is called afterwards)."""
+
+    def best_move(self, state: SolutionState) -> Tuple[float, Optional[tuple]]:
+        """Best (delta, move), granular candidates first, using the shared caches."""
+        best_delta, best_move = float('inf'), None
+        for index, candidate_set in enumerate(state.candidate_sets):
+            key_moves = self.candidates(state, candidate_set)
+            best_delta, best_move = state.cache(self.name, index).best(
+                key_moves, lambda key: self._best_of(state, key_moves[key])
+            )
+            if best_delta < -IMPROVEMENT_EPS:
+                break
+        return best_delta, best_move
+
+    def first_move(self, state: SolutionState, customer: int) -> Optional[tuple]:
+        """First improving move involving the customer, granular candidates first."""
+        for candidate_set in state.candidate_sets:
+            for move in self.customer_moves(state, customer, candidate_set):
+                delta = self.delta(state, move)
+                if delta is not None and delta < -IMPROVEMENT_EPS:
+                    return move
+        return None
+
+    def _best_of(self, state: SolutionState, moves):
+        best = (float('inf'), None)
+        for move in moves:
+            delta = self.delta(state, move)
+            if delta is not None and delta < best[0]:
+                best = (delta, move)
+        return best
+
+
+def _route_positions(state: SolutionState, r: int) -> Dict[int, int]:
+    return {v: p for p, v in enumerate(state.routes[r][1:-1], start=1)}
+
+
+def _route_moves(r: int, positions):
+    """Lazily turn (pos_i, pos_j) pairs of route r into (r, pos_i, pos_j) moves."""
+    for pos_i, pos_j in positions:
+        yield r, pos_i, pos_j
+
+
+def _pair_moves(route_i: int, route_j: int, positions):
+    """Lazily turn (pos_i, pos_j) pairs of two routes into (route_i, pos_i, route_j, pos_j) moves."""
+    for pos_i, pos_j in positions:
+        yield route_i, pos_i, route_j, pos_j
+
+
+class ShiftNeighborhood(Neighborhood):
+    """Move a customer to another position of its route; moves (route, pos_i, pos_j)."""
+
+    name = "shift"
+
+    def candidates(self, state, candidate_set):
+        return {
+            (r,): _route_moves(r, _shift_positions(route, candidate_set))
+            for r, route in enumerate(state.routes) if len(route) >= 4
+        }
+
+    def customer_moves(self, state, customer, candidate_set):
+        r, pos_i = state.where[customer]
+        route = state.routes[r]
+        if len(route) < 4:
+            return []
+        pos_of = _route_positions(state, r)
+        return [(r, pos_i, pos_j) for pos_j in _shift_targets(route, pos_i, candidate_set, pos_of)]
+
+    def delta(self, state, move):
+        r, pos_i, pos_j = move
+        return calculate_shift_delta_intra(state.D, state.routes[r], pos_i, pos_j)
+
+    def routes(self, move):
+        return move[0],
+
+    def apply(self, state, move):
+        r, pos_i, pos_j = move
+        route = state.routes[r]
+        customer = route.pop(pos_i)
+        route.insert(pos_j - 1 if pos_j > pos_i else pos_j, customer)
+
+
+class SwapNeighborhood(Neighborhood):
+    """Exchange two customers of the same route; moves (route, pos_i, pos_j)."""
+
+    name = "swap"
+
+    def candidates(self, state, candidate_set):
+        return {
+            (r,): _route_moves(r, _swap_positions(route, candidate_set))
+            for r, route in enumerate(state.routes) if len(route) >= 4
+        }
+
+    def customer_moves(self, state, customer, candidate_set):
+        r, pos_i = state.where[customer]
+        route = state.routes[r]
+        if len(route) < 4:
+            return []
+        pos_of = _route_positions(state, r)
+        return [(r, pos_i, pos_j) for pos_j in _swap_partners(route, pos_i, candidate_set, pos_of)]
+
+    def delta(self, state, move):
+        r, pos_i, pos_j = move
+        return calculate_swap_delta_intra(state.D, state.routes[r], pos_i, pos_j)
+
+    def routes(self, move):
+        return move[0],
+
+    def apply(self, state, move):
+        r, pos_i, pos_j = move
+        route = state.routes[r]
+        route[pos_i], route[pos_j] = route[pos_j], route[pos_i]
+
+
+class TwoOptNeighborhood(Neighborhood):
+    """Reverse a segment of a route; moves (route, pos_i, pos_j)."""
+
+    name = "2-opt-intra"
+
+    def candidates(self, state, candidate_set):
+        return {
+            (r,): _route_moves(r, _two_opt_positions(route, candidate_set))
+            for r, route in enumerate(state.routes)
+        }
+
+    def customer_moves(self, state, customer, candidate_set):
+        r, pos = state.where[customer]
+        pos_of = _route_positions(state, r)
+        return [(r, pos_i, pos_j) for pos_i, pos_j in _two_opt_segments(state.routes[r], pos, candidate_set, pos_of)]
+
+    def delta(self, state, move):
+        r, pos_i, pos_j = move
+        return calculate_two_opt_delta(state.D, state.routes[r], state.costs, r, pos_i, pos_j)
+
+    def routes(self, move):
+        return move[0],
+
+    def apply(self, state, move):
+        r, pos_i, pos_j = move
+        route = state.routes[r]
+        route[pos_i:pos_j + 1] = route[pos_i:pos_j + 1][::-1]
+
+
+class TwoOptStarNeighborhood(Neighborhood):
+    """Exchange the tails of two routes; moves (route_i, cut_i, route_j, cut_j) with route_i < route_j."""
+
+    name = "2-opt"
+
+    def candidates(self, state, candidate_set):
+        pair_cuts = _two_opt_star_cuts(state.routes, candidate_set)
+        return {pair: _pair_moves(*pair, cuts) for pair, cuts in pair_cuts.items()}
+
+    def customer_moves(self, state, customer, candidate_set):
+        route_a, cut_a = state.where[customer]
+        for route_b, cut_b in _two_opt_star_partner_cuts(state.routes, route_a, cut_a, candidate_set, state.where):
+            yield (route_a, cut_a, route_b, cut_b) if route_a < route_b else (route_b, cut_b, route_a, cut_a)
+
+    def delta(self, state, move):
+        route_i, cut_i, route_j, cut_j = move
+        loads = state.loads
+        if loads.head(route_i, cut_i) + loads.tail(route_j, cut_j) > state.vehicle_capacity or \
+                loads.head(route_j, cut_j) + loads.tail(route_i, cut_i) > state.vehicle_capacity:
+            return None
+        return calculate_two_opt_star_delta(state.D, state.routes, route_i, cut_i, route_j, cut_j)
+
+    def routes(self, move):
+        return move[0], move[2]
+
+    def apply(self, state, move):
+        route_i, cut_i, route_j, cut_j = move
+        route1, route2 = state.routes[route_i], state.routes[route_j]
+        state.routes[route_i] = route1[:cut_i + 1] + route2[cut_j + 1:]
+        state.routes[route_j] = route2[:cut_j + 1] + route1[cut_i + 1:]
+
+
+class RelocateNeighborhood(Neighborhood):
+    """Move a customer into another route; moves (route_a, pos_a, route_b, pos_b)."""
+
+    name = "relocate"
+
+    def candidates(self, state, candidate_set):
+        return _relocate_moves(state.routes, candidate_set)
+
+    def customer_moves(self, state, customer, candidate_set):
+        route_a, pos_a = state.where[customer]
+        return [(route_a, pos_a, route_b, pos_b)
+                for route_b, pos_b in _relocate_targets(state.routes, route_a, pos_a, candidate_set, state.where)]
+
+    def delta(self, state, move):
+        route_a, pos_a, route_b, pos_b = move
+        if state.loads.load(route_b) + state.demands[state.routes[route_a][pos_a]] > state.vehicle_capacity:
+            return None
+        return calculate_relocate_delta(state.D, state.routes, route_a, pos_a, route_b, pos_b)
+
+    def routes(self, move):
+        return move[0], move[2]
+
+    def apply(self, state, move):
+        route_a, pos_a, route_b, pos_b = move
+        state.routes[route_b].insert(pos_b, state.routes[route_a].pop(pos_a))
+
+
+class ExchangeNeighborhood(Neighborhood):
+    """Swap two customers of different routes; moves (route_i, pos_i, route_j, pos_j)."""
+
+    name = "exchange"
+
+    def candidates(self, state, candidate_set):
+        pair_moves = _exchange_moves(state.routes, candidate_set)
+        return {pair: _pair_moves(*pair, positions) for pair, positions in pair_moves.items()}
+
+    def customer_moves(self, state, customer, candidate_set):
+        route_a, pos_a = state.where[customer]
+        return [(route_a, pos_a, route_b, pos_b)
+                for route_b, pos_b in _exchange_partners(state.routes, route_a, pos_a, candidate_set, state.where)]
+
+    def delta(self, state, move):
+        route_i, pos_i, route_j, pos_j = move
+        demand_i = state.demands[state.routes[route_i][pos_i]]
+        demand_j = state.demands[state.routes[route_j][pos_j]]
+        if state.loads.load(route_i) - demand_i + demand_j > state.vehicle_capacity or \
+                state.loads.load(route_j) - demand_j + demand_i > state.vehicle_capacity:
+            return None
+        return calculate_exchange_delta(state.D, state.routes, route_i, pos_i, route_j, pos_j)
+
+    def routes(self, move):
+        return move[0], move[2]
+
+    def apply(self, state, move):
+        route_i, pos_i, route_j, pos_j = move
+        state.routes[route_i][pos_i], state.routes[route_j][pos_j] = \
+            state.routes[route_j][pos_j], state.routes[route_i][pos_i]
+
+
+class OrOptNeighborhood(Neighborhood):
+    """Move a chain of customers (optionally reversed); moves (route_a, start, end, route_b, pos_b, reverse)."""
+
+    name = "or-opt"
+
+    def __init__(self, max_segment_length: int = 3):
+        self.max_segment_length = max_segment_length
+
+    def candidates(self, state, candidate_set):
+        return _or_opt_moves(state.routes, self.max_segment_length, candidate_set)
+
+    def customer_moves(self, state, customer, candidate_set):
+        route_a, pos = state.where[customer]
+        return _customer_or_opts(state.routes, route_a, pos, self.max_segment_length, candidate_set, state.where)
+
+    def delta(self, state, move):
+        route_a, start, end, route_b, pos_b, reverse = move
+        if route_a != route_b and \
+                state.loads.load(route_b) + state.loads.segment(route_a, start, end) > state.vehicle_capacity:
+            return None
+        return calculate_or_opt_delta(state.D, state.routes, state.costs, route_a, start, end, route_b, pos_b, reverse)
+
+    def routes(self, move):
+        return move[0], move[3]
+
+    def apply(self, state, move):
+        apply_or_opt(state.routes, *move)
+
+
+class CrossExchangeNeighborhood(Neighborhood):
+    """Swap two chains of customers between routes; moves (route_i, start_i, end_i, route_j, start_j, end_j)."""
+
+    name = "cross"
+
+    def __init__(self, max_segment_length: int = 3):
+        self.max_segment_length = max_segment_length
+
+    def candidates(self, state, candidate_set):
+        return _cross_exchange_moves(state.routes, self.max_segment_length, candidate_set)
+
+    def customer_moves(self, state, customer, candidate_set):
+        route_a, pos = state.where[customer]
+        return _customer_cross_exchanges(state.routes, route_a, pos, self.max_segment_length,
+                                         candidate_set, state.where)
+
+    def delta(self, state, move):
+        route_i, start_i, end_i, route_j, start_j, end_j = move
+        load_i = state.loads.segment(route_i, start_i, end_i)
+        load_j = state.loads.segment(route_j, start_j, end_j)
+        if state.loads.load(route_i) - load_i + load_j > state.vehicle_capacity or \
+                state.loads.load(route_j) - load_j + load_i > state.vehicle_capacity:
+            return None
+        return calculate_cross_exchange_delta(state.D, state.routes, *move)
+
+    def routes(self, move):
+        return move[0], move[3]
+
+    def apply(self, state, move):
+        apply_cross_exchange(state.routes, *move)
+
+
+# Neighborhoods by name (the /local-search improvement types)
+NEIGHBORHOODS = {
+    neighborhood.name: neighborhood
+    for neighborhood in (
+        ShiftNeighborhood(), SwapNeighborhood(), TwoOptNeighborhood(), TwoOptStarNeighborhood(),
+        RelocateNeighborhood(), ExchangeNeighborhood(), OrOptNeighborhood(), CrossExchangeNeighborhood(),
+    )
+}
+
+DEFAULT_VND_ORDER = ("shift", "swap", "2-opt")
+
+
+def variable_neighborhood_descent(
+        state: SolutionState,
+        order: Sequence[str] = DEFAULT_VND_ORDER,
+        strategy: str = "best",
+        on_move: Optional[Callable] = None,
+) -> SolutionState:
+    """
+    Variable Neighborhood Descent on state, in place: search the neighborhoods in order,
+    apply an improving move of the current one and go back to the first neighborhood,
+    move on to the next one when the current one has no improving move. Stops in a local
+    optimum of all of them.
+
+    strategy="best": one best move of the neighborhood (cached per route / route pair in state).
+    strategy="first": descend the neighborhood with first-improvement moves before going back to
+    the first one. Each neighborhood keeps its don't-look bits for the whole run and every move
+    resets them for the customers at the ends of the changed edges, so coming back to a
+    neighborhood only scans the customers touched since.
+
+    on_move(before, after) gets the snapshots of the rewritten routes around each applied move.
+    """
+    if strategy not in ("best", "first"):
+        raise ValueError(f"Unknown local search strategy {strategy!r}")
+    unknown = [name for name in order if name not in NEIGHBORHOODS]
+    if unknown:
+        raise ValueError(f"Unknown neighborhoods {unknown}, expected some of {list(NEIGHBORHOODS)}")
+    neighborhoods = [NEIGHBORHOODS[name] for name in order]
+    # One set of don't-look bits per neighborhood, kept across the passes of the descent
+    bits = {name: DontLookBits(state.where) for name in order} if strategy == "first" else {}
+
+    def apply(neighborhood, move):
+        routes = neighborhood.routes(move)
+        before = state.snapshot(routes) if on_move is not None else None
+        old_edges = state.edges(routes)
+        neighborhood.apply(state, move)
+        changed = old_edges ^ state.edges(routes)
+        state.commit(*routes)
+        if on_move is not None:
+            on_move(before, state.snapshot(routes))
+        return {v for edge in changed for v in edge}
+
+    k = 0
+    while k < len(neighborhoods):
+        neighborhood = neighborhoods[k]
+        improved = False
+        if strategy == "best":
+            best_delta, best_move = neighborhood.best_move(state)
+            if best_delta < -IMPROVEMENT_EPS:
+                apply(neighborhood, best_move)
+                improved = True
+        else:
+            for customer in bits[neighborhood.name]:
+                move = neighborhood.first_move(state, customer)
+                if move is not None:
+                    changed = apply(neighborhood, move)
+                    for neighborhood_bits in bits.values():
+                        neighborhood_bits.reset(changed)
+                    improved = True
+        k = 0 if improved else k + 1
+    return state
+
+
+def vnd_local_search(
+        D: np.ndarray,
+        demands: List[float],
+        vehicle_capacity: float,
+        max_stops_per_route,  # Ignored
+        num_vehicles,  # Ignored
+        depot_idx,  # Ignored
+        current_solution: VRPResult,
+        neighbors: Optional[NeighborIndex] = None,
+        strategy: str = "best",
+        order: Sequence[str] = DEFAULT_VND_ORDER,
+) -> List[VRPResult]:
+    """
+    VND over the neighborhoods in order (names of NEIGHBORHOODS) in a single call.
+
+    All neighborhoods work on one SolutionState: route lengths come from its cumulative
+    costs and nothing is deep-copied. The history keeps the rewritten routes before and
+    after each move, then the final solution.
+    """
+    state = SolutionState(D, demands, vehicle_capacity, current_solution.routes, neighbors)
+    solutions = [current_solution]
+    variable_neighborhood_descent(state, order, strategy, on_move=lambda before, after: solutions.extend((before, after)))
+    solutions.append(state.snapshot(range(len(state.routes))))
+    return solutions
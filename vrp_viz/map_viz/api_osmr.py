@@ -1,7 +1,9 @@
+import os
 import requests
 import json
+import numpy as np
 import pandas as pd
-from typing import Sequence, Dict, Any
+from typing import Sequence, Dict, Any, List, Optional, Tuple, Callable
 
 
 def get_data(file_path: str, max_coordinates: int = 100) -> str:
@@ -38,6 +40,9 @@ def get_matrix(
     base_url: str = "http://router.project-osrm.org",
     profile: str = "driving",
     timeout: int = 60,
+    sources: Optional[Sequence[int]] = None,
+    destinations: Optional[Sequence[int]] = None,
+    cache: Optional["MatrixCache"] = None,
 ) -> Dict[str, Any]:
     """Fetch OSRM table (matrix) with selected annotations (distance, duration).
 
@@ -53,14 +58,42 @@ def get_matrix(
         Routing profile: driving, driving-hgv, foot, bicycle.
     timeout : int
         Request timeout in seconds.
+    sources : Sequence[int], optional
+        Indices (into ``coordinates``) used as rows of the table. None -> all.
+    destinations : Sequence[int], optional
+        Indices (into ``coordinates``) used as columns of the table. None -> all.
+    cache : MatrixCache, optional
+        Serve the table from this coordinate-keyed cache; only points it has
+        never seen are fetched from OSRM.
 
     Returns
     -------
     dict
         Raw JSON dict from OSRM containing requested matrices.
     """
+    if cache is not None:
+        points = [
+            (float(lat), float(lng))
+            for lng, lat in (c.split(",") for c in coordinates.split(";"))
+        ]
+        matrices = cache.get(
+            points, base_url=base_url, profile=profile, timeout=timeout
+        )
+        rows = list(range(len(points))) if sources is None else list(sources)
+        cols = list(range(len(points))) if destinations is None else list(destinations)
+        data: Dict[str, Any] = {"code": "Ok"}
+        for a in annotations:
+            if a not in matrices:
+                raise ValueError(f"Cache does not hold annotation '{a}'")
+            data[f"{a}s"] = matrices[a][np.ix_(rows, cols)].tolist()
+        return data
+
     annot = ",".join(annotations)
     url = f"{base_url.rstrip('/')}/table/v1/{profile}/{coordinates}?annotations={annot}"
+    if sources is not None:
+        url += "&sources=" + ";".join(str(int(i)) for i in sources)
+    if destinations is not None:
+        url += "&destinations=" + ";".join(str(int(i)) for i in destinations)
     try:
         response = requests.get(url, timeout=timeout, headers={"User-Agent": "vrp-matrix-generator/1.0"})
         response.raise_for_status()
@@ -77,6 +110,42 @@ def get_matrix(
         raise Exception(f"An error occurred while fetching the matrix: {e}")
 
 
+def get_route(
+    coordinates: str,
+    base_url: str = "https://router.project-osrm.org",
+    profile: str = "driving",
+    timeout: int = 20,
+) -> Dict[str, Any]:
+    """Fetch an OSRM route with full GeoJSON geometry.
+
+    Parameters
+    ----------
+    coordinates : str
+        String like 'lon,lat;lon,lat;...' (OSRM expects lon,lat order).
+    base_url : str
+        OSRM server base URL.
+    profile : str
+        Routing profile: driving, driving-hgv, foot, bicycle.
+    timeout : int
+        Request timeout in seconds.
+
+    Returns
+    -------
+    dict
+        Raw JSON dict from OSRM; ``routes[0]`` holds distance, duration, geometry.
+    """
+    url = (
+        f"{base_url.rstrip('/')}/route/v1/{profile}/{coordinates}"
+        "?overview=full&geometries=geojson&steps=false"
+    )
+    response = requests.get(url, timeout=timeout, headers={"User-Agent": "VRP-MapDemo/1.0"})
+    response.raise_for_status()
+    data = response.json()
+    if data.get("code") != "Ok" or not data.get("routes"):
+        raise RuntimeError(f"OSRM returned code={data.get('code')} message={data.get('message')}")
+    return data
+
+
 def parse_coordinates(df: pd.DataFrame) -> str:
     """
     Parse latitude and longitude data from a DataFrame and format it for the API request.
@@ -98,6 +167,334 @@ def parse_coordinates(df: pd.DataFrame) -> str:
     return ";".join(coordinates)
 
 
+def format_coordinates(points: Sequence[Tuple[float, float]]) -> str:
+    """
+    Format a list of (lat, lng) points as an OSRM coordinates string.
+
+    Args:
+        points (Sequence[Tuple[float, float]]): Points in (lat, lng) order.
+
+    Returns:
+        str: Coordinates string 'lng,lat;lng,lat;...'.
+    """
+    return ";".join(f"{lng},{lat}" for lat, lng in points)
+
+
+def _table_to_array(data: Dict[str, Any], annotation: str) -> np.ndarray:
+    """Convert one OSRM table annotation to a float array (null -> NaN)."""
+    key = f"{annotation}s"
+    if key not in data:
+        raise RuntimeError(f"OSRM response is missing '{key}': {list(data.keys())}")
+    return np.array(
+        [[np.nan if v is None else v for v in row] for row in data[key]], dtype=float
+    )
+
+
+def osrm_table(
+    points: Sequence[Tuple[float, float]],
+    annotations: Sequence[str] = ("distance",),
+    sources: Optional[Sequence[int]] = None,
+    destinations: Optional[Sequence[int]] = None,
+    **kwargs,
+) -> Dict[str, np.ndarray]:
+    """
+    OSRM table for (lat, lng) points as float arrays (null -> NaN).
+
+    Args:
+        points (Sequence[Tuple[float, float]]): Points in (lat, lng) order.
+        annotations (Sequence[str]): "distance" (m) and/or "duration" (s).
+        sources, destinations (Sequence[int], optional): Row/column point indices.
+        **kwargs: Forwarded to :func:`get_matrix` (base_url, profile, timeout).
+
+    Returns:
+        Dict[str, np.ndarray]: annotation -> (len(sources), len(destinations)) array.
+    """
+    data = get_matrix(
+        format_coordinates(points),
+        annotations=tuple(annotations),
+        sources=sources,
+        destinations=destinations,
+        **kwargs,
+    )
+    return {a: _table_to_array(data, a) for a in annotations}
+
+
+def _extend_matrices(
+    matrices: Dict[str, np.ndarray],
+    points: Sequence[Tuple[float, float]],
+    new_points: Sequence[Tuple[float, float]],
+    scale: float = 1.0,
+    table: Optional[Callable[..., Dict[str, np.ndarray]]] = None,
+    **kwargs,
+) -> Dict[str, np.ndarray]:
+    """Append new points to every annotation matrix with two table calls.
+
+    ``table(points, annotations, sources, destinations)`` defaults to
+    :func:`osrm_table` with ``kwargs``.
+    """
+    n, k = len(points), len(new_points)
+    for a, matrix in matrices.items():
+        if matrix.shape != (n, n):
+            raise ValueError(f"{a} matrix shape {matrix.shape} does not match {n} points")
+    if k == 0:
+        return {a: np.array(matrix, dtype=float) for a, matrix in matrices.items()}
+    if table is None:
+        def table(pts, annotations, sources=None, destinations=None):
+            return osrm_table(pts, annotations, sources, destinations, **kwargs)
+
+    annotations = tuple(matrices.keys())
+    all_points = list(points) + list(new_points)
+    new_idx = list(range(n, n + k))
+
+    # new -> all (gồm cả khối new x new)
+    rows = table(all_points, annotations, sources=new_idx)
+    # old -> new
+    cols = None
+    if n > 0:
+        cols = table(all_points, annotations, sources=list(range(n)), destinations=new_idx)
+
+    out: Dict[str, np.ndarray] = {}
+    for a, matrix in matrices.items():
+        ext = np.empty((n + k, n + k), dtype=float)
+        ext[:n, :n] = matrix
+        ext[n:, :] = rows[a] * scale
+        if cols is not None:
+            ext[:n, n:] = cols[a] * scale
+        np.fill_diagonal(ext[n:, n:], 0.0)
+        out[a] = ext
+    return out
+
+
+def extend_matrix(
+    matrix: np.ndarray,
+    points: Sequence[Tuple[float, float]],
+    new_points: Sequence[Tuple[float, float]],
+    annotation: str = "distance",
+    scale: float = 1.0,
+    **kwargs,
+) -> np.ndarray:
+    """Append rows/columns for new points to an existing OSRM matrix.
+
+    Only the missing entries are requested: one many-to-all table for the new
+    rows and one all-to-many table for the new columns, i.e. O(k*n) cells
+    instead of the full O((n+k)^2) table.
+
+    Parameters
+    ----------
+    matrix : np.ndarray
+        Existing (n, n) matrix whose order matches ``points``.
+    points : Sequence[Tuple[float, float]]
+        The n points (lat, lng) already in ``matrix``.
+    new_points : Sequence[Tuple[float, float]]
+        The k points (lat, lng) to append, in order.
+    annotation : str, default "distance"
+        OSRM annotation to request: "distance" or "duration".
+    scale : float, default 1.0
+        Factor applied to fetched values (e.g. 1/1000 to keep a km matrix).
+    **kwargs
+        Forwarded to :func:`get_matrix` (base_url, profile, timeout).
+
+    Returns
+    -------
+    np.ndarray
+        (n+k, n+k) matrix; the top-left block is ``matrix`` unchanged.
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    return _extend_matrices({annotation: matrix}, points, new_points, scale, **kwargs)[annotation]
+
+
+def drop_from_matrix(matrix: np.ndarray, drop_idx: Sequence[int]) -> np.ndarray:
+    """
+    Remove the rows and columns of dropped points from a matrix (no API call).
+
+    Args:
+        matrix (np.ndarray): Square matrix.
+        drop_idx (Sequence[int]): Indices of points to remove.
+
+    Returns:
+        np.ndarray: Matrix restricted to the remaining points, order preserved.
+    """
+    matrix = np.asarray(matrix)
+    keep = np.ones(matrix.shape[0], dtype=bool)
+    keep[list(drop_idx)] = False
+    return matrix[np.ix_(keep, keep)]
+
+
+def update_matrix(
+    matrix: np.ndarray,
+    points: Sequence[Tuple[float, float]],
+    removed_idx: Sequence[int] = (),
+    new_points: Sequence[Tuple[float, float]] = (),
+    **kwargs,
+) -> Tuple[np.ndarray, List[Tuple[float, float]]]:
+    """
+    Apply daily order churn to a matrix: drop removed points, then append new ones.
+
+    Args:
+        matrix (np.ndarray): Existing (n, n) matrix ordered like ``points``.
+        points (Sequence[Tuple[float, float]]): Current points (lat, lng).
+        removed_idx (Sequence[int]): Indices of points to remove.
+        new_points (Sequence[Tuple[float, float]]): Points (lat, lng) to add.
+        **kwargs: Forwarded to :func:`extend_matrix`.
+
+    Returns:
+        Tuple[np.ndarray, List[Tuple[float, float]]]: Updated matrix and point list.
+    """
+    removed = set(int(i) for i in removed_idx)
+    kept_points = [p for i, p in enumerate(points) if i not in removed]
+    matrix = drop_from_matrix(matrix, sorted(removed)) if removed else np.asarray(matrix, dtype=float)
+    matrix = extend_matrix(matrix, kept_points, new_points, **kwargs)
+    return matrix, kept_points + list(new_points)
+
+
+class MatrixCache:
+    """Matrix cache keyed by rounded (lat, lng) coordinates.
+
+    The cache holds blocks, each a point set with its full matrices. A request
+    whose points all lie in one block is answered by fancy-indexing that block
+    (``D[np.ix_(idx, idx)]``) without any routing call. Otherwise the block with
+    the largest overlap is extended with only the unseen points (see
+    :func:`extend_matrix`), so a cached larger instance serves all of its subsets.
+
+    Parameters
+    ----------
+    annotations : Sequence[str], default ("distance",)
+        OSRM annotations stored per block.
+    precision : int, default 6
+        Decimal places used to round coordinates into cache keys (~0.1 m).
+    scale : float, default 1.0
+        Factor applied to values fetched from OSRM (e.g. 1/1000 for km).
+    cache_file : str, optional
+        ``.npz`` file the blocks are loaded from and saved to after each change.
+    provider : RoutingProvider, optional
+        Backend for unseen points (anything with a ``table`` method, see
+        ``vrp_viz.map_viz.providers``). None -> OSRM via :func:`get_matrix`.
+    **fetch_kwargs
+        Default arguments for :func:`get_matrix` (base_url, profile, timeout).
+    """
+
+    def __init__(
+        self,
+        annotations: Sequence[str] = ("distance",),
+        precision: int = 6,
+        scale: float = 1.0,
+        cache_file: Optional[str] = None,
+        provider=None,
+        **fetch_kwargs,
+    ):
+        self.annotations = tuple(annotations)
+        self.precision = precision
+        self.scale = scale
+        self.cache_file = cache_file
+        self.provider = provider
+        self.fetch_kwargs = fetch_kwargs
+        # mỗi block: {"points": [...], "index": {key: i}, "matrices": {annotation: array}}
+        self.blocks: List[Dict[str, Any]] = []
+        if cache_file is not None and os.path.exists(cache_file):
+            self.load()
+
+    def key(self, point: Tuple[float, float]) -> Tuple[float, float]:
+        return (round(float(point[0]), self.precision), round(float(point[1]), self.precision))
+
+    def _new_block(self, points, matrices) -> Dict[str, Any]:
+        return {
+            "points": list(points),
+            "index": {self.key(p): i for i, p in enumerate(points)},
+            "matrices": {a: np.asarray(matrices[a], dtype=float) for a in self.annotations},
+        }
+
+    def _best_block(self, keys) -> Tuple[Optional[Dict[str, Any]], int]:
+        best, best_hits = None, 0
+        for block in self.blocks:
+            hits = sum(1 for k in keys if k in block["index"])
+            if hits > best_hits:
+                best, best_hits = block, hits
+        return best, best_hits
+
+    def add(self, points: Sequence[Tuple[float, float]], matrices: Dict[str, np.ndarray]) -> None:
+        """Seed the cache with a known matrix (e.g. one read from a dataset CSV)."""
+        keys = [self.key(p) for p in points]
+        block, hits = self._best_block(keys)
+        if block is not None and hits == len(set(keys)):
+            return
+        new_keys = set(keys)
+        # bỏ các block là tập con của block mới
+        self.blocks = [b for b in self.blocks if not set(b["index"]) <= new_keys]
+        self.blocks.append(self._new_block(points, matrices))
+        self.save()
+
+    def get(self, points: Sequence[Tuple[float, float]], **kwargs) -> Dict[str, np.ndarray]:
+        """
+        Return the matrices for ``points`` (in order), fetching only unseen points.
+
+        Args:
+            points (Sequence[Tuple[float, float]]): Points (lat, lng).
+            **kwargs: Overrides for the default :func:`get_matrix` arguments.
+
+        Returns:
+            Dict[str, np.ndarray]: annotation -> (len(points), len(points)) matrix.
+        """
+        fetch_kwargs = {**self.fetch_kwargs, **kwargs}
+        if self.provider is not None:
+            fetch_kwargs = {"table": self.provider.table}
+        keys = [self.key(p) for p in points]
+        block, hits = self._best_block(keys)
+
+        if block is None:
+            # chưa có block nào chứa các điểm này -> lấy toàn bộ bảng
+            uniq, seen = [], set()
+            for p, k in zip(points, keys):
+                if k not in seen:
+                    seen.add(k)
+                    uniq.append(p)
+            empty = {a: np.zeros((0, 0)) for a in self.annotations}
+            matrices = _extend_matrices(empty, [], uniq, self.scale, **fetch_kwargs)
+            block = self._new_block(uniq, matrices)
+            self.blocks.append(block)
+            self.save()
+        elif hits < len(set(keys)):
+            new_points, seen = [], set()
+            for p, k in zip(points, keys):
+                if k not in block["index"] and k not in seen:
+                    seen.add(k)
+                    new_points.append(p)
+            matrices = _extend_matrices(
+                block["matrices"], block["points"], new_points, self.scale, **fetch_kwargs
+            )
+            start = len(block["points"])
+            block["points"].extend(new_points)
+            for i, p in enumerate(new_points, start=start):
+                block["index"][self.key(p)] = i
+            block["matrices"] = matrices
+            self.save()
+
+        idx = [block["index"][k] for k in keys]
+        return {a: m[np.ix_(idx, idx)] for a, m in block["matrices"].items()}
+
+    def save(self) -> None:
+        if self.cache_file is None:
+            return
+        arrays = {"n_blocks": np.array(len(self.blocks))}
+        for b_id, block in enumerate(self.blocks):
+            arrays[f"points_{b_id}"] = np.array(block["points"], dtype=float).reshape(-1, 2)
+            for a, m in block["matrices"].items():
+                arrays[f"{a}_{b_id}"] = m
+        folder = os.path.dirname(self.cache_file)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        np.savez_compressed(self.cache_file, **arrays)
+
+    def load(self) -> None:
+        with np.load(self.cache_file) as data:
+            self.blocks = []
+            for b_id in range(int(data["n_blocks"])):
+                if any(f"{a}_{b_id}" not in data for a in self.annotations):
+                    continue
+                points = [tuple(p) for p in data[f"points_{b_id}"].tolist()]
+                matrices = {a: data[f"{a}_{b_id}"] for a in self.annotations}
+                self.blocks.append(self._new_block(points, matrices))
+
+
 if __name__ == "__main__":
     try:
         # Specify the path to the CSV file containing latitude and longitude data
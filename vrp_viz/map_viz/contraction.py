@@ -0,0 +1,336 @@
+import os
+import heapq
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .road_graph import CSRGraph
+
+
+def _witness_search(
+    out_adj: List[Dict[int, float]],
+    source: int,
+    skip: int,
+    max_weight: float,
+    targets: set,
+    settle_limit: int,
+) -> Dict[int, float]:
+    """Dijkstra giới hạn (bỏ qua node skip) để tìm đường thay thế cho shortcut."""
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    remaining = set(targets)
+    settled = 0
+    while heap and remaining:
+        d, u = heapq.heappop(heap)
+        if d > dist.get(u, np.inf):
+            continue
+        if d > max_weight or settled >= settle_limit:
+            break
+        remaining.discard(u)
+        settled += 1
+        for v, w in out_adj[u].items():
+            if v == skip:
+                continue
+            nd = d + w
+            if nd < dist.get(v, np.inf):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+
+def _shortcuts_for(
+    out_adj: List[Dict[int, float]],
+    in_adj: List[Dict[int, float]],
+    v: int,
+    settle_limit: int,
+) -> List[Tuple[int, int, float]]:
+    """Các shortcut (u, w, weight) cần thêm khi co node v."""
+    shortcuts = []
+    outs = out_adj[v]
+    if not outs:
+        return shortcuts
+    max_out = max(outs.values())
+    for u, w_uv in in_adj[v].items():
+        targets = {w for w in outs if w != u}
+        if not targets:
+            continue
+        dist = _witness_search(out_adj, u, v, w_uv + max_out, targets, settle_limit)
+        for w in targets:
+            via = w_uv + outs[w]
+            if dist.get(w, np.inf) > via:
+                shortcuts.append((u, w, via))
+    return shortcuts
+
+
+def _to_csr(rows: List[Dict[int, Tuple[float, int]]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    indptr = [0]
+    indices, weights, middles = [], [], []
+    for row in rows:
+        for v in sorted(row):
+            w, m = row[v]
+            indices.append(v)
+            weights.append(w)
+            middles.append(m)
+        indptr.append(len(indices))
+    return (
+        np.array(indptr, dtype=np.int64),
+        np.array(indices, dtype=np.int32),
+        np.array(weights, dtype=float),
+        np.array(middles, dtype=np.int32),
+    )
+
+
+class ContractionHierarchy:
+    """
+    Contraction Hierarchy trên CSRGraph: tiền xử lý một lần (thứ tự node + shortcut),
+    lưu .npz, sau đó truy vấn bằng tìm kiếm hai chiều chỉ đi "lên" theo thứ hạng.
+
+    Ma trận n x n dùng thuật toán bucket many-to-many: n tìm kiếm lùi + n tìm kiếm tiến,
+    mỗi lần chỉ duyệt vài trăm node thay vì một Dijkstra trên cả graph.
+
+    Các cạnh lên (up) lưu dạng CSR; middle[e] là node bị co để tạo shortcut e
+    (-1 nếu là cạnh gốc), dùng để bung đường đi.
+    """
+
+    def __init__(
+        self,
+        graph: CSRGraph,
+        rank: np.ndarray,
+        fwd: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+        bwd: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+    ):
+        self.graph = graph
+        self.rank = np.asarray(rank, dtype=np.int64)
+        self.fwd = fwd  # u -> w với rank[w] > rank[u]
+        self.bwd = bwd  # w -> u với cạnh gốc u -> w và rank[u] > rank[w]
+        self._fwd_l = [a.tolist() for a in fwd]
+        self._bwd_l = [a.tolist() for a in bwd]
+        self._middle: Optional[Dict[Tuple[int, int], int]] = None
+
+    # ---------- Tiền xử lý ----------
+    @classmethod
+    def build(cls, graph: CSRGraph, settle_limit: int = 60, verbose: bool = False) -> "ContractionHierarchy":
+        """
+        Co lần lượt các node theo độ ưu tiên (edge difference + số láng giềng đã co),
+        cập nhật lười (lazy) trên heap.
+        """
+        n = graph.n_nodes
+        out_adj: List[Dict[int, float]] = [dict() for _ in range(n)]
+        in_adj: List[Dict[int, float]] = [dict() for _ in range(n)]
+        for u in range(n):
+            for e in range(graph.indptr[u], graph.indptr[u + 1]):
+                v = int(graph.indices[e])
+                if v == u:
+                    continue
+                w = float(graph.weights[e])
+                if w < out_adj[u].get(v, np.inf):
+                    out_adj[u][v] = w
+                    in_adj[v][u] = w
+        middle: Dict[Tuple[int, int], int] = {}
+        deleted_nbrs = [0] * n
+
+        def priority(v: int) -> int:
+            n_short = len(_shortcuts_for(out_adj, in_adj, v, settle_limit))
+            return n_short - len(out_adj[v]) - len(in_adj[v]) + deleted_nbrs[v]
+
+        heap = [(priority(v), v) for v in range(n)]
+        heapq.heapify(heap)
+        rank = np.full(n, -1, dtype=np.int64)
+        up_out: List[Dict[int, Tuple[float, int]]] = [dict() for _ in range(n)]
+        up_in: List[Dict[int, Tuple[float, int]]] = [dict() for _ in range(n)]
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            if rank[v] >= 0:
+                continue
+            # cập nhật lười: nếu độ ưu tiên đã tăng thì đẩy lại
+            p = priority(v)
+            if heap and p > heap[0][0]:
+                heapq.heappush(heap, (p, v))
+                continue
+
+            shortcuts = _shortcuts_for(out_adj, in_adj, v, settle_limit)
+            rank[v] = order
+            order += 1
+            # mọi láng giềng còn lại đều có thứ hạng cao hơn v
+            for w, wt in out_adj[v].items():
+                up_out[v][w] = (wt, middle.get((v, w), -1))
+                del in_adj[w][v]
+                deleted_nbrs[w] += 1
+            for u, wt in in_adj[v].items():
+                up_in[v][u] = (wt, middle.get((u, v), -1))
+                del out_adj[u][v]
+                deleted_nbrs[u] += 1
+            out_adj[v] = {}
+            in_adj[v] = {}
+            for u, w, wt in shortcuts:
+                if wt < out_adj[u].get(w, np.inf):
+                    out_adj[u][w] = wt
+                    in_adj[w][u] = wt
+                    middle[(u, w)] = v
+            if verbose and order % 1000 == 0:
+                print(f"CH: contracted {order}/{n} nodes")
+
+        return cls(graph, rank, _to_csr(up_out), _to_csr(up_in))
+
+    # ---------- Lưu / đọc ----------
+    def save(self, path: str) -> None:
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        arrays = {"rank": self.rank}
+        for prefix, csr in (("fwd", self.fwd), ("bwd", self.bwd)):
+            for name, arr in zip(("indptr", "indices", "weights", "middle"), csr):
+                arrays[f"{prefix}_{name}"] = arr
+        g = self.graph
+        for name in ("osm_ids", "lat", "lng", "indptr", "indices", "weights", "geom_ptr", "geom_coords"):
+            arrays[f"g_{name}"] = getattr(g, name)
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "ContractionHierarchy":
+        with np.load(path) as data:
+            graph = CSRGraph(**{k[2:]: data[k] for k in data.files if k.startswith("g_")})
+            fwd = tuple(data[f"fwd_{k}"] for k in ("indptr", "indices", "weights", "middle"))
+            bwd = tuple(data[f"bwd_{k}"] for k in ("indptr", "indices", "weights", "middle"))
+            return cls(graph, data["rank"], fwd, bwd)
+
+    # ---------- Truy vấn ----------
+    def _upward(self, source: int, backward: bool) -> Dict[int, float]:
+        """Dijkstra chỉ theo cạnh lên (không giới hạn, không gian tìm kiếm vốn nhỏ)."""
+        indptr, indices, weights, _ = self._bwd_l if backward else self._fwd_l
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for e in range(indptr[u], indptr[u + 1]):
+                v = indices[e]
+                nd = d + weights[e]
+                if nd < dist.get(v, np.inf):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return dist
+
+    def distance(self, source: int, target: int) -> Tuple[float, int]:
+        """Khoảng cách source -> target (chỉ số nội bộ) và node gặp nhau (-1 nếu không có đường)."""
+        fwd = self._upward(source, backward=False)
+        bwd = self._upward(target, backward=True)
+        best, meet = np.inf, -1
+        small, large = (fwd, bwd) if len(fwd) <= len(bwd) else (bwd, fwd)
+        for v, d in small.items():
+            other = large.get(v)
+            if other is not None and d + other < best:
+                best, meet = d + other, v
+        return best, meet
+
+    def _edge_middle(self, u: int, w: int) -> int:
+        if self._middle is None:
+            self._middle = {}
+            for (indptr, indices, _, middles), backward in ((self._fwd_l, False), (self._bwd_l, True)):
+                for a in range(len(indptr) - 1):
+                    for e in range(indptr[a], indptr[a + 1]):
+                        b = indices[e]
+                        key = (b, a) if backward else (a, b)
+                        self._middle[key] = middles[e]
+        return self._middle.get((u, w), -1)
+
+    def _unpack(self, u: int, w: int) -> List[int]:
+        m = self._edge_middle(u, w)
+        if m < 0:
+            return [u, w]
+        return self._unpack(u, m) + self._unpack(m, w)[1:]
+
+    def path(self, source: int, target: int) -> Tuple[float, List[int]]:
+        """Đường đi ngắn nhất (đã bung shortcut) trên graph gốc."""
+        if source == target:
+            return 0.0, [source]
+        best, meet = self.distance(source, target)
+        if meet < 0:
+            return np.inf, []
+
+        def parents(start: int, backward: bool) -> Dict[int, int]:
+            indptr, indices, weights, _ = self._bwd_l if backward else self._fwd_l
+            dist, par = {start: 0.0}, {}
+            heap = [(0.0, start)]
+            while heap:
+                d, u = heapq.heappop(heap)
+                if d > dist[u]:
+                    continue
+                for e in range(indptr[u], indptr[u + 1]):
+                    v = indices[e]
+                    if d + weights[e] < dist.get(v, np.inf):
+                        dist[v] = d + weights[e]
+                        par[v] = u
+                        heapq.heappush(heap, (dist[v], v))
+            return par
+
+        fpar, bpar = parents(source, False), parents(target, True)
+        up = [meet]
+        while up[-1] != source:
+            up.append(fpar[up[-1]])
+        up.reverse()
+        down = [meet]
+        while down[-1] != target:
+            down.append(bpar[down[-1]])
+        nodes = [source]
+        for a, b in zip(up + down[1:], (up + down[1:])[1:]):
+            nodes.extend(self._unpack(a, b)[1:])
+        return best, nodes
+
+    def distance_matrix(self, node_idx: Sequence[int], targets: Optional[Sequence[int]] = None) -> np.ndarray:
+        """
+        Ma trận khoảng cách nguồn x đích (chỉ số nội bộ) bằng thuật toán bucket many-to-many.
+        targets=None -> ma trận vuông trên node_idx.
+        """
+        sources = list(node_idx)
+        targets = sources if targets is None else list(targets)
+        bucket_lists: Dict[int, Tuple[List[int], List[float]]] = {}
+        for j, t in enumerate(targets):
+            for v, d in self._upward(t, backward=True).items():
+                js, ds = bucket_lists.setdefault(v, ([], []))
+                js.append(j)
+                ds.append(d)
+        # mỗi target xuất hiện tối đa một lần trong một bucket -> cập nhật vector hoá
+        buckets = {
+            v: (np.array(js, dtype=np.int64), np.array(ds, dtype=float))
+            for v, (js, ds) in bucket_lists.items()
+        }
+        D = np.full((len(sources), len(targets)), np.inf, dtype=float)
+        for i, s in enumerate(sources):
+            row = D[i]
+            for v, d in self._upward(s, backward=False).items():
+                bucket = buckets.get(v)
+                if bucket is not None:
+                    js, ds = bucket
+                    row[js] = np.minimum(row[js], ds + d)
+        return D
+
+    def get_matrix(
+        self,
+        coordinates: str,
+        annotations: Sequence[str] = ("distance",),
+        sources: Optional[Sequence[int]] = None,
+        destinations: Optional[Sequence[int]] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """
+        Cùng giao diện với api_osmr.get_matrix: coordinates 'lon,lat;lon,lat;...',
+        trả dict kiểu OSRM {"code": "Ok", "distances": [[m, ...], ...]}.
+        Chỉ hỗ trợ annotation "distance" (graph cục bộ không có thời gian di chuyển).
+        """
+        if any(a != "distance" for a in annotations):
+            raise ValueError("Local contraction hierarchy only provides 'distance'")
+        points = [
+            (float(lat), float(lng))
+            for lng, lat in (c.split(",") for c in coordinates.split(";"))
+        ]
+        node_idx, _ = self.graph.snap(points)
+        rows = node_idx if sources is None else node_idx[list(sources)]
+        cols = node_idx if destinations is None else node_idx[list(destinations)]
+        D = self.distance_matrix(rows.tolist(), cols.tolist())
+        return {
+            "code": "Ok",
+            "distances": [[None if not np.isfinite(x) else float(x) for x in r] for r in D],
+        }
@@ -1,12 +1,20 @@
+import json
 import math
+import os
 import random
-from typing import Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
 import requests
 
+EARTH_RADIUS_KM = 6371
+
 
 def calculate_distance_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
     """Khoảng cách Haversine (km) giữa 2 toạ độ."""
-    R = 6371
+    R = EARTH_RADIUS_KM
     lat1_rad, lng1_rad = math.radians(lat1), math.radians(lng1)
     lat2_rad, lng2_rad = math.radians(lat2), math.radians(lng2)
     dlat, dlng = lat2_rad - lat1_rad, lng2_rad - lng1_rad
@@ -18,6 +26,68 @@ def calculate_distance_km(lat1: float, lng1: float, lat2: float, lng2: float) ->
     return R * c
 
 
+def _distance(lat1, lng1, lat2, lng2, method: str) -> np.ndarray:
+    """Khoảng cách (km) theo từng phần tử (broadcast) giữa các toạ độ (độ)."""
+    if method == "euclidean":
+        return np.hypot(lat1 - lat2, lng1 - lng2)
+
+    phi1, lam1 = np.radians(lat1), np.radians(lng1)
+    phi2, lam2 = np.radians(lat2), np.radians(lng2)
+    if method == "haversine":
+        a = (
+            np.sin((phi2 - phi1) / 2) ** 2
+            + np.cos(phi1) * np.cos(phi2) * np.sin((lam2 - lam1) / 2) ** 2
+        )
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    if method == "equirectangular":
+        x = (lam2 - lam1) * np.cos((phi1 + phi2) / 2)
+        return EARTH_RADIUS_KM * np.hypot(x, phi2 - phi1)
+    raise ValueError(f"Unknown method '{method}' (haversine, equirectangular, euclidean)")
+
+
+def _pairwise_block(
+    lat1: np.ndarray, lng1: np.ndarray, lat2: np.ndarray, lng2: np.ndarray, method: str
+) -> np.ndarray:
+    """Khoảng cách (km) giữa mọi cặp điểm của 2 mảng toạ độ (độ), dạng (len1, len2)."""
+    return _distance(lat1[:, None], lng1[:, None], lat2[None, :], lng2[None, :], method)
+
+
+def coordinate_distance_matrix(
+    lats: np.ndarray,
+    lngs: np.ndarray,
+    method: str = "haversine",
+    block_size: Optional[int] = 1024,
+    dtype=np.float32,
+) -> np.ndarray:
+    """
+    Ma trận khoảng cách (n, n) tính vector hoá trên mảng toạ độ NumPy.
+
+    Args:
+        lats, lngs: mảng vĩ độ/kinh độ (độ), cùng độ dài n.
+        method: "haversine" (km), "equirectangular" (km, xấp xỉ nhanh cho bán kính nhỏ)
+            hoặc "euclidean" (khoảng cách phẳng trên chính toạ độ, vd node_coord vrplib).
+        block_size: số hàng tính mỗi lần để giới hạn bộ nhớ trung gian
+            (mặc định 1024; None -> tính một lần, bộ nhớ tạm ~ n x n float64).
+        dtype: kiểu dữ liệu kết quả (mặc định float32, 10k x 10k ~ 400 MB).
+    """
+    lats = np.asarray(lats, dtype=float).ravel()
+    lngs = np.asarray(lngs, dtype=float).ravel()
+    if lats.shape != lngs.shape:
+        raise ValueError("lats and lngs must have the same length")
+    n = lats.shape[0]
+    if block_size is None or block_size >= n:
+        D = _pairwise_block(lats, lngs, lats, lngs, method).astype(dtype, copy=False)
+    else:
+        D = np.empty((n, n), dtype=dtype)
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            D[start:stop] = _pairwise_block(
+                lats[start:stop], lngs[start:stop], lats, lngs, method
+            )
+    np.fill_diagonal(D, 0.0)
+    return D
+
+
 def generate_random_coordinates(
     center_lat: float, center_lng: float, radius_km: float
 ) -> Tuple[float, float]:
@@ -30,8 +100,23 @@ def generate_random_coordinates(
     )
 
 
-def get_real_address_from_coordinates(lat: float, lng: float) -> dict:
-    """Reverse geocode qua Nominatim, có fallback khi lỗi."""
+def _synthetic_address(lat: float, lng: float) -> dict:
+    """Địa chỉ giả lập từ toạ độ (fallback khi lỗi hoặc chế độ offline)."""
+    return {
+        "full_address": f"Toạ độ {lat:.6f}, {lng:.6f}",
+        "street": "N/A",
+        "suburb": "N/A",
+        "lat": lat,
+        "lng": lng,
+        "city": "N/A",
+        "state": "N/A",
+        "country": "N/A",
+        "display_name": f"Coordinates: {lat:.6f}, {lng:.6f}",
+    }
+
+
+def _request_nominatim(lat: float, lng: float) -> Optional[dict]:
+    """Gọi Nominatim /reverse, trả về dict địa chỉ hoặc None nếu lỗi."""
     try:
         url = "https://nominatim.openstreetmap.org/reverse"
         params = {
@@ -68,23 +153,120 @@ def get_real_address_from_coordinates(lat: float, lng: float) -> dict:
             }
     except Exception as e:
         print(f"Reverse geocode lỗi: {e}")
-    return {
-        "full_address": f"Toạ độ {lat:.6f}, {lng:.6f}",
-        "street": "N/A",
-        "suburb": "N/A",
-        "lat": lat,
-        "lng": lng,
-        "city": "N/A",
-        "state": "N/A",
-        "country": "N/A",
-        "display_name": f"Coordinates: {lat:.6f}, {lng:.6f}",
-    }
+    return None
+
+
+def get_real_address_from_coordinates(lat: float, lng: float) -> dict:
+    """Reverse geocode qua Nominatim, có fallback khi lỗi."""
+    return _request_nominatim(lat, lng) or _synthetic_address(lat, lng)
+
+
+class _RateLimiter:
+    """Giới hạn số request/giây dùng chung giữa các thread."""
+
+    def __init__(self, rate_per_s: float):
+        self.interval = 1.0 / rate_per_s if rate_per_s and rate_per_s > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class ReverseGeocoder:
+    """
+    Reverse geocode có cache theo toạ độ làm tròn, chạy song song dưới giới hạn tốc độ.
+
+    Args:
+        cache_file: file JSON lưu cache (None -> chỉ cache trong bộ nhớ).
+        precision: số chữ số thập phân khi làm tròn toạ độ làm key (5 ~ 1 m).
+        rate_limit: số request/giây tối đa tới Nominatim (chính sách public: 1).
+        max_workers: số thread gửi request đồng thời.
+        offline: True -> không gọi mạng, trả ngay địa chỉ giả lập cho điểm chưa có trong cache.
+    """
+
+    def __init__(
+        self,
+        cache_file: Optional[str] = None,
+        precision: int = 5,
+        rate_limit: float = 1.0,
+        max_workers: int = 4,
+        offline: bool = False,
+    ):
+        self.cache_file = cache_file
+        self.precision = precision
+        self.max_workers = max_workers
+        self.offline = offline
+        self._limiter = _RateLimiter(rate_limit)
+        self._lock = threading.Lock()
+        self.cache: Dict[str, dict] = {}
+        if cache_file is not None and os.path.exists(cache_file):
+            with open(cache_file, "r", encoding="utf-8") as f:
+                self.cache = json.load(f)
+
+    def key(self, lat: float, lng: float) -> str:
+        return f"{round(lat, self.precision)},{round(lng, self.precision)}"
+
+    def _lookup(self, lat: float, lng: float) -> Tuple[dict, bool]:
+        """Trả về (địa chỉ, có phải kết quả mới từ API không)."""
+        cached = self.cache.get(self.key(lat, lng))
+        if cached is not None:
+            return {**cached, "lat": lat, "lng": lng}, False
+        if self.offline:
+            return _synthetic_address(lat, lng), False
+        self._limiter.wait()
+        info = _request_nominatim(lat, lng)
+        if info is None:
+            return _synthetic_address(lat, lng), False
+        with self._lock:
+            self.cache[self.key(lat, lng)] = info
+        return info, True
+
+    def reverse(self, lat: float, lng: float) -> dict:
+        info, fetched = self._lookup(lat, lng)
+        if fetched:
+            self.save()
+        return info
+
+    def reverse_many(self, points: Sequence[Tuple[float, float]]) -> List[dict]:
+        """Reverse geocode danh sách (lat, lng), giữ nguyên thứ tự."""
+        if self.max_workers <= 1 or self.offline:
+            results = [self._lookup(lat, lng) for lat, lng in points]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                results = list(pool.map(lambda p: self._lookup(*p), points))
+        if any(fetched for _, fetched in results):
+            self.save()
+        return [info for info, _ in results]
+
+    def save(self) -> None:
+        if self.cache_file is None:
+            return
+        with self._lock:
+            folder = os.path.dirname(self.cache_file)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            with open(self.cache_file, "w", encoding="utf-8") as f:
+                json.dump(self.cache, f, ensure_ascii=False)
 
 
 def generate_customer_with_real_address(
-    lat: float, lng: float, min_packages: int, max_packages: int
+    lat: float,
+    lng: float,
+    min_packages: int,
+    max_packages: int,
+    address_info: Optional[dict] = None,
 ) -> dict:
-    """Sinh thông tin khách với địa chỉ thực tế và số gói."""
+    """Sinh thông tin khách với địa chỉ thực tế và số gói.
+
+    address_info: địa chỉ đã reverse geocode sẵn (vd từ ReverseGeocoder.reverse_many);
+    None -> gọi get_real_address_from_coordinates.
+    """
     customer_names = [
         "Nguyễn Văn An",
         "Trần Thị Bình",
@@ -102,7 +284,7 @@ def generate_customer_with_real_address(
         "Lý Thị Tâm",
         "Phan Văn Út",
     ]
-    info = get_real_address_from_coordinates(lat, lng)
+    info = address_info if address_info is not None else get_real_address_from_coordinates(lat, lng)
     return {
         "name": random.choice(customer_names),
         "address": info["full_address"],
@@ -0,0 +1,120 @@
+"""
+Server HTTP giả lập OSRM (/table/v1 và /route/v1) trên một RoutingProvider bất kỳ,
+để chạy thử dataloader / script sinh dữ liệu mà không cần mạng.
+
+    python -m vrp_viz.map_viz.osrm_stub --port 5000
+    OSRM_BASE_URL=http://127.0.0.1:5000 python gen-data-dev.py
+"""
+import json
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from .providers import HaversineProvider, LocalGraphProvider, RoutingProvider
+
+_TABLE_KEYS = {"distance": "distances", "duration": "durations"}
+
+
+def _parse_indices(value: Optional[str]):
+    if value is None or value == "all":
+        return None
+    return [int(i) for i in value.split(";")]
+
+
+def _to_json_table(matrix: np.ndarray):
+    return [[None if not np.isfinite(x) else float(x) for x in row] for row in matrix]
+
+
+def make_handler(provider: RoutingProvider):
+    class OSRMStubHandler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            parts = url.path.strip("/").split("/")
+            # /{service}/v1/{profile}/{coordinates}
+            if len(parts) != 4 or parts[0] not in ("table", "route"):
+                self._send(400, {"code": "InvalidUrl", "message": f"Unsupported path {url.path}"})
+                return
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            try:
+                points = [
+                    (float(lat), float(lng))
+                    for lng, lat in (c.split(",") for c in parts[3].split(";"))
+                ]
+            except ValueError:
+                self._send(400, {"code": "InvalidQuery", "message": "Bad coordinates"})
+                return
+            try:
+                if parts[0] == "table":
+                    annotations = query.get("annotations", "duration").split(",")
+                    tables = provider.table(
+                        points,
+                        annotations,
+                        _parse_indices(query.get("sources")),
+                        _parse_indices(query.get("destinations")),
+                    )
+                    payload = {"code": "Ok"}
+                    for a, m in tables.items():
+                        payload[_TABLE_KEYS[a]] = _to_json_table(m)
+                else:
+                    payload = provider.route(points)
+            except (KeyError, ValueError) as ex:
+                self._send(400, {"code": "InvalidOptions", "message": str(ex)})
+                return
+            except Exception as ex:
+                self._send(200, {"code": "NoRoute", "message": str(ex)})
+                return
+            self._send(200, payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return OSRMStubHandler
+
+
+def start_background(
+    provider: Optional[RoutingProvider] = None, host: str = "127.0.0.1", port: int = 0
+) -> Tuple[ThreadingHTTPServer, str]:
+    """Chạy server trên thread nền, trả (server, base_url). Dừng bằng server.shutdown()."""
+    server = ThreadingHTTPServer((host, port), make_handler(provider or HaversineProvider()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OSRM stand-in (table/route)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--graph", help="CSRGraph .npz (mặc định: Haversine)")
+    parser.add_argument("--ch", action="store_true", help="--graph là file ContractionHierarchy")
+    parser.add_argument("--speed-kmh", type=float, default=25.0)
+    args = parser.parse_args()
+
+    if args.graph is None:
+        provider = HaversineProvider(speed_kmh=args.speed_kmh)
+    elif args.ch:
+        from .contraction import ContractionHierarchy
+
+        provider = LocalGraphProvider(ContractionHierarchy.load(args.graph), args.speed_kmh)
+    else:
+        from .road_graph import CSRGraph
+
+        provider = LocalGraphProvider(CSRGraph.load(args.graph), args.speed_kmh)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(provider))
+    print(f"OSRM stub ({provider.name}) tại http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
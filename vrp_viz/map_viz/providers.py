@@ -0,0 +1,369 @@
+import os
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .api_osmr import MatrixCache, format_coordinates, get_route, osrm_table
+from .gen_data import _RateLimiter, _pairwise_block
+
+Point = Tuple[float, float]  # (lat, lng)
+
+
+def _route_response(coords_latlon: Sequence[Point], distance: float, duration: float) -> Dict[str, Any]:
+    """Đóng gói một tuyến thành dict cùng dạng với OSRM /route (geometry GeoJSON lng,lat)."""
+    geometry = {
+        "type": "LineString",
+        "coordinates": [[float(lng), float(lat)] for lat, lng in coords_latlon],
+    }
+    return {
+        "code": "Ok",
+        "routes": [{"distance": float(distance), "duration": float(duration), "geometry": geometry}],
+    }
+
+
+def _annotate(D: np.ndarray, annotations: Sequence[str], speed_ms: float) -> Dict[str, np.ndarray]:
+    out = {}
+    for a in annotations:
+        if a == "distance":
+            out[a] = D
+        elif a == "duration":
+            out[a] = D / speed_ms
+        else:
+            raise ValueError(f"Unsupported annotation: {a}")
+    return out
+
+
+class RoutingProvider(ABC):
+    """
+    Giao diện chung cho nguồn dữ liệu đường đi (OSRM, graph cục bộ, Haversine...).
+
+    Mọi điểm theo thứ tự (lat, lng); khoảng cách tính bằng mét, thời gian bằng giây,
+    cặp không tới được -> NaN. Lớp con cài đặt ``table`` và ``route``.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def table(
+        self,
+        points: Sequence[Point],
+        annotations: Sequence[str] = ("distance",),
+        sources: Optional[Sequence[int]] = None,
+        destinations: Optional[Sequence[int]] = None,
+    ) -> Dict[str, np.ndarray]:
+        """annotation -> mảng (len(sources), len(destinations))."""
+
+    @abstractmethod
+    def route(self, points: Sequence[Point]) -> Dict[str, Any]:
+        """Tuyến đi qua lần lượt các điểm, dict dạng OSRM /route (lỗi -> raise)."""
+
+    def backends(self) -> List["RoutingProvider"]:
+        """Các backend theo thứ tự ưu tiên; phần tử đầu là backend chính."""
+        return [self]
+
+
+class OSRMProvider(RoutingProvider):
+    """
+    OSRM qua HTTP (server công khai, server tự dựng hoặc osrm_stub).
+
+    rate_limit: số request/giây tối đa (mặc định ~ một request mỗi 0.15 s), chỉ áp dụng cho
+    request HTTP thật; kết quả lấy từ CachedProvider không bị chờ. None -> không giới hạn.
+    """
+
+    name = "osrm"
+
+    def __init__(
+        self,
+        base_url: str = "https://router.project-osrm.org",
+        profile: str = "driving",
+        timeout: int = 60,
+        rate_limit: Optional[float] = 1 / 0.15,
+    ):
+        self.base_url = base_url
+        self.profile = profile
+        self.timeout = timeout
+        self._limiter = _RateLimiter(rate_limit)
+
+    def table(self, points, annotations=("distance",), sources=None, destinations=None):
+        self._limiter.wait()
+        return osrm_table(
+            points,
+            annotations,
+            sources,
+            destinations,
+            base_url=self.base_url,
+            profile=self.profile,
+            timeout=self.timeout,
+        )
+
+    def route(self, points):
+        self._limiter.wait()
+        return get_route(
+            format_coordinates(points),
+            base_url=self.base_url,
+            profile=self.profile,
+            timeout=self.timeout,
+        )
+
+
+class HaversineProvider(RoutingProvider):
+    """Khoảng cách đường chim bay, thời gian ước lượng theo vận tốc trung bình."""
+
+    name = "haversine"
+
+    def __init__(self, speed_kmh: float = 25.0, method: str = "haversine"):
+        self.speed_ms = speed_kmh / 3.6
+        self.method = method
+
+    def table(self, points, annotations=("distance",), sources=None, destinations=None):
+        pts = np.asarray(points, dtype=float).reshape(-1, 2)
+        rows = pts if sources is None else pts[list(sources)]
+        cols = pts if destinations is None else pts[list(destinations)]
+        D = _pairwise_block(rows[:, 0], rows[:, 1], cols[:, 0], cols[:, 1], self.method) * 1000.0
+        return _annotate(D, annotations, self.speed_ms)
+
+    def route(self, points):
+        points = list(points)
+        if len(points) < 2:
+            raise ValueError("route needs at least 2 points")
+        legs = self.table(points, ("distance",))["distance"]
+        distance = float(sum(legs[i, i + 1] for i in range(len(points) - 1)))
+        return _route_response(points, distance, distance / self.speed_ms)
+
+
+class LocalGraphProvider(RoutingProvider):
+    """
+    Graph đường bộ cục bộ (CSRGraph hoặc ContractionHierarchy), không cần mạng.
+    Điểm được snap về node gần nhất; thời gian ước lượng theo speed_kmh.
+    """
+
+    name = "local"
+
+    def __init__(self, graph, speed_kmh: float = 25.0, n_jobs: Optional[int] = 1):
+        from .contraction import ContractionHierarchy
+
+        self.ch = graph if isinstance(graph, ContractionHierarchy) else None
+        self.graph = graph.graph if self.ch is not None else graph
+        self.speed_ms = speed_kmh / 3.6
+        self.n_jobs = n_jobs
+
+    def table(self, points, annotations=("distance",), sources=None, destinations=None):
+        from .road_graph import _parallel_rows
+
+        node_idx, _ = self.graph.snap(points)
+        rows = node_idx if sources is None else node_idx[list(sources)]
+        cols = node_idx if destinations is None else node_idx[list(destinations)]
+        rows, cols = rows.tolist(), cols.tolist()
+        if self.ch is not None:
+            D = self.ch.distance_matrix(rows, cols)
+        else:
+            D = np.full((len(rows), len(cols)), np.inf)
+            uniq_cols = list(dict.fromkeys(cols))
+            for i, (dist, _) in enumerate(_parallel_rows(self.graph, rows, uniq_cols, self.n_jobs)):
+                D[i] = [dist.get(c, np.inf) for c in cols]
+        D[~np.isfinite(D)] = np.nan
+        return _annotate(D, annotations, self.speed_ms)
+
+    def route(self, points):
+        points = list(points)
+        if len(points) < 2:
+            raise ValueError("route needs at least 2 points")
+        node_idx, _ = self.graph.snap(points)
+        total, nodes = 0.0, [int(node_idx[0])]
+        for a, b in zip(node_idx[:-1].tolist(), node_idx[1:].tolist()):
+            d, path = self.ch.path(a, b) if self.ch is not None else self.graph.astar(a, b)
+            if not path:
+                raise RuntimeError(f"No path between nodes {a} and {b}")
+            total += d
+            nodes.extend(path[1:])
+        coords = [points[0], *self.graph.path_coords(nodes), points[-1]]
+        return _route_response(coords, total, total / self.speed_ms)
+
+
+class FallbackProvider(RoutingProvider):
+    """
+    Thử lần lượt các provider, dùng kết quả của provider đầu tiên không lỗi.
+    Tuyến trả về có thêm trường "provider" là tên backend đã trả lời.
+    """
+
+    name = "fallback"
+
+    def __init__(self, providers: Sequence[RoutingProvider]):
+        self.providers = list(providers)
+
+    def _first(self, method: str, *args, **kwargs) -> Tuple[Any, RoutingProvider]:
+        errors = []
+        for provider in self.providers:
+            try:
+                return getattr(provider, method)(*args, **kwargs), provider
+            except Exception as ex:
+                errors.append(f"{provider.name}: {ex}")
+        raise RuntimeError("All routing providers failed: " + "; ".join(errors))
+
+    def backends(self):
+        return [backend for provider in self.providers for backend in provider.backends()]
+
+    def table(self, points, annotations=("distance",), sources=None, destinations=None):
+        return self._first("table", points, annotations, sources, destinations)[0]
+
+    def route(self, points):
+        data, provider = self._first("route", points)
+        return {**data, "provider": data.get("provider", provider.name)}
+
+
+class CachedProvider(RoutingProvider):
+    """
+    Bọc một provider bằng cache theo toạ độ, không phụ thuộc backend đã tạo ra dữ liệu.
+
+    - table: một MatrixCache (.npz) cho mỗi annotation, chỉ hỏi backend chính các điểm chưa có.
+    - route: LRU trong bộ nhớ trước một bảng sqlite, khoá là chuỗi toạ độ đã làm tròn.
+
+    Chỉ kết quả thành công của backend chính (provider.backends()[0]) mới được ghi cache lâu dài.
+    Khi backend chính lỗi, các backend dự phòng (vd Haversine trong FallbackProvider) trả lời
+    cả yêu cầu: bảng không được ghi cache (một ma trận không bao giờ trộn hai nguồn), tuyến
+    chỉ giữ trong LRU nên lần chạy sau sẽ hỏi lại backend chính.
+
+    Parameters
+    ----------
+    provider : RoutingProvider
+        Backend khi cache trượt.
+    cache_dir : str, optional
+        Thư mục chứa table_<annotation>.npz và routes.sqlite. None -> chỉ cache trong bộ nhớ.
+    maxsize : int
+        Số tuyến tối đa giữ trong LRU.
+    precision : int
+        Số chữ số thập phân khi làm tròn toạ độ cho khoá cache.
+    """
+
+    def __init__(
+        self,
+        provider: RoutingProvider,
+        cache_dir: Optional[str] = os.path.join("data", "routing-cache"),
+        maxsize: int = 4096,
+        precision: int = 6,
+    ):
+        self.provider = provider
+        self.cache_dir = cache_dir
+        self.maxsize = maxsize
+        self.precision = precision
+        self.name = f"cached({provider.name})"
+        self._primary, *self._fallbacks = provider.backends()
+        self._tables: Dict[str, MatrixCache] = {}
+        self._lru: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(cache_dir, "routes.sqlite"), check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS routes (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+            self._db.commit()
+
+    def _table_cache(self, annotation: str) -> MatrixCache:
+        cache = self._tables.get(annotation)
+        if cache is None:
+            cache_file = None
+            if self.cache_dir is not None:
+                cache_file = os.path.join(self.cache_dir, f"table_{annotation}.npz")
+            cache = MatrixCache(
+                annotations=(annotation,),
+                precision=self.precision,
+                cache_file=cache_file,
+                provider=self._primary,
+            )
+            self._tables[annotation] = cache
+        return cache
+
+    def add_table(self, points: Sequence[Point], matrices: Dict[str, np.ndarray]) -> None:
+        """Nạp ma trận đã có (m / s) vào cache, ví dụ đọc từ CSV của dataset."""
+        for a, m in matrices.items():
+            self._table_cache(a).add(points, {a: np.asarray(m, dtype=float)})
+
+    def table(self, points, annotations=("distance",), sources=None, destinations=None):
+        try:
+            out = {}
+            for a in annotations:
+                m = self._table_cache(a).get(points)[a]
+                if sources is not None:
+                    m = m[list(sources)]
+                if destinations is not None:
+                    m = m[:, list(destinations)]
+                out[a] = m
+            return out
+        except Exception as ex:
+            if not self._fallbacks:
+                raise
+            errors = [f"{self._primary.name}: {ex}"]
+
+        # Backend chính lỗi -> một backend dự phòng trả lời toàn bộ yêu cầu, không ghi cache
+        for provider in self._fallbacks:
+            try:
+                return provider.table(points, annotations, sources, destinations)
+            except Exception as ex:
+                errors.append(f"{provider.name}: {ex}")
+        raise RuntimeError("All routing providers failed: " + "; ".join(errors))
+
+    def _route_key(self, points: Sequence[Point]) -> str:
+        return ";".join(f"{lat:.{self.precision}f},{lng:.{self.precision}f}" for lat, lng in points)
+
+    def route(self, points):
+        key = self._route_key(points)
+        with self._lock:
+            data = self._lru.get(key)
+            if data is not None:
+                self._lru.move_to_end(key)
+                return data
+            if self._db is not None:
+                row = self._db.execute("SELECT data FROM routes WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    data = json.loads(row[0])
+                    self._remember(key, data)
+                    return data
+
+        data = self.provider.route(points)
+        with self._lock:
+            self._remember(key, data)
+            # Tuyến của backend dự phòng (vd đường thẳng Haversine) không ghi sqlite
+            if self._db is not None and data.get("provider", self._primary.name) == self._primary.name:
+                self._db.execute("INSERT OR REPLACE INTO routes VALUES (?, ?)", (key, json.dumps(data)))
+                self._db.commit()
+        return data
+
+    def _remember(self, key: str, data: Dict[str, Any]) -> None:
+        self._lru[key] = data
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+
+
+_DEFAULT_PROVIDER: Optional[RoutingProvider] = None
+
+
+def default_provider() -> RoutingProvider:
+    """
+    Provider dùng chung cho dataloader, map renderer và script sinh dữ liệu:
+    OSRM (URL lấy từ biến môi trường OSRM_BASE_URL), lỗi -> Haversine, tất cả sau lớp
+    cache data/routing-cache.
+    """
+    global _DEFAULT_PROVIDER
+    if _DEFAULT_PROVIDER is None:
+        _DEFAULT_PROVIDER = CachedProvider(
+            FallbackProvider([
+                OSRMProvider(
+                    base_url=os.environ.get("OSRM_BASE_URL", "https://router.project-osrm.org"),
+                    profile=os.environ.get("OSRM_PROFILE", "driving"),
+                ),
+                HaversineProvider(),
+            ])
+        )
+    return _DEFAULT_PROVIDER
+
+
+def set_default_provider(provider: Optional[RoutingProvider]) -> None:
+    """Thay provider mặc định (None -> tạo lại theo biến môi trường ở lần gọi sau)."""
+    global _DEFAULT_PROVIDER
+    _DEFAULT_PROVIDER = provider
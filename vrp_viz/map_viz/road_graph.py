@@ -0,0 +1,407 @@
+import os
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import shapely
+from shapely import STRtree
+
+from .gen_data import EARTH_RADIUS_KM, _pairwise_block
+
+# adjacency gọn: node -> [(node kề, trọng số nhỏ nhất giữa các cạnh song song), ...]
+Adjacency = Dict[int, List[Tuple[int, float]]]
+
+_WORKER_GRAPH = None
+
+
+def weighted_adjacency(G, weight: str = "length") -> Adjacency:
+    """
+    Chuyển graph NetworkX (Graph/DiGraph/MultiDiGraph) sang adjacency list có trọng số.
+    Với multigraph, giữ cạnh ngắn nhất giữa mỗi cặp node.
+    """
+    multi = G.is_multigraph()
+    adj: Adjacency = {}
+    for u, nbrs in G.adj.items():
+        out = []
+        for v, edata in nbrs.items():
+            if multi:
+                w = min(float(attr.get(weight, 1.0)) for attr in edata.values())
+            else:
+                w = float(edata.get(weight, 1.0))
+            out.append((v, w))
+        adj[u] = out
+    return adj
+
+
+def dijkstra_to_targets(
+    adj: Adjacency, source: int, targets: Sequence[int]
+) -> Tuple[Dict[int, float], Dict[int, int]]:
+    """
+    Dijkstra một nguồn, dừng sớm khi mọi target đã được chốt (settled).
+
+    Returns:
+        (dist, pred): dist[t] cho các target tới được, pred là cây đường đi ngắn nhất
+        (node -> node trước đó) trên phần graph đã duyệt.
+    """
+    remaining = set(targets)
+    dist: Dict[int, float] = {source: 0.0}
+    pred: Dict[int, int] = {}
+    settled = set()
+    heap = [(0.0, source)]
+    while heap and remaining:
+        d, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        settled.add(u)
+        remaining.discard(u)
+        for v, w in adj.get(u, ()):
+            nd = d + w
+            if nd < dist.get(v, np.inf):
+                dist[v] = nd
+                pred[v] = u
+                heapq.heappush(heap, (nd, v))
+    return {t: dist[t] for t in targets if t in settled}, pred
+
+
+def reconstruct_path(pred: Dict[int, int], source: int, target: int) -> List[int]:
+    """Truy vết đường đi source -> target từ cây predecessor (rỗng nếu không tới được)."""
+    if source == target:
+        return [source]
+    if target not in pred:
+        return []
+    path = [target]
+    while path[-1] != source:
+        path.append(pred[path[-1]])
+    path.reverse()
+    return path
+
+
+def _init_worker(graph) -> None:
+    global _WORKER_GRAPH
+    _WORKER_GRAPH = graph
+
+
+def _row_worker(args):
+    source, targets = args
+    if isinstance(_WORKER_GRAPH, CSRGraph):
+        return _WORKER_GRAPH.dijkstra(source, targets)
+    return dijkstra_to_targets(_WORKER_GRAPH, source, targets)
+
+
+def _parallel_rows(graph, sources: Sequence[int], targets: Sequence[int], n_jobs: Optional[int]):
+    """Chạy một Dijkstra cho mỗi source, song song theo process nếu n_jobs > 1."""
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs <= 1 or len(sources) <= 1:
+        _init_worker(graph)
+        return [_row_worker((s, targets)) for s in sources]
+    with ProcessPoolExecutor(
+        max_workers=n_jobs, initializer=_init_worker, initargs=(graph,)
+    ) as pool:
+        chunksize = max(1, len(sources) // (4 * n_jobs))
+        return list(
+            pool.map(_row_worker, [(s, targets) for s in sources], chunksize=chunksize)
+        )
+
+
+def road_distance_matrix(
+    G,
+    node_ids: List[int],
+    weight: str = "length",
+    n_jobs: Optional[int] = None,
+    return_predecessors: bool = False,
+) -> Union[np.ndarray, Tuple[np.ndarray, List[Dict[int, int]]]]:
+    """
+    Ma trận khoảng cách đường bộ giữa các node, mỗi hàng là MỘT lần Dijkstra
+    một nguồn (chỉ tới các node đích, dừng sớm) thay vì n² lần shortest_path_length.
+
+    Args:
+        G: graph NetworkX (vd MultiDiGraph của OSMnx) hoặc CSRGraph.
+        node_ids: node trên graph theo thứ tự điểm (0 = depot); với CSRGraph là chỉ số nội bộ.
+        weight: thuộc tính trọng số cạnh (bỏ qua với CSRGraph).
+        n_jobs: số process song song (None -> os.cpu_count(), 1 -> chạy tuần tự).
+        return_predecessors: True -> trả thêm cây predecessor của từng hàng
+            (dùng reconstruct_path để lấy hình học đường đi mà không cần tìm lại).
+
+    Returns:
+        D (n, n), np.inf nếu không có đường; hoặc (D, predecessors).
+    """
+    graph = G if isinstance(G, CSRGraph) else weighted_adjacency(G, weight)
+    targets = list(dict.fromkeys(node_ids))
+    rows = _parallel_rows(graph, targets, targets, n_jobs)
+    by_source = dict(zip(targets, rows))
+
+    n = len(node_ids)
+    D = np.full((n, n), np.inf, dtype=float)
+    for i, u in enumerate(node_ids):
+        dist_u = by_source[u][0]
+        for j, v in enumerate(node_ids):
+            D[i, j] = dist_u.get(v, np.inf)
+    if return_predecessors:
+        return D, [by_source[u][1] for u in node_ids]
+    return D
+
+
+class NodeSnapper:
+    """
+    Chỉ mục không gian (shapely STRtree) dựng MỘT lần trên các node của graph,
+    snap cả lô điểm bằng một truy vấn query_nearest.
+
+    Toạ độ được chiếu equirectangular quanh tâm dữ liệu (đơn vị m), đủ chính xác
+    trong phạm vi một thành phố.
+    """
+
+    def __init__(self, lat: np.ndarray, lng: np.ndarray):
+        lat = np.asarray(lat, dtype=float)
+        lng = np.asarray(lng, dtype=float)
+        self.lat0 = float(np.mean(lat)) if lat.size else 0.0
+        self.lng0 = float(np.mean(lng)) if lng.size else 0.0
+        self.tree = STRtree(shapely.points(self._project(lat, lng)))
+
+    def _project(self, lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+        k = EARTH_RADIUS_KM * 1000.0 * np.pi / 180.0
+        x = (np.asarray(lng, dtype=float) - self.lng0) * k * np.cos(np.radians(self.lat0))
+        y = (np.asarray(lat, dtype=float) - self.lat0) * k
+        return np.column_stack([x, y])
+
+    def snap(self, points_latlon: Sequence[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            (node_idx, dist_m): chỉ số node gần nhất (theo thứ tự lat/lng truyền vào
+            lúc dựng) và khoảng cách snap (m) của từng điểm.
+        """
+        pts = np.asarray(points_latlon, dtype=float).reshape(-1, 2)
+        query = shapely.points(self._project(pts[:, 0], pts[:, 1]))
+        (src, nodes), dist = self.tree.query_nearest(query, return_distance=True, all_matches=False)
+        node_idx = np.empty(len(pts), dtype=np.int64)
+        dist_m = np.empty(len(pts), dtype=float)
+        node_idx[src] = nodes
+        dist_m[src] = dist
+        return node_idx, dist_m
+
+
+class CSRGraph:
+    """
+    Road graph dạng CSR gọn (mảng NumPy), lưu/đọc bằng .npz để chạy offline.
+
+    Node được đánh chỉ số nội bộ 0..N-1; cạnh ra của node u nằm ở
+    indices[indptr[u]:indptr[u+1]] với độ dài tương ứng trong weights.
+    Hình học chi tiết của cạnh e (nếu có, vd 'geometry' của OSMnx) nằm ở
+    geom_coords[geom_ptr[e]:geom_ptr[e+1]] dưới dạng (lat, lng).
+    """
+
+    def __init__(
+        self,
+        osm_ids: np.ndarray,
+        lat: np.ndarray,
+        lng: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        weights: np.ndarray,
+        geom_ptr: Optional[np.ndarray] = None,
+        geom_coords: Optional[np.ndarray] = None,
+    ):
+        self.osm_ids = np.asarray(osm_ids, dtype=np.int64)
+        self.lat = np.asarray(lat, dtype=float)
+        self.lng = np.asarray(lng, dtype=float)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=float)
+        n_edges = self.indices.shape[0]
+        self.geom_ptr = (
+            np.zeros(n_edges + 1, dtype=np.int64) if geom_ptr is None else np.asarray(geom_ptr, dtype=np.int64)
+        )
+        self.geom_coords = (
+            np.zeros((0, 2), dtype=float) if geom_coords is None else np.asarray(geom_coords, dtype=float)
+        )
+        self._index = {int(o): i for i, o in enumerate(self.osm_ids.tolist())}
+        if len(self._index) != self.osm_ids.shape[0]:
+            raise ValueError("osm_ids must be unique")
+        # danh sách Python cho vòng lặp Dijkstra (truy cập phần tử NumPy từng cái rất chậm)
+        self._indptr_l = self.indptr.tolist()
+        self._indices_l = self.indices.tolist()
+        self._weights_l = self.weights.tolist()
+        self._snapper: Optional[NodeSnapper] = None
+
+    def __getstate__(self):
+        return {
+            k: v for k, v in self.__dict__.items()
+            if not k.endswith("_l") and k not in ("_index", "_snapper")
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def n_nodes(self) -> int:
+        return self.osm_ids.shape[0]
+
+    @classmethod
+    def from_networkx(cls, G, weight: str = "length") -> "CSRGraph":
+        """
+        Chuyển graph NetworkX/OSMnx (node có 'x', 'y') sang CSR, giữ cạnh ngắn nhất giữa mỗi cặp.
+        Node id phải là số nguyên (OSM id); graph khác cần đánh lại nhãn trước, vd
+        nx.convert_node_labels_to_integers(G).
+        """
+        nodes = list(G.nodes)
+        bad = [u for u in nodes if not isinstance(u, (int, np.integer)) or isinstance(u, bool)]
+        if bad:
+            raise ValueError(f"Node ids must be integers (OSM ids), got {bad[:5]!r}")
+        index = {u: i for i, u in enumerate(nodes)}
+        lat = np.array([G.nodes[u]["y"] for u in nodes], dtype=float)
+        lng = np.array([G.nodes[u]["x"] for u in nodes], dtype=float)
+        multi = G.is_multigraph()
+
+        indptr = [0]
+        indices: List[int] = []
+        weights: List[float] = []
+        geom_ptr = [0]
+        geom_coords: List[Tuple[float, float]] = []
+        for u in nodes:
+            for v, edata in sorted(G.adj[u].items(), key=lambda kv: index[kv[0]]):
+                attrs = list(edata.values()) if multi else [edata]
+                best = min(attrs, key=lambda a: float(a.get(weight, 1.0)))
+                indices.append(index[v])
+                weights.append(float(best.get(weight, 1.0)))
+                geom = best.get("geometry")
+                if geom is not None:
+                    # shapely LineString (lng, lat); bỏ 2 đầu mút trùng với toạ độ node
+                    geom_coords.extend((y, x) for x, y in list(geom.coords)[1:-1])
+                geom_ptr.append(len(geom_coords))
+            indptr.append(len(indices))
+
+        return cls(
+            osm_ids=np.array(nodes, dtype=np.int64),
+            lat=lat,
+            lng=lng,
+            indptr=np.array(indptr),
+            indices=np.array(indices),
+            weights=np.array(weights),
+            geom_ptr=np.array(geom_ptr),
+            geom_coords=np.array(geom_coords, dtype=float).reshape(-1, 2),
+        )
+
+    def save(self, path: str) -> None:
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        np.savez_compressed(
+            path,
+            osm_ids=self.osm_ids,
+            lat=self.lat,
+            lng=self.lng,
+            indptr=self.indptr,
+            indices=self.indices,
+            weights=self.weights,
+            geom_ptr=self.geom_ptr,
+            geom_coords=self.geom_coords,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "CSRGraph":
+        with np.load(path) as data:
+            return cls(**{k: data[k] for k in data.files})
+
+    def node_index(self, osm_id: int) -> int:
+        """OSM node id -> chỉ số nội bộ."""
+        return self._index[int(osm_id)]
+
+    def snap(self, points_latlon: Sequence[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Snap cả lô điểm (lat, lng) về node gần nhất: (chỉ số nội bộ, khoảng cách m)."""
+        if self._snapper is None:
+            self._snapper = NodeSnapper(self.lat, self.lng)
+        return self._snapper.snap(points_latlon)
+
+    def dijkstra(
+        self, source: int, targets: Optional[Sequence[int]] = None
+    ) -> Tuple[Dict[int, float], Dict[int, int]]:
+        """
+        Dijkstra trên mảng CSR từ chỉ số nội bộ source, dừng sớm khi mọi target đã chốt.
+        Cùng đầu ra với dijkstra_to_targets: (dist theo target, pred node -> node trước).
+        """
+        indptr, indices, weights = self._indptr_l, self._indices_l, self._weights_l
+        remaining = set(targets) if targets is not None else None
+        dist: Dict[int, float] = {source: 0.0}
+        pred: Dict[int, int] = {}
+        settled = set()
+        heap = [(0.0, source)]
+        while heap and (remaining is None or remaining):
+            d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            if remaining is not None:
+                remaining.discard(u)
+            for e in range(indptr[u], indptr[u + 1]):
+                v = indices[e]
+                nd = d + weights[e]
+                if nd < dist.get(v, np.inf):
+                    dist[v] = nd
+                    pred[v] = u
+                    heapq.heappush(heap, (nd, v))
+        keys = targets if targets is not None else settled
+        return {t: dist[t] for t in keys if t in settled}, pred
+
+    def astar(self, source: int, target: int) -> Tuple[float, List[int]]:
+        """
+        A* từ source tới target (chỉ số nội bộ), heuristic = khoảng cách Haversine (m).
+        Trả về (độ dài, danh sách node); (inf, []) nếu không có đường.
+        """
+        h = _pairwise_block(
+            self.lat, self.lng, self.lat[target : target + 1], self.lng[target : target + 1], "haversine"
+        )[:, 0] * 1000.0
+        # chặn heuristic để luôn admissible khi 'length' làm tròn nhỏ hơn khoảng cách chim bay
+        h *= 0.999
+        indptr, indices, weights = self._indptr_l, self._indices_l, self._weights_l
+        dist: Dict[int, float] = {source: 0.0}
+        pred: Dict[int, int] = {}
+        closed = set()
+        heap = [(float(h[source]), source)]
+        while heap:
+            _, u = heapq.heappop(heap)
+            if u == target:
+                return dist[u], reconstruct_path(pred, source, target)
+            if u in closed:
+                continue
+            closed.add(u)
+            d = dist[u]
+            for e in range(indptr[u], indptr[u + 1]):
+                v = indices[e]
+                nd = d + weights[e]
+                if nd < dist.get(v, np.inf):
+                    dist[v] = nd
+                    pred[v] = u
+                    heapq.heappush(heap, (nd + float(h[v]), v))
+        return np.inf, []
+
+    def edge_id(self, u: int, v: int) -> int:
+        """Chỉ số cạnh u -> v trong mảng CSR (-1 nếu không có)."""
+        start, stop = self._indptr_l[u], self._indptr_l[u + 1]
+        pos = start + int(np.searchsorted(self.indices[start:stop], v))
+        if pos < stop and self._indices_l[pos] == v:
+            return pos
+        return -1
+
+    def path_coords(self, path: Sequence[int]) -> List[Tuple[float, float]]:
+        """Hình học (lat, lng) của một đường đi theo node, gồm cả điểm trung gian của cạnh."""
+        coords: List[Tuple[float, float]] = []
+        for a, b in zip(path[:-1], path[1:]):
+            coords.append((float(self.lat[a]), float(self.lng[a])))
+            e = self.edge_id(a, b)
+            if e >= 0:
+                coords.extend(map(tuple, self.geom_coords[self.geom_ptr[e] : self.geom_ptr[e + 1]].tolist()))
+        if path:
+            coords.append((float(self.lat[path[-1]]), float(self.lng[path[-1]])))
+        return coords
+
+    def distance_matrix(
+        self,
+        node_idx: List[int],
+        n_jobs: Optional[int] = 1,
+        return_predecessors: bool = False,
+    ) -> Union[np.ndarray, Tuple[np.ndarray, List[Dict[int, int]]]]:
+        """Ma trận khoảng cách giữa các node (chỉ số nội bộ), xem road_distance_matrix."""
+        return road_distance_matrix(
+            self, node_idx, n_jobs=n_jobs, return_predecessors=return_predecessors
+        )
@@ -3,7 +3,6 @@ import pandas as pd
 import numpy as np
 
 import time
-import requests
 import folium
 from folium.plugins import (
     MiniMap,
@@ -16,8 +15,7 @@ from folium.plugins import (
 )
 from branca.element import MacroElement, Template
 
-BASE_URL = "https://router.project-osrm.org"
-PROFILE = "driving"
+from .providers import default_provider
 
 _VEHICLE_COLORS = [
     "#1f77b4",
@@ -63,22 +61,20 @@ def _html_overlay_box(title: str, html_body: str) -> MacroElement:
     return el
 
 
-def get_route_from_api(coords, names: List[str]):
-    route_url = f"{BASE_URL}/route/v1/{PROFILE}/{coords}?overview=full&geometries=geojson&steps=false"
+def get_route_from_api(coords, names: List[str], provider=None):
+    """
+    Lấy hình học tuyến giữa các điểm 'lon,lat;lon,lat;...' -> (geometry GeoJSON, dict kiểu OSRM).
+    Mặc định qua default_provider() (OSRM sau lớp cache), lỗi -> (None, None).
+    """
+    if provider is None:
+        provider = default_provider()
+    points = [(float(lat), float(lng)) for lng, lat in (c.split(",") for c in coords.split(";"))]
     try:
-        r = requests.get(
-            route_url, headers={"User-Agent": "VRP-MapDemo/1.0"}, timeout=20
-        )
-        if r.status_code == 200:
-            data = r.json()
-            if data.get("code") == "Ok" and data.get("routes"):
-                geo = data["routes"][0]["geometry"]
-                if geo and geo.get("type") == "LineString":
-                    return geo, data
-            else:
-                print(f"Route API không trả Ok cho {names[1]}")
-        else:
-            print(f"HTTP {r.status_code} khi gọi route {names[1]}")
+        data = provider.route(points)
+        geo = data["routes"][0]["geometry"]
+        if geo and geo.get("type") == "LineString":
+            return geo, data
+        print(f"Route API không trả LineString cho {names[1]}")
     except Exception as ex:
         print("Lỗi route:", ex)
     return None, None
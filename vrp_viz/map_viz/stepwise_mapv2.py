@@ -47,6 +47,14 @@ def _veh_color(veh_id: int) -> str:
     return _VEHICLE_COLORS[veh_id % len(_VEHICLE_COLORS)]
 
 
+def _cached_route(cache_location: dict, key_name: str, key_loc: str, names: List[str]):
+    """(geom, data_map) từ cache JSON theo "u:v"; thiếu thì hỏi routing provider (có cache)."""
+    entry = cache_location.get(key_name) if cache_location else None
+    if entry and entry[0]:
+        return entry[0], entry[1]
+    return get_route_from_api(key_loc, names)
+
+
 def _html_overlay_box_bottom_right(title: str, html_body: str) -> MacroElement:
     """Hộp mô tả có nút Hide/Show ở góc phải-dưới, tránh đè LayerControl."""
     tmpl = Template(
@@ -317,9 +325,7 @@ def make_stepwise_map(
             name_u, name_v = names[u], names[v]
             key_name = f"{u}:{v}"
             key_loc = f"{points_latlon[u][1]},{points_latlon[u][0]};{points_latlon[v][1]},{points_latlon[v][0]}"
-            geom, data_map = cache_location.get(
-                key_name
-            )
+            geom, data_map = _cached_route(cache_location, key_name, key_loc, [name_u, name_v])
             
             if geom is None:
                 print(f"Không lấy được route {name_u} -> {name_v}")
@@ -375,9 +381,7 @@ def make_stepwise_map(
         name_u, name_v = names[u], names[v]
         key_name = f"{u}:{v}"
         key_loc = f"{points_latlon[u][1]},{points_latlon[u][0]};{points_latlon[v][1]},{points_latlon[v][0]}"
-        geom, data_map = cache_location.get(
-            key_name,
-        )
+        geom, data_map = _cached_route(cache_location, key_name, key_loc, [name_u, name_v])
         if geom is None:
             print(f"Không lấy được step {name_u} -> {name_v}")
             continue
@@ -562,9 +566,7 @@ def make_stepwise_map_vrps(
                 name_u, name_v = names[u], names[v]
                 key_name = f"{u}:{v}"
                 key_loc = f"{points_latlon[u][1]},{points_latlon[u][0]};{points_latlon[v][1]},{points_latlon[v][0]}"
-                geom, _ = cache_location.get(
-                    key_name,
-                )
+                geom, _ = _cached_route(cache_location, key_name, key_loc, [name_u, name_v])
                 if not geom:
                     continue
                 line_coords = [[xy[1], xy[0]] for xy in geom["coordinates"]]
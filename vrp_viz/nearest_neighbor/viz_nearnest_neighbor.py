@@ -1,4 +1,5 @@
-from ..map_viz.stepwise_map import VRPResult
+from ..history import SnapshotHistory
+from ..neighbors import NeighborIndex
 
 import copy
 import numpy as np
@@ -12,60 +13,65 @@ def nearest_neighbor_v2(
     max_stops_per_route: Optional[int] = None,
     num_vehicles: int = 1,
     depot_idx: int = 0,
-) -> List[VRPResult]:
+    stepwise: bool = True,
+    neighbors: Optional[NeighborIndex] = None,
+) -> SnapshotHistory:
     """
-    Trả về: List[VRPResult], mỗi VRPResult ứng với 1 step (một cung 'from' -> 'to' được thêm).
+    Trả về: SnapshotHistory (dùng như List[VRPResult]), mỗi VRPResult ứng với 1 step
+    (một cung 'from' -> 'to' được thêm), chỉ được dựng khi truy cập.
     Tại mỗi step, routes trong snapshot gồm:
       - Tất cả các tuyến đã chốt (đã kết thúc ở depot)
       - Cộng thêm tuyến hiện tại đang đi dở (nếu có), để bạn vẽ được trạng thái tức thời.
+    stepwise=False -> chỉ trả về 1 VRPResult cuối cùng (dùng khi benchmark / không cần vẽ).
+
+    Khách kế tiếp được chọn bằng argmin trên D[current] đã che (mask chưa phục vụ,
+    capacity, cạnh hữu hạn); hoà thì lấy chỉ số nhỏ nhất. Có neighbors thì xét danh sách
+    láng giềng của current trước, chỉ quét toàn bộ khi không có láng giềng khả thi.
     """
 
+    D = np.asarray(D)
     n = int(D.shape[0])
     assert D.shape[0] == D.shape[1], "D must be square"
     if demands is None:
         demands = [0.0] * n
     else:
         assert len(demands) == n, "demands length must match D"
+    demand_arr = np.asarray(demands, dtype=float)
 
     # Các node chưa phục vụ (bỏ depot)
-    unserved = set(range(n))
-    unserved.discard(depot_idx)
+    unserved = np.ones(n, dtype=bool)
+    unserved[depot_idx] = False
+    n_unserved = n - 1
 
     # Tuyến đã chốt
     routes: List[List[int]] = []
     lengths: List[float] = []
+
+    # Lịch sử stepwise dạng delta; tuyến có id = vị trí của nó trong routes khi chốt
+    history = SnapshotHistory()
     # Toàn bộ steps đã diễn ra (cộng dồn)
-    steps: List[dict] = []
+    steps: List[dict] = history.steps
 
-    # Danh sách kết quả stepwise
-    results: List[VRPResult] = []
+    def record_edge(rid: int, route: List[int], route_len: float):
+        """Ghi cạnh vừa thêm vào cuối tuyến rid (cạnh đầu tiên thì mở tuyến)."""
+        if len(route) == 2:
+            history.set_route(rid, route, route_len)
+        else:
+            history.append_node(rid, route[-1], route_len)
 
-    def snapshot(partial_route: Optional[List[int]], partial_len: float, vehicle_idx_for_partial: Optional[int]):
+    def snapshot():
         """
-        Lấy ảnh chụp trạng thái hiện tại:
-          - routes_chot: bản sao các tuyến đã chốt
-          - nếu đang có tuyến dở (partial_route != None), thêm vào cuối danh sách như một tuyến tạm
+        Ảnh chụp trạng thái hiện tại: các tuyến đã chốt, cộng tuyến đang đi dở (nếu có) ở cuối.
         """
-        routes_chot = copy.deepcopy(routes)
-        lengths_chot = copy.deepcopy(lengths)
-
-        if partial_route is not None and len(partial_route) >= 1:
-            routes_chot.append(copy.deepcopy(partial_route))
-            lengths_chot.append(float(partial_len))
-
-        results.append(
-            VRPResult(
-                routes=routes_chot,
-                route_lengths=lengths_chot,
-                steps=copy.deepcopy(steps),
-            )
-        )
+        if stepwise:
+            history.snapshot()
 
     for k in range(num_vehicles):
-        if not unserved:
+        if not n_unserved:
             break
 
         # Khởi tạo tuyến mới cho xe k (chưa chốt vào routes cho tới khi kết thúc)
+        rid = len(routes)
         route = [depot_idx]
         load = 0.0
         used_stops = 0
@@ -74,53 +80,63 @@ def nearest_neighbor_v2(
 
         while True:
             # Ứng viên hợp lệ theo capacity/max_stops + cạnh hữu hạn
-            candidates = []
-            for j in unserved:
-                cap_ok = True
-                if vehicle_capacity is not None:
-                    cap_ok = (load + float(demands[j])) <= vehicle_capacity
-                stops_ok = True
-                if max_stops_per_route is not None:
-                    stops_ok = (used_stops + 1) <= max_stops_per_route
-                if cap_ok and stops_ok and np.isfinite(D[current, j]):
-                    candidates.append(j)
-
-            if not candidates:
+            row = D[current]
+            j_star = -1
+            if max_stops_per_route is None or used_stops + 1 <= max_stops_per_route:
+                if neighbors is not None:
+                    # láng giềng đã sắp theo khoảng cách -> ứng viên khả thi đầu tiên là gần nhất
+                    for j in neighbors[current]:
+                        if unserved[j] and np.isfinite(row[j]) and (
+                            vehicle_capacity is None or load + demand_arr[j] <= vehicle_capacity
+                        ):
+                            j_star = j
+                            break
+                if j_star < 0:
+                    candidates = unserved & np.isfinite(row)
+                    if vehicle_capacity is not None:
+                        candidates &= (load + demand_arr) <= vehicle_capacity
+                    if candidates.any():
+                        j_star = int(np.argmin(np.where(candidates, row, np.inf)))
+
+            if j_star < 0:
                 # Không còn điểm hợp lệ: nếu đang ở khách thì quay về depot
                 if route[-1] != depot_idx and np.isfinite(D[current, depot_idx]):
                     route.append(depot_idx)
                     route_len += float(D[current, depot_idx])
+                    record_edge(rid, route, route_len)
                     steps.append({"vehicle": k, "from": current, "to": depot_idx})
                     # Snapshot sau khi thêm cạnh quay về depot
-                    snapshot(partial_route=route, partial_len=route_len, vehicle_idx_for_partial=k)
+                    snapshot()
                 # Kết thúc tuyến này -> chốt vào routes
                 if len(route) > 1:
                     routes.append(copy.deepcopy(route))
                     lengths.append(float(route_len))
                 break
 
-            # Chọn khách gần nhất
-            j_star = min(candidates, key=lambda j: D[current, j])
+            # Đi tới khách gần nhất
             route.append(j_star)
             route_len += float(D[current, j_star])
+            record_edge(rid, route, route_len)
             steps.append({"vehicle": k, "from": current, "to": j_star})
             # Snapshot ngay sau khi đi tới j_star
-            snapshot(partial_route=route, partial_len=route_len, vehicle_idx_for_partial=k)
+            snapshot()
 
             # Cập nhật
             load += float(demands[j_star])
             used_stops += 1
             current = j_star
-            unserved.remove(j_star)
+            unserved[j_star] = False
+            n_unserved -= 1
 
             # Nếu đã phục vụ hết thì đóng tuyến về depot
-            if not unserved:
+            if not n_unserved:
                 if route[-1] != depot_idx and np.isfinite(D[current, depot_idx]):
                     route.append(depot_idx)
                     route_len += float(D[current, depot_idx])
+                    record_edge(rid, route, route_len)
                     steps.append({"vehicle": k, "from": current, "to": depot_idx})
                     # Snapshot sau khi quay về depot để hoàn tất
-                    snapshot(partial_route=route, partial_len=route_len, vehicle_idx_for_partial=k)
+                    snapshot()
                 # Chốt tuyến
                 if len(route) > 1:
                     routes.append(copy.deepcopy(route))
@@ -130,7 +146,7 @@ def nearest_neighbor_v2(
         # (Không snapshot thêm ở đây, vì đã snapshot trong vòng while tại những điểm có cạnh mới.)
 
     # Nếu vẫn còn khách và đã hết xe → nhét vào tuyến cuối (bỏ qua capacity/max_stops)
-    if unserved and routes:
+    if n_unserved and routes:
         last_idx = len(routes) - 1
         last = routes[last_idx]
         last_len = lengths[last_idx]
@@ -145,16 +161,18 @@ def nearest_neighbor_v2(
         if last[-1] != depot_idx and np.isfinite(D[current, depot_idx]):
             last.append(depot_idx)
             last_len += float(D[current, depot_idx])
+            # lengths[last_idx] chỉ cập nhật ở lần chèn kế tiếp
+            history.append_node(last_idx, depot_idx, lengths[last_idx])
             steps.append({"vehicle": last_idx, "from": current, "to": depot_idx})
             # Snapshot sau khi ép quay về depot để dễ chèn khách vào trước depot
-            snapshot(partial_route=None, partial_len=0.0, vehicle_idx_for_partial=None)
+            snapshot()
             current = depot_idx  # điểm tham chiếu sẽ cập nhật lại ngay sau đây
 
         # Chèn từng khách còn lại trước vị trí depot cuối
         # current ở đây sẽ là node cuối trước depot trong quá trình chèn dần
         current = last[-2] if len(last) >= 2 else depot_idx
 
-        for j in list(unserved):
+        for j in np.flatnonzero(unserved).tolist():
             if np.isfinite(D[current, j]) and np.isfinite(D[j, depot_idx]):
                 # vị trí chèn trước depot
                 insert_pos = len(last) - 1  # trước phần tử depot cuối
@@ -165,11 +183,13 @@ def nearest_neighbor_v2(
                 steps.append({"vehicle": last_idx, "from": current, "to": j})
                 last.insert(insert_pos, j)
                 current = j
-                unserved.remove(j)
+                unserved[j] = False
+                n_unserved -= 1
                 # Cập nhật chiều dài tuyến trong mảng lengths
                 lengths[last_idx] = last_len
+                history.insert_node(last_idx, insert_pos, j, last_len)
                 # Snapshot sau mỗi lần chèn 1 khách (coi là một step di chuyển current->j)
-                snapshot(partial_route=None, partial_len=0.0, vehicle_idx_for_partial=None)
+                snapshot()
 
         # Bảo đảm kết thúc ở depot (trường hợp chưa có)
         if last[-1] != depot_idx and np.isfinite(D[last[-1], depot_idx]):
@@ -177,8 +197,12 @@ def nearest_neighbor_v2(
             last_len += float(D[last[-1], depot_idx])
             last.append(depot_idx)
             lengths[last_idx] = last_len
+            history.append_node(last_idx, depot_idx, last_len)
             # Snapshot kết thúc tuyến
-            snapshot(partial_route=None, partial_len=0.0, vehicle_idx_for_partial=None)
+            snapshot()
+
+    if not stepwise and steps:
+        history.snapshot()
 
     # Nếu không có step nào (ví dụ không có cạnh hợp lệ), vẫn trả về rỗng
-    return results
+    return history
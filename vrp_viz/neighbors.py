@@ -0,0 +1,139 @@
+import os
+import hashlib
+from typing import List, Optional
+
+import numpy as np
+
+
+def _fingerprint(D: np.ndarray) -> str:
+    D = np.ascontiguousarray(D)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((D.shape, D.dtype.str)).encode())
+    h.update(D.tobytes())
+    return h.hexdigest()
+
+
+class NeighborIndex:
+    """
+    Danh sách k láng giềng gần nhất của mỗi node (granular candidate set), theo D[i, :].
+
+    lists[i] gồm k chỉ số j != i, sắp theo D[i, j] tăng dần (hoà -> chỉ số nhỏ hơn);
+    cạnh không hữu hạn xếp cuối. Dùng chung cho NN, cheapest insertion và local search:
+    chỉ xét ứng viên trong danh sách, quét toàn bộ khi không có ứng viên khả thi.
+    """
+
+    def __init__(self, lists: np.ndarray, fingerprint: Optional[str] = None):
+        self.lists = np.asarray(lists, dtype=np.int64)
+        self.fingerprint = fingerprint
+        self._lists_l: List[List[int]] = self.lists.tolist()
+        self._sets = None
+
+    @property
+    def k(self) -> int:
+        return int(self.lists.shape[1])
+
+    @classmethod
+    def build(cls, D: np.ndarray, k: int = 20, block_size: int = 1024) -> "NeighborIndex":
+        """Top-k mỗi hàng bằng argpartition theo khối hàng (bộ nhớ ~ block_size x n)."""
+        D = np.asarray(D)
+        lists = cls.from_rows(lambda start, stop: D[start:stop], D.shape[0], k, block_size).lists
+        return cls(lists, _fingerprint(D))
+
+    @classmethod
+    def from_coordinates(
+        cls,
+        lats: np.ndarray,
+        lngs: np.ndarray,
+        k: int = 20,
+        method: str = "haversine",
+        block_size: int = 256,
+    ) -> "NeighborIndex":
+        """
+        Top-k theo khoảng cách toạ độ (xem coordinate_distance_matrix), tính từng khối hàng
+        nên không cần ma trận n x n (bộ nhớ ~ block_size x n). Với haversine, thứ tự được tính
+        qua tích vô hướng của vector đơn vị (khoảng cách cung tăng khi cos giảm) bằng phép
+        nhân ma trận thay vì lượng giác cho từng cặp.
+        """
+        from .map_viz.gen_data import _pairwise_block
+
+        lats = np.asarray(lats, dtype=float).ravel()
+        lngs = np.asarray(lngs, dtype=float).ravel()
+        if method == "haversine":
+            phi, lam = np.radians(lats), np.radians(lngs)
+            xyz = np.stack([np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)], axis=1)
+
+            def row_block(start, stop):
+                return -(xyz[start:stop] @ xyz.T)
+
+        else:
+
+            def row_block(start, stop):
+                return _pairwise_block(lats[start:stop], lngs[start:stop], lats, lngs, method)
+
+        return cls.from_rows(row_block, len(lats), k, block_size)
+
+    @classmethod
+    def from_rows(cls, row_block, n: int, k: int = 20, block_size: int = 1024) -> "NeighborIndex":
+        """
+        Top-k từ hàm row_block(start, stop) -> khoảng cách (stop - start, n) của các hàng đó
+        tới mọi node (vd. hàng của ma trận memmap, hoặc tính từ toạ độ).
+        """
+        k = max(0, min(k, n - 1))
+        lists = np.empty((n, k), dtype=np.int64)
+        for start in range(0, n, block_size):
+            block = np.array(row_block(start, min(start + block_size, n)), dtype=float)
+            block[~np.isfinite(block)] = np.inf
+            rows = np.arange(start, start + len(block))
+            block[rows - start, rows] = np.inf  # bỏ chính nó
+            if k < n - 1:
+                part = np.sort(np.argpartition(block, k - 1, axis=1)[:, :k], axis=1)
+            else:
+                part = np.tile(np.arange(n), (len(block), 1))
+                part = part[part != rows[:, None]].reshape(len(block), n - 1)
+            vals = np.take_along_axis(block, part, axis=1)
+            order = np.argsort(vals, axis=1, kind="stable")
+            lists[start : start + len(block)] = np.take_along_axis(part, order, axis=1)
+        return cls(lists)
+
+    def __getitem__(self, i: int) -> List[int]:
+        return self._lists_l[i]
+
+    def __len__(self) -> int:
+        return len(self._lists_l)
+
+    def contains(self, i: int, j: int) -> bool:
+        """j có trong danh sách láng giềng của i không."""
+        if self._sets is None:
+            self._sets = [set(row) for row in self._lists_l]
+        return j in self._sets[i]
+
+    def matches(self, D: np.ndarray) -> bool:
+        return self.fingerprint is not None and self.fingerprint == _fingerprint(D)
+
+    def save(self, path: str) -> None:
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        np.savez_compressed(path, lists=self.lists, fingerprint=np.array(self.fingerprint or ""))
+
+    @classmethod
+    def load(cls, path: str) -> "NeighborIndex":
+        with np.load(path) as data:
+            return cls(data["lists"], str(data["fingerprint"]) or None)
+
+
+def load_or_build_neighbor_index(
+    D: np.ndarray, k: int = 20, cache_file: Optional[str] = None
+) -> NeighborIndex:
+    """
+    Đọc NeighborIndex từ cache_file nếu khớp với D (cùng fingerprint và k),
+    ngược lại dựng mới và ghi lại.
+    """
+    if cache_file is not None and os.path.exists(cache_file):
+        index = NeighborIndex.load(cache_file)
+        if index.k == min(k, D.shape[0] - 1) and index.matches(D):
+            return index
+    index = NeighborIndex.build(D, k)
+    if cache_file is not None:
+        index.save(cache_file)
+    return index